@@ -0,0 +1,125 @@
+import json
+import base64
+import bisect
+
+# Column names accepted as filters / sort keys by the admin list APIs
+VISITOR_COLUMNS = {
+    'date': 0, 'in_time': 1, 'mobile': 2, 'name': 3, 'designation': 4,
+    'company': 5, 'laptop': 6, 'to_meet': 7, 'department': 8, 'photo': 9,
+    'out_time': 10, 'security': 11, 'vehicle': 12, 'pass_id': 13
+}
+BOOKING_COLUMNS = {
+    'booked_at': 0, 'booked_by': 1, 'host': 2, 'department': 3, 'mobile': 4,
+    'name': 5, 'purpose': 6, 'status': 7, 'company': 8, 'vehicle': 9
+}
+
+# Rows are appended in time order, so these sort by sheet position
+# (string order would put '02-01-2024' after '01-12-2025')
+CHRONOLOGICAL_SORTS = {'date', 'in_time', 'booked_at'}
+
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(key, row_number):
+    raw = json.dumps([key, row_number]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor: return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, row_number = json.loads(raw)
+        return key, int(row_number)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+class RowQuery:
+    """
+    Cursor-paginated, filtered, sorted view over a SheetCache.
+
+    candidates narrows the scan up front (e.g. rows from a DateIndex range or
+    the open-visit set); column filters are case-insensitive substring
+    matches. Sorting by sheet order is the default and pages in O(page size)
+    when there are no column filters. Sorting by a column is keyset-paginated
+    on (value, row) so pages stay stable while new rows arrive.
+    """
+
+    def __init__(self, cache, columns):
+        self.cache = cache
+        self.columns = columns
+
+    def page(self, candidates=None, filters=None, sort=None, descending=True, cursor=None, limit=50):
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        filters = {self.columns[k]: str(v).lower() for k, v in (filters or {}).items() if k in self.columns and v}
+        if sort in CHRONOLOGICAL_SORTS: sort = None
+        if sort is not None and sort not in self.columns:
+            raise ValueError(f"Unknown sort column '{sort}'")
+        after = decode_cursor(cursor)
+
+        with self.cache.lock:
+            self.cache.ensure_loaded()
+            if candidates is None:
+                candidates = range(2, self.cache.row_count() + 1)
+
+            def row_at(n):
+                return self.cache.get_row(n)
+
+            def matches(row):
+                for col, needle in filters.items():
+                    if col >= len(row) or needle not in row[col].lower(): return False
+                return True
+
+            if sort is None:
+                return self._page_by_row(candidates, row_at, matches, bool(filters), descending, after, limit)
+            return self._page_by_column(candidates, row_at, matches, self.columns[sort], descending, after, limit)
+
+    def _page_by_row(self, candidates, row_at, matches, filtered, descending, after, limit):
+        ordered = list(candidates)
+        total = None if filtered else len(ordered)
+        if descending: ordered.reverse()
+
+        start = 0
+        if after:
+            last = after[1]
+            # candidates are ascending row numbers, so we can binary search the cursor
+            asc = ordered[::-1] if descending else ordered
+            pos = bisect.bisect_left(asc, last) if descending else bisect.bisect_right(asc, last)
+            start = len(asc) - pos if descending else pos
+
+        rows, next_cursor = [], None
+        for i in range(start, len(ordered)):
+            n = ordered[i]
+            row = row_at(n)
+            if not matches(row): continue
+            if len(rows) == limit:
+                next_cursor = encode_cursor(None, rows[-1][0])
+                break
+            rows.append((n, row))
+
+        if total is None:
+            total = sum(1 for n in ordered if matches(row_at(n)))
+        return {'rows': rows, 'next_cursor': next_cursor, 'total': total}
+
+    def _page_by_column(self, candidates, row_at, matches, col, descending, after, limit):
+        keyed = []
+        for n in candidates:
+            row = row_at(n)
+            if matches(row):
+                keyed.append(((row[col] if col < len(row) else "").lower(), n, row))
+        keyed.sort(key=lambda k: (k[0], k[1]), reverse=descending)
+
+        start = 0
+        if after:
+            mark = (after[0], after[1])
+            keys = [(k[0], k[1]) for k in keyed]
+            if descending:
+                # keys are in descending order; find first key strictly below the cursor
+                start = next((i for i, k in enumerate(keys) if k < mark), len(keys))
+            else:
+                start = bisect.bisect_right(keys, mark)
+
+        chunk = keyed[start:start + limit]
+        next_cursor = encode_cursor(chunk[-1][0], chunk[-1][1]) if start + limit < len(keyed) else None
+        return {'rows': [(n, row) for _, n, row in chunk], 'next_cursor': next_cursor, 'total': len(keyed)}
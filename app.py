@@ -3,26 +3,63 @@ import os
 import re
 import json
 import base64
+import time
 import pytz
-import csv
+import threading
+import itertools
 from datetime import datetime
 from dotenv import load_dotenv
-from io import StringIO
-from flask import Flask, render_template, request, jsonify, session, redirect, Response
-import gspread
-from google.oauth2.credentials import Credentials 
-from drive_manager import upload_photo_to_drive 
+from flask import Flask, render_template, request, jsonify, session, redirect, Response, stream_with_context
+from drive_manager import upload_photo_to_drive, download_photo_from_drive, drive_file_id
+from sheet_cache import SheetCache, load_together
+from write_coordinator import WriteCoordinator
+from booking_import import parse_records, validate, InvalidUpload
+from storage import SheetsStorage, SQLiteStorage, MirroredTable, TABLE_NAMES, KEY_COLUMNS, IDENTITY_COLUMNS
+from sheet_index import MobileIndex, KeyIndex, StatusIndex, DateIndex, OpenVisitIndex, MaxValueIndex
+from pass_id_allocator import PassIdAllocator, SheetPassIds
+from event_stream import EventBroker, parse_event_id, parse_timeout
+from admin_query import RowQuery, VISITOR_COLUMNS, BOOKING_COLUMNS
+from report_export import export_stream, available_formats
+from daily_stats import VisitStats
+from visitor_search import VisitorSearch
+from visit_archive import VisitArchive, ArchiveJob, ARCHIVE_AFTER_DAYS
+from upload_queue import UploadQueue, is_pending_photo
+from image_processor import process_photo, make_thumbnail, photo_stats, ThumbnailStore
+from sheets_client import sheets_client, ResilientWorksheet
+from worker_sync import WorkerCoordinator
+from fanout import fan_out
+from instrumentation import metrics, profiler, InstrumentedWorksheet, init_app as init_instrumentation
 
 # Load env vars before anything else
 load_dotenv() 
 
 app = Flask(__name__)
+init_instrumentation(app)  # per-route timings, Server-Timing header, sampling profiler
 
 # [SECURE] Load Configuration
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "fallback_dev_key")
 SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
 DRIVE_FOLDER_ID = os.getenv("GOOGLE_DRIVE_FOLDER_ID")
 SHEET_NAME = "SRIT_Visitor_Database"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # bearer token for scraping /metrics without a session
+
+# Longest a /api/events/poll request waits for an event. Serverless functions
+# are cut off sooner, so Vercel gets a short one.
+EVENT_POLL_TIMEOUT = float(os.getenv("EVENT_POLL_TIMEOUT", "8" if os.getenv("VERCEL") else "25"))
+
+# Local state (write journal, etc.). Use /tmp on read-only hosts.
+DATA_DIR = os.getenv("GATEPASS_DATA_DIR", "/tmp/gatepass" if os.getenv("VERCEL") else "data")
+
+# 'sheets' reads/writes the Google Sheet directly; 'sqlite' serves everything
+# from a local database and mirrors writes to the Sheet in the background.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sheets").lower()
+
+# Set by gunicorn.conf.py when several worker processes serve the app. They
+# keep each other's caches coherent through the shared SQLite database.
+SHARED_WORKERS = os.getenv("GATEPASS_SHARED") == "1"
+if SHARED_WORKERS and STORAGE_BACKEND != 'sqlite':
+    print("⚠️ Multiple workers share state through SQLite; using STORAGE_BACKEND=sqlite")
+    STORAGE_BACKEND = 'sqlite'
 
 # NEW: Define IST Timezone
 IST = pytz.timezone('Asia/Kolkata')
@@ -45,36 +82,180 @@ ws_users = None
 ws_visitors = None
 ws_bookings = None
 
+# Sheet writes from all requests are journalled and sent upstream in batches
+# (in sqlite mode this is the background mirror to the Sheet)
+sheet_writer = WriteCoordinator(os.path.join(DATA_DIR, "write_journal.jsonl"), defer_journal=SHARED_WORKERS)
+
+# Last downloaded rows are kept on disk so a fresh process can answer at once
+# while the real download runs (Google Sheets backend only).
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots") if STORAGE_BACKEND == 'sheets' and os.getenv("SHEET_SNAPSHOTS", "1") == "1" else None
+
+def snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.json.gz") if SNAPSHOT_DIR else None
+
+# Shared in-memory copies of the big sheets (write-behind, TTL refreshed)
+visitors_cache = SheetCache("Visitors", snapshot_path=snapshot_path("Visitors"),
+                            key_col=KEY_COLUMNS["Visitors"], identity_cols=IDENTITY_COLUMNS["Visitors"])
+bookings_cache = SheetCache("Bookings", snapshot_path=snapshot_path("Bookings"), identity_cols=IDENTITY_COLUMNS["Bookings"])
+
+# Email -> role directory for login. Users rarely change, so it is trusted longer.
+users_cache = SheetCache("Users", ttl=float(os.getenv("USER_DIRECTORY_TTL", "300")), snapshot_path=snapshot_path("Users"),
+                         key_col=KEY_COLUMNS["Users"], identity_cols=IDENTITY_COLUMNS["Users"])
+user_emails = users_cache.add_index(KeyIndex(col=0))
+
+# Closed visits moved out of the Visitors sheet (see archive_job below)
+visit_archive = VisitArchive(os.path.join(DATA_DIR, "archive"))
+
+# Secondary indexes, kept in step with every cached write
+visitor_mobiles = visitors_cache.add_index(MobileIndex(col=2))
+visitor_dates = visitors_cache.add_index(DateIndex(col=0))
+open_visits = visitors_cache.add_index(OpenVisitIndex(col=10))
+max_pass_id = visitors_cache.add_index(MaxValueIndex(col=13))
+visitor_pass_ids = visitors_cache.add_index(KeyIndex(col=13))
+visit_stats = visitors_cache.add_index(VisitStats(archive=visit_archive))
+visitor_search = visitors_cache.add_index(VisitorSearch(mobile_col=2, name_col=3, company_col=5, vehicle_col=12))
+booking_mobiles = bookings_cache.add_index(MobileIndex(col=4))
+booking_status = bookings_cache.add_index(StatusIndex(col=7))
+
+# Drive uploads run in the background so check-in never waits on Drive. Photos
+# are spooled to disk first, so ones taken during an outage are uploaded later.
+# Each worker process spools into its own directory.
+SPOOL_ROOT = os.path.join(DATA_DIR, "photo_spool")
+upload_queue = UploadQueue(upload_photo_to_drive, spool_dir=os.path.join(SPOOL_ROOT, str(os.getpid())) if SHARED_WORKERS else SPOOL_ROOT)
+# Thumbnails are kept on disk (size-bounded LRU) and filled from Drive when missing;
+# photos are private on Drive and reach the browser through /api/photo and /api/thumbnail
+thumbnails = ThumbnailStore(directory=os.path.join(DATA_DIR, "thumbnails"))
+PHOTO_BROWSER_CACHE_SECONDS = int(os.getenv("PHOTO_BROWSER_CACHE_SECONDS", "86400"))
+coordinator = None  # WorkerCoordinator, with SHARED_WORKERS
+
+# Closed visits older than ARCHIVE_AFTER_DAYS move out of the Visitors sheet
+# (into visit_archive, above); reports, stats and search read both
+archive_job = ArchiveJob(visitors_cache, visit_archive, writer=sheet_writer, tz=IST)
+
+# Paginated admin views served from the caches above
+visitor_query = RowQuery(visitors_cache, VISITOR_COLUMNS)
+booking_query = RowQuery(bookings_cache, BOOKING_COLUMNS)
+ADMIN_FIRST_PAGE = 20
+
+# Live feed for the gate/admin dashboards, fed by every write path below
+events = EventBroker()
+
+# Pass IDs continue from the sheet's row numbers, which older rows use as their ID.
+# Serverless instances share no disk, so there connect_to_db() swaps in SheetPassIds.
+def pass_id_floor():
+    return max(visitors_cache.row_count(), max_pass_id.value(), visit_archive.max_key())
+
+pass_ids = PassIdAllocator(os.path.join(DATA_DIR, "pass_id.hwm"), floor_fn=pass_id_floor)
+
+metrics.add_gauge('sheet_writes_pending', "Sheet writes journalled but not yet sent.", lambda: sheet_writer.stats()['pending'])
+metrics.add_gauge('photo_uploads_in_flight', "Drive uploads queued or running.", lambda: upload_queue.stats()['in_flight'])
+metrics.add_gauge('cached_rows', "Rows held in the in-memory sheet caches.",
+                  lambda: {'Users': users_cache.row_count(), 'Visitors': visitors_cache.row_count(), 'Bookings': bookings_cache.row_count()})
+metrics.add_gauge('visitors_inside', "Visitors checked in and not yet out.", lambda: open_visits.count())
+metrics.add_gauge('sheets_circuit_open', "1 while Sheets calls are being short-circuited.", lambda: int(sheets_client.breaker.state != 'closed'))
+
+def sheet_table(sheets, name):
+    """Google worksheet behind the rate limiter / retries / circuit breaker, timed per call."""
+    return ResilientWorksheet(InstrumentedWorksheet(sheets.table(name)), sheets_client)
+
 def connect_to_db():
-    global ws_users, ws_visitors, ws_bookings
+    global ws_users, ws_visitors, ws_bookings, coordinator, pass_ids
     try:
+        # Google client libraries are imported here, not at module load, to keep cold starts short
+        import fake_google
         creds = None
+        if os.getenv('GOOGLE_TOKEN') or os.path.exists('token.json'):
+            from google.oauth2.credentials import Credentials
         if os.getenv('GOOGLE_TOKEN'):
             token_info = json.loads(os.getenv('GOOGLE_TOKEN'))
             creds = Credentials.from_authorized_user_info(token_info, ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive'])
         elif os.path.exists('token.json'):
             creds = Credentials.from_authorized_user_file('token.json', ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive'])
 
-        if creds:
-            gc = gspread.authorize(creds)
-            if SHEET_ID:
-                sh = gc.open_by_key(SHEET_ID)
+        if fake_google.enabled():
+            # Offline stand-in (see fake_google.py / benchmark.py)
+            sheets = SheetsStorage(fake_google.backend().client(), SHEET_ID, SHEET_NAME)
+        elif creds:
+            import gspread
+            sheets = SheetsStorage(gspread.authorize(creds), SHEET_ID, SHEET_NAME)
+        else:
+            sheets = None
+
+        feed = None
+        if STORAGE_BACKEND == 'sqlite':
+            local = SQLiteStorage(os.path.join(DATA_DIR, "gatepass.db"), track_changes=SHARED_WORKERS)
+            if sheets:
+                local.import_from(sheets)  # first run only: tables are empty
+                for name in TABLE_NAMES:
+                    sheet_writer.register(name, sheet_table(sheets, name), key_col=KEY_COLUMNS.get(name))
+            else:
+                print("⚠️ No credentials found. Running on local SQLite without the Sheet mirror.")
+            if SHARED_WORKERS:
+                # The elected worker mirrors the shared change log to the Sheet
+                coordinator = WorkerCoordinator(local, DATA_DIR, events, writer=sheet_writer if sheets else None,
+                                                spool_root=SPOOL_ROOT, spool_dir=upload_queue.spool_dir,
+                                                restore_uploads=restore_spooled_uploads)
+                coordinator.start()
+                tables = {name: InstrumentedWorksheet(local.table(name), 'sqlite') for name in TABLE_NAMES}
+                feed = local
+            elif sheets:
+                sheet_writer.start()
+                tables = {name: MirroredTable(InstrumentedWorksheet(local.table(name), 'sqlite'), sheet_writer, name) for name in TABLE_NAMES}
+            else:
+                tables = {name: InstrumentedWorksheet(local.table(name), 'sqlite') for name in TABLE_NAMES}
+            writer = None  # local writes are cheap; the mirror batches the Sheet side
+        elif sheets:
+            tables = {name: sheet_table(sheets, name) for name in TABLE_NAMES}
+            caches = {"Users": users_cache, "Visitors": visitors_cache, "Bookings": bookings_cache}
+            for name in TABLE_NAMES:
+                # An edit that had to follow its row means this copy's row numbers are off
+                sheet_writer.register(name, tables[name], key_col=KEY_COLUMNS.get(name), on_moved=caches[name].expire)
+            sheet_writer.start()
+            writer = sheet_writer
+            if os.getenv("VERCEL"):
+                pass_ids = SheetPassIds(sheets, pass_id_floor, wrap=lambda ws: ResilientWorksheet(InstrumentedWorksheet(ws), sheets_client))
+            if ARCHIVE_AFTER_DAYS > 0 and os.getenv("VERCEL"):
+                print("⚠️ ARCHIVE_AFTER_DAYS is ignored on Vercel: the archive would live in /tmp")
             else:
-                sh = gc.open(SHEET_NAME)
-                
-            ws_users = sh.worksheet("Users")
-            ws_visitors = sh.worksheet("Visitors")
-            ws_bookings = sh.worksheet("Bookings")
-            print("✅ Connected to Google Database.")
-            return True
+                archive_job.start()
         else:
             print("❌ No credentials found.")
             return False
+
+        users_cache.bind(tables["Users"], writer=writer, feed=feed)
+        visitors_cache.bind(tables["Visitors"], writer=writer, feed=feed)
+        bookings_cache.bind(tables["Bookings"], writer=writer, feed=feed)
+        # Published last: other threads treat ws_visitors as "caches are bound"
+        ws_users, ws_bookings = tables["Users"], tables["Bookings"]
+        ws_visitors = tables["Visitors"]
+        print(f"✅ Connected to {'local SQLite' if STORAGE_BACKEND == 'sqlite' else 'Google'} Database.")
+        return True
     except Exception as e:
         print(f"❌ Connection Error: {e}")
         return False
 
-connect_to_db()
+_db_lock = threading.Lock()
+_db_failed_at = None
+DB_RETRY_SECONDS = float(os.getenv("DB_RETRY_SECONDS", "10"))
+
+def ensure_db():
+    """Connect on first use. Concurrent first requests share one attempt; failures back off."""
+    global _db_failed_at
+    if ws_visitors is not None: return True
+    with _db_lock:
+        if ws_visitors is not None: return True
+        if _db_failed_at is not None and time.monotonic() - _db_failed_at < DB_RETRY_SECONDS: return False
+        ok = connect_to_db()
+        _db_failed_at = None if ok else time.monotonic()
+        return ok
+
+# Endpoints that never read the sheets are served without waiting for a connection
+NO_DB_ENDPOINTS = {'index', 'static', 'health', 'prometheus_metrics'}
+
+@app.before_request
+def connect_lazily():
+    if request.endpoint not in NO_DB_ENDPOINTS:
+        ensure_db()
 
 def get_dept_from_email(email):
     try:
@@ -84,6 +265,51 @@ def get_dept_from_email(email):
     except:
         return "STAFF"
 
+def pass_id_of(row, row_number):
+    """Pass ID lives in column N; rows written before it existed use their sheet row number."""
+    return row[13] if len(row) > 13 and row[13] else row_number
+
+def active_visitor_dict(row, row_number):
+    pass_id = pass_id_of(row, row_number)
+    has_photo = len(row) > 9 and bool(row[9])  # uploaded, or still on its way (the thumbnail exists from check-in)
+    return {
+        'in_time': row[1],
+        'mobile': row[2],
+        'name': row[3],
+        'vehicle': row[12] if len(row) > 12 else "-",
+        'to_meet': row[7],
+        'dept': row[8],
+        'photo': f"/api/photo/{pass_id}" if has_photo else "",
+        'pass_id': pass_id,
+        'thumb': f"/api/thumbnail/{pass_id}" if has_photo else ""
+    }
+
+def pending_booking_dict(row):
+    return {
+        'time': row[0],
+        'booked_by': row[2],
+        'dept': row[3],
+        'mobile': row[4],
+        'visitor': row[5],
+        'purpose': row[6],
+        'company': row[8] if len(row) > 8 else "-",
+        'vehicle_number': row[9] if len(row) > 9 else "-"
+    }
+
+def upstream_error(e):
+    """Say the data source is down (503) rather than answering with an empty result."""
+    print(f"⚠️ Data unavailable: {e}")
+    return jsonify({'status': 'error', 'degraded': True, 'message': 'Google Sheets is unavailable right now. Please retry shortly.'}), 503
+
+@app.after_request
+def flag_degraded(response):
+    # Lists served from the last good copy while Sheets is failing are marked as such
+    stale = [age for age in (users_cache.staleness(), visitors_cache.staleness(), bookings_cache.staleness()) if age is not None]
+    if stale:
+        response.headers['X-Data-Degraded'] = 'sheets'
+        response.headers['X-Data-Age'] = str(max(stale))
+    return response
+
 # --- ROUTES ---
 
 @app.route('/')
@@ -100,7 +326,6 @@ def index():
 
 @app.route('/api/login', methods=['POST'])
 def api_login():
-    if not ws_users: connect_to_db()
     data = request.json
     email = data.get('email').lower().strip()
     name = data.get('name')
@@ -111,16 +336,20 @@ def api_login():
         session['role'] = 'Faculty'
         session['name'] = name
         session['dept'] = dept
+        # First login registers the faculty member; the row is queued, not awaited
         try:
-            cell = ws_users.find(email)
-        except gspread.exceptions.CellNotFound:
-             try: ws_users.append_row([email, 'Faculty', name, dept])
-             except: pass
+            with users_cache.lock:
+                if user_emails.row_for(email) is None:
+                    users_cache.append_row([email, 'Faculty', name, dept])
+        except Exception as e:
+            print(f"⚠️ Faculty registration failed: {e}")
         return jsonify({'status': 'success', 'redirect': '/dashboard'})
 
     try:
-        cell = ws_users.find(email)
-        role = ws_users.cell(cell.row, 2).value 
+        row_number = user_emails.row_for(email)
+        if row_number is None: raise LookupError(email)
+        row = users_cache.get_row(row_number)
+        role = row[1] if len(row) > 1 else ""
         session['user'] = email
         session['role'] = role
         session['name'] = name
@@ -134,134 +363,148 @@ def api_login():
 def dashboard():
     if 'user' not in session: return redirect('/')
     role = session['role']
-    if not ws_visitors: connect_to_db()
 
     if role == 'Security': 
-        return render_template('security_dashboard.html')
+        return render_template('security_dashboard.html', live_feed=live_feed_mode(),
+                               poll_timeout=EVENT_POLL_TIMEOUT, list_reload_seconds=60 if os.getenv("VERCEL") else 0)
     elif role == 'Faculty': 
         return render_template('faculty_dashboard.html')
     elif role == 'Admin':
-        visitors_data = []
+        visitors_page = {'rows': [], 'next_cursor': None, 'total': 0}
+        past_page = {'rows': [], 'next_cursor': None, 'total': 0}
         active_visitors = []
         upcoming_bookings = []
-        past_bookings = []
         
         # Stats Counters
         total_entries_count = 0
         today_entries_count = 0
         
         try:
-            v_rows = ws_visitors.get_all_values()
-            
-            # Add Pass ID (Row Index) to each row
-            for index, row in enumerate(v_rows):
-                row.append(index + 1)
-            
-            # FULL DATA (Skip Header)
-            visitors_data = v_rows[1:] 
-            visitors_data.reverse() # Newest first
-            
-            total_entries_count = len(visitors_data)
+            # On a cold start both sheets download at once
+            load_together(visitors_cache, bookings_cache)
+
+            # Only counts and the first page go out; the rest comes from /api/admin/visitors
+            visitors_page = visitor_page_json(visitor_query.page(limit=ADMIN_FIRST_PAGE))
+            total_entries_count = visitors_page['total'] + visit_archive.count()
             
             # Calculate Today's Count
-            today_str = datetime.now(IST).strftime("%d-%m-%Y")
-            today_entries_count = sum(1 for row in visitors_data if row[0] == today_str)
+            today_entries_count = visit_stats.entries_on(datetime.now(IST).date())
 
             # Active Visitors Logic
-            active_visitors = [row for row in v_rows[1:] if len(row) > 10 and row[10] == ""]
-            active_visitors.reverse()
+            for n in reversed(open_visits.open_rows()):
+                row = visitors_cache.get_row(n)
+                active_visitors.append(row + [pass_id_of(row, n)])  # Pass ID last, for the photo link
 
             # Bookings Logic
-            b_rows = ws_bookings.get_all_values()
-            for row in b_rows[1:]:
-                if len(row) > 7:
-                    if row[7] == "Pending": upcoming_bookings.append(row)
-                    else: past_bookings.append(row)
-            upcoming_bookings.reverse()
-            past_bookings.reverse()
+            upcoming_bookings = [bookings_cache.get_row(n) for n in reversed(booking_status.rows_with("Pending"))]
+            past_page = booking_page_json(booking_query.page(candidates=booking_status.rows_without("Pending"), limit=ADMIN_FIRST_PAGE))
             
         except Exception as e: 
              print(f"Dashboard Data Error: {e}")
 
         return render_template('admin_dashboard.html', 
-                             visitors=visitors_data, # Sends FULL list now
+                             visitors_page=visitors_page,
                              active_visitors=active_visitors,
                              bookings=upcoming_bookings,
-                             past_bookings=past_bookings,
+                             past_page=past_page,
                              total_entries=total_entries_count, # True Total
                              today_count=today_entries_count,   # New Stat
                              sheet_id=SHEET_ID, 
-                             drive_id=DRIVE_FOLDER_ID)
+                             drive_id=DRIVE_FOLDER_ID,
+                             report_format='xlsx' if 'xlsx' in available_formats() else 'csv')
     
     return "Unknown Role"
 
+def has_pending_booking(mobile):
+    """Answered from the in-memory mobile / status indexes; no sheet download."""
+    return any(booking_status.has(row_number, "Pending") for row_number in booking_mobiles.rows_for(mobile))
+
+def booking_row(data, booked_at):
+    return [
+        booked_at,
+        session['user'],
+        data.get('to_meet') or session['name'],
+        data.get('department') or session.get('dept', 'STAFF'),
+        data['mobile'],
+        data['name'],
+        data['purpose'],
+        "Pending",
+        data.get('company') or '-',
+        data.get('vehicle') or '-'
+    ]
+
 @app.route('/api/book_visitor', methods=['POST'])
 def book_visitor():
     if session.get('role') not in ['Faculty', 'Admin']: return jsonify({'error': 'Unauthorized'})
     data = request.json
     
     try:
-        mobile_to_check = str(data.get('mobile')).strip()
-        all_bookings = ws_bookings.get_all_values()
-        for row in all_bookings[1:]:
-            if len(row) > 7:
-                existing_mobile = str(row[4]).strip()
-                status = row[7]
-                if existing_mobile == mobile_to_check and status == "Pending":
-                    return jsonify({'status': 'error', 'message': 'Duplicate: Visitor has pending booking.'})
+        if has_pending_booking(data.get('mobile')):
+            return jsonify({'status': 'error', 'message': 'Duplicate: Visitor has pending booking.'})
     except: pass
 
-    host_name = data.get('to_meet', session['name'])
-    host_dept = data.get('department', session.get('dept', 'STAFF'))
-    booked_by_email = session['user']
-
-    row = [
-        datetime.now(IST).strftime("%Y-%m-%d %H:%M:%S"),
-        booked_by_email,
-        host_name,
-        host_dept,
-        data['mobile'],
-        data['name'],
-        data['purpose'],
-        "Pending",
-        data.get('company', '-'),
-        data.get('vehicle', '-')
-    ]
+    row = booking_row(data, datetime.now(IST).strftime("%Y-%m-%d %H:%M:%S"))
     try:
-        ws_bookings.append_row(row)
+        bookings_cache.append_row(row)
+        events.publish('booking_created', pending_booking_dict(row))
         return jsonify({'status': 'success'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
-    
+
+@app.route('/api/bookings/import', methods=['POST'])
+def import_bookings():
+    """
+    Pre-book many visitors at once from a CSV or JSON upload (multipart 'file'
+    or the raw request body). Every row is validated; the accepted ones are
+    written with a single append. ?dry_run=1 only validates.
+    """
+    if session.get('role') not in ['Faculty', 'Admin']: return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    upload = request.files.get('file')
+    try:
+        if upload:
+            records = parse_records(upload.read(), upload.mimetype, upload.filename)
+        else:
+            records = parse_records(request.get_data(), request.content_type)
+    except InvalidUpload as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    dry_run = request.args.get('dry_run') in ('1', 'true', 'yes')
+    booked_at = datetime.now(IST).strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        # Held across check and write so a concurrent booking can't slip in between
+        with bookings_cache.lock:
+            accepted, rejected = validate(records, has_pending_booking)
+            rows = [booking_row(record, booked_at) for _, record in accepted]
+            if rows and not dry_run:
+                bookings_cache.append_rows(rows)
+    except Exception as e:
+        return upstream_error(e)
+
+    if not dry_run:
+        for row in rows:
+            events.publish('booking_created', pending_booking_dict(row))
+    return jsonify({
+        'status': 'success',
+        'dry_run': dry_run,
+        'accepted': [{'row': line, 'mobile': record['mobile'], 'name': record['name']} for line, record in accepted],
+        'rejected': rejected,
+    })
+
 @app.route('/api/get_today_bookings', methods=['GET'])
 def get_today_bookings():
     if session.get('role') != 'Security': return jsonify([])
     try:
-        if not ws_bookings: connect_to_db()
-        all_bookings = ws_bookings.get_all_values()
         pending_list = []
-        for row in all_bookings[1:]:
-            if len(row) > 7 and row[7] == "Pending":
-                vehicle_val = row[9] if len(row) > 9 else "-"
-                pending_list.append({
-                    'time': row[0],
-                    'booked_by': row[2],
-                    'dept': row[3],
-                    'mobile': row[4],
-                    'visitor': row[5],
-                    'purpose': row[6],
-                    'company': row[8] if len(row) > 8 else "-",
-                    'vehicle_number': vehicle_val
-                })
+        for row_number in booking_status.rows_with("Pending"):
+            pending_list.append(pending_booking_dict(bookings_cache.get_row(row_number)))
         return jsonify(pending_list)
-    except: return jsonify([])
+    except Exception as e: return upstream_error(e)
 
 @app.route('/api/get_user_bookings', methods=['GET'])
 def get_user_bookings():
     if 'user' not in session: return jsonify([])
     try:
-        if not ws_bookings: connect_to_db()
-        all_rows = ws_bookings.get_all_values()
+        all_rows = bookings_cache.get_rows()
         my_bookings = []
         user_email = session['user']
         
@@ -276,46 +519,35 @@ def get_user_bookings():
                 })
         return jsonify(list(reversed(my_bookings)))
     except Exception as e:
-        return jsonify([])
+        return upstream_error(e)
 
 @app.route('/api/get_active_visitors', methods=['GET'])
 def get_active_visitors():
     if session.get('role') != 'Security': return jsonify([])
     try:
-        if not ws_visitors: connect_to_db()
-        all_rows = ws_visitors.get_all_values()
         active_list = []
         
-        for row in all_rows[1:]:
-            if len(row) > 10 and row[10] == "":
-                active_list.append({
-                    'in_time': row[1],
-                    'mobile': row[2],
-                    'name': row[3],
-                    'vehicle': row[12] if len(row) > 12 else "-",
-                    'to_meet': row[7],
-                    'dept': row[8],
-                    'photo': row[9]
-                })
+        # Only the open visits are touched, not the whole history
+        for row_number in open_visits.open_rows():
+            active_list.append(active_visitor_dict(visitors_cache.get_row(row_number), row_number))
         return jsonify(list(reversed(active_list)))
-    except: return jsonify([])
+    except Exception as e: return upstream_error(e)
 
 @app.route('/api/check_visitor', methods=['GET'])
 def check_visitor():
     mobile = request.args.get('mobile')
     try:
-        cell_list = ws_bookings.findall(mobile)
-        for cell in cell_list:
-            if cell.col == 5: 
-                row = ws_bookings.row_values(cell.row)
-                if row[7] == "Pending":
-                    vehicle = row[9] if len(row) > 9 else ""
-                    return jsonify({'found': True, 'is_booking': True, 'name': row[5], 'purpose': row[6], 'booked_by': row[2], 'department': row[3], 'company': row[8], 'vehicle': vehicle, 'to_meet': row[2]})
-    except: pass
+        load_together(bookings_cache, visitors_cache)
+        for row_number in booking_mobiles.rows_for(mobile):
+            row = bookings_cache.get_row(row_number)
+            if len(row) > 7 and row[7] == "Pending":
+                vehicle = row[9] if len(row) > 9 else ""
+                return jsonify({'found': True, 'is_booking': True, 'name': row[5], 'purpose': row[6], 'booked_by': row[2], 'department': row[3], 'company': row[8], 'vehicle': vehicle, 'to_meet': row[2]})
+    except Exception as e: return upstream_error(e)
     try:
-        cells = ws_visitors.findall(mobile)
-        if cells:
-            row = ws_visitors.row_values(cells[-1].row)
+        last_row = visitor_mobiles.last_row_for(mobile)
+        if last_row:
+            row = visitors_cache.get_row(last_row)
             vehicle = row[12] if len(row) > 12 else ""
             return jsonify({
                 'found': True, 'is_booking': False, 
@@ -324,16 +556,42 @@ def check_visitor():
                 'to_meet': row[7], 'department': row[8], 
                 'vehicle': vehicle
             })
-    except: pass
+    except Exception as e: return upstream_error(e)
     return jsonify({'found': False})
 
+def visitor_suggestions(query, limit):
+    results = []
+    for mobile, score, last_row, visits in visitor_search.search(query, limit=limit):
+        row = visitors_cache.get_row(last_row)
+        results.append({
+            'mobile': row[2],
+            'name': row[3] if len(row) > 3 else "",
+            'designation': row[4] if len(row) > 4 else "",
+            'company': row[5] if len(row) > 5 else "",
+            'vehicle': row[12] if len(row) > 12 else "",
+            'last_visit': row[0],
+            'visits': visits,
+            'score': score
+        })
+    return results
+
+@app.route('/api/suggest_visitors', methods=['GET'])
+def suggest_visitors():
+    """Autocomplete for the entry form: part of a number, a name, company or vehicle, typos allowed."""
+    if session.get('role') not in ('Security', 'Admin'): return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    query = request.args.get('q', '').strip()
+    if len(query) < 2: return jsonify({'status': 'success', 'results': []})
+    try: limit = max(1, min(int(request.args.get('limit', 8)), 50))
+    except ValueError: limit = 8
+    try:
+        return jsonify({'status': 'success', 'results': visitor_suggestions(query, limit)})
+    except Exception as e: return upstream_error(e)
+
 @app.route('/api/get_next_id', methods=['GET'])
 def get_next_id():
-    try:
-        if not ws_visitors: connect_to_db()
-        current_count = len(ws_visitors.col_values(1)) 
-        return jsonify({'next_id': current_count})
-    except: return jsonify({'next_id': '---'})
+    """Preview of the next pass ID; nothing is reserved (entry() assigns the real one)."""
+    try: return jsonify({'next_id': pass_ids.peek() + 1, 'preview': True})
+    except: return jsonify({'next_id': '---', 'preview': True})
 
 @app.route('/api/entry', methods=['POST'])
 def entry():
@@ -343,19 +601,22 @@ def entry():
         image_data = data['image']
         header, encoded = image_data.split(",", 1)
         image_bytes = base64.b64decode(encoded)
+        photo = process_photo(image_bytes)
         
         now = datetime.now(IST)
         filename = f"{now.strftime('%d-%m-%Y')}_{data['mobile']}_{now.strftime('%H%M%S')}.jpg"
-        photo_url = ""
 
-        try:
-            if not DRIVE_FOLDER_ID: raise Exception("GOOGLE_DRIVE_FOLDER_ID not set in Env")
-            drive_link = upload_photo_to_drive(image_bytes, filename, DRIVE_FOLDER_ID)
-            if drive_link: photo_url = drive_link
-        except Exception as e:
-            print(f"⚠️ Drive Failed: {e}")
+        if not DRIVE_FOLDER_ID:
+            print("⚠️ Drive Failed: GOOGLE_DRIVE_FOLDER_ID not set in Env")
             return jsonify({'status': 'error', 'message': 'Photo Upload Failed.'})
 
+        # Row is written now with a placeholder; the worker fills in the Drive link
+        upload_id = upload_queue.new_job_id()
+        photo_url = upload_queue.placeholder(upload_id)
+
+        load_together(visitors_cache, bookings_cache)
+        pass_id = pass_ids.allocate()
+
         new_row = [
             now.strftime("%d-%m-%Y"),
             now.strftime("%I:%M %p"),
@@ -369,22 +630,150 @@ def entry():
             photo_url,
             "", 
             session['user'],
-            data.get('vehicle', '-') 
+            data.get('vehicle', '-'),
+            pass_id
         ]
-        ws_visitors.append_row(new_row)
-        
-        try:
-            cell_list = ws_bookings.findall(data['mobile'])
-            for cell in cell_list:
-                if cell.col == 5 and ws_bookings.cell(cell.row, 8).value == "Pending": 
-                    ws_bookings.update_cell(cell.row, 8, "Arrived")
-        except: pass
+        # Writing through (serverless), the visit row and the booking update go up in one flush
+        with sheet_writer.deferred():
+            visit_row = visitors_cache.append_row(new_row)
+            events.publish('visitor_in', active_visitor_dict(new_row, visit_row))
+            thumbnails.put(pass_id, photo.thumbnail)
+
+            try:
+                for row_number in booking_mobiles.rows_for(data['mobile']):
+                    if booking_status.has(row_number, "Pending"):
+                        bookings_cache.update_cell(row_number, 8, "Arrived")
+                        events.publish('booking_arrived', {'mobile': data['mobile']})
+            except: pass
 
-        return jsonify({'status': 'success', 'pass_id': len(ws_visitors.get_all_values()), 'date': new_row[0], 'in_time': new_row[1], 'photo': photo_url})
+        # ...alongside the photo upload when that runs inline too
+        fan_out(
+            sheet_writer.write_through if sheet_writer.writes_through else None,
+            lambda: upload_queue.submit(
+                upload_id, photo.data, filename, DRIVE_FOLDER_ID,
+                on_done=lambda link: set_visit_photo(pass_id, link),
+                on_failed=lambda err: set_visit_photo(pass_id, ""),
+                meta={'original_bytes': photo.original_bytes, 'saved_bytes': photo.saved_bytes},
+                key=pass_id
+            )
+        )
+
+        return jsonify({'status': 'success', 'pass_id': pass_id, 'date': new_row[0], 'in_time': new_row[1], 'photo': photo_url, 'upload_id': upload_id,
+                        'offline': sheets_offline()})
 
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+def set_visit_photo(pass_id, link):
+    """Upload callback: the row is found by pass ID, so it also works for photos resumed after a restart."""
+    if not ensure_db(): raise RuntimeError("Database not connected")
+    row_number = visitor_pass_ids.row_for(pass_id)
+    if row_number: visitors_cache.update_cell(row_number, 10, link)
+
+def restore_spooled_uploads():
+    upload_queue.restore(on_done=set_visit_photo, on_failed=lambda pass_id, err: set_visit_photo(pass_id, ""))
+
+# Photos left in the spool by a previous run (e.g. taken during an outage) are uploaded now
+restore_spooled_uploads()
+
+def sheets_offline():
+    """True while writes are only journalled locally (they are synced when Sheets is back)."""
+    return sheets_client.breaker.state != 'closed' or bool(visitors_cache.degraded)
+
+@app.route('/api/upload_status/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    if session.get('role') not in ['Security', 'Admin']: return jsonify({'error': 'Unauthorized'})
+    job = upload_queue.status(upload_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Unknown upload'}), 404
+    return jsonify({'status': 'success', 'upload': job})
+
+def visit_photo_link(pass_id):
+    """Drive link stored for a visit ("" if none yet), searching the live sheet then the archive."""
+    if not ensure_db(): raise RuntimeError("Database not connected")
+    row_number = visitor_pass_ids.row_for(pass_id)
+    if row_number is None and 2 <= pass_id <= visitors_cache.row_count():
+        row = visitors_cache.get_row(pass_id)
+        if str(pass_id_of(row, pass_id)) == str(pass_id): row_number = pass_id  # older row using its row number
+    if row_number is not None:
+        row = visitors_cache.get_row(row_number)
+    else:
+        row = visit_archive.row_for_key(pass_id) or []
+    link = row[9] if len(row) > 9 else ""
+    return "" if is_pending_photo(link) else link
+
+def photo_response(data):
+    # Private: photos need a login, so shared caches must not keep them
+    response = Response(data, mimetype="image/jpeg")
+    response.cache_control.private = True
+    response.cache_control.max_age = PHOTO_BROWSER_CACHE_SECONDS
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/api/thumbnail/<int:pass_id>', methods=['GET'])
+def thumbnail(pass_id):
+    if session.get('role') not in ['Security', 'Admin']: return "Unauthorized", 403
+    data = thumbnails.get(pass_id)
+    if data is None:
+        # Not made at check-in (another server, evicted, or an older visit): build it from the Drive copy
+        try:
+            file_id = drive_file_id(visit_photo_link(pass_id))
+            original = download_photo_from_drive(file_id) if file_id else None
+        except Exception as e:
+            print(f"Thumbnail Error: {e}")
+            original = None
+        if not original: return "Not Found", 404
+        data = make_thumbnail(original) or original  # without Pillow the photo itself is served
+        thumbnails.put(pass_id, data)
+    return photo_response(data)
+
+@app.route('/api/photo/<int:pass_id>', methods=['GET'])
+def visit_photo(pass_id):
+    """Full-size visitor photo, fetched from Drive with the gate's own credentials."""
+    if session.get('role') not in ['Security', 'Admin']: return "Unauthorized", 403
+    try:
+        file_id = drive_file_id(visit_photo_link(pass_id))
+        data = download_photo_from_drive(file_id) if file_id else None
+    except Exception as e:
+        print(f"Photo Error: {e}")
+        data = None
+    if not data: return "Not Found", 404
+    return photo_response(data)
+
+def live_feed_mode():
+    """
+    'sse' under gunicorn, where a stream can stay open on its own thread;
+    'poll' elsewhere (Vercel functions can't hold a stream open).
+    """
+    if os.getenv("VERCEL"): return 'poll'
+    return 'sse' if request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn') else 'poll'
+
+@app.route('/api/events', methods=['GET'])
+def event_feed():
+    """Server-Sent Events feed. Browsers resume automatically via Last-Event-ID."""
+    if session.get('role') not in ['Security', 'Admin']: return "Unauthorized", 403
+    if not events.open_stream():
+        # Every stream slot is taken: the dashboard falls back to /api/events/poll
+        return jsonify({'status': 'error', 'message': 'Too many live feeds open; use /api/events/poll'}), 503
+    last_id = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    response = Response(events.stream(last_id), mimetype="text/event-stream",
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(events.close_stream)
+    return response
+
+@app.route('/api/events/poll', methods=['GET'])
+def event_poll():
+    """Long-poll fallback for hosts that cannot hold a stream open."""
+    if session.get('role') not in ['Security', 'Admin']: return jsonify({'error': 'Unauthorized'}), 403
+    last_id = parse_event_id(request.args.get('since'))
+    if last_id is None:
+        return jsonify({'last_id': events.last_id(), 'events': []})
+    found = events.wait(last_id, timeout=parse_timeout(request.args.get('timeout'), EVENT_POLL_TIMEOUT))
+    return jsonify({
+        'last_id': found[-1][0] if found else last_id,
+        'events': [{'id': i, 'type': t, 'data': d} for i, t, d in found]
+    })
+
 @app.route('/api/exit', methods=['POST'])
 def exit_visitor():
     data = request.json
@@ -392,24 +781,14 @@ def exit_visitor():
     custom_time = data.get('out_time')
     
     try:
-        all_rows = ws_visitors.get_all_values()
-        target_row_index = -1
-        target_out_time = None
-        
-        total_rows = len(all_rows)
-        for i in range(total_rows - 1, 0, -1): 
-            row = all_rows[i]
-            row_mobile = str(row[2]).strip() 
-            
-            if row_mobile == mobile:
-                target_row_index = i + 1 
-                if len(row) > 10: target_out_time = row[10]
-                else: target_out_time = "" 
-                break 
-        
-        if target_row_index == -1:
+        target_row_index = visitor_mobiles.last_row_for(mobile)
+
+        if not target_row_index:
              return jsonify({'status': 'error', 'message': 'Visitor not found in database'})
-             
+
+        row = visitors_cache.get_row(target_row_index)
+        target_out_time = row[10] if len(row) > 10 else ""
+
         if not target_out_time or str(target_out_time).strip() == "":
             if custom_time:
                 try:
@@ -420,8 +799,9 @@ def exit_visitor():
             else:
                 out_time = datetime.now(IST).strftime("%I:%M %p")
 
-            ws_visitors.update_cell(target_row_index, 11, out_time)
-            return jsonify({'status': 'success', 'out_time': out_time})
+            visitors_cache.update_cell(target_row_index, 11, out_time)
+            events.publish('visitor_out', {'mobile': row[2], 'pass_id': pass_id_of(row, target_row_index), 'out_time': out_time})
+            return jsonify({'status': 'success', 'out_time': out_time, 'offline': sheets_offline()})
         else:
             return jsonify({'status': 'error', 'message': f'Already OUT (Time: {target_out_time})'})
 
@@ -440,26 +820,24 @@ def filter_data():
     start_str = data.get('from')
     end_str = data.get('to')
 
-    if not ws_visitors: connect_to_db()
     
     try:
         start_date = datetime.strptime(start_str, "%Y-%m-%d").date()
         end_date = datetime.strptime(end_str, "%Y-%m-%d").date()
         
-        all_rows = ws_visitors.get_all_values()
-        headers = all_rows[0]
+        headers = visitors_cache.get_row(1) or []
         filtered_rows = []
 
-        for idx, row in enumerate(all_rows[1:]): 
-            try:
-                sheet_row_number = idx + 2 
-                row_date = datetime.strptime(row[0], "%d-%m-%Y").date()
-                
-                if start_date <= row_date <= end_date:
-                    row.append(sheet_row_number)
-                    filtered_rows.append(row)
-            except (ValueError, IndexError):
-                continue
+        # Archived months first (they are older), then the live sheet
+        for row in visit_archive.rows_between(start_date, end_date):
+            row.append(row[13])
+            filtered_rows.append(row)
+
+        # Date index jumps straight to the matching rows
+        for sheet_row_number in visitor_dates.rows_between(start_date, end_date):
+            row = visitors_cache.get_row(sheet_row_number)
+            row.append(pass_id_of(row, sheet_row_number))
+            filtered_rows.append(row)
 
         return jsonify({
             'status': 'success',
@@ -481,32 +859,117 @@ def download_report():
         start_date = datetime.strptime(start_str, "%Y-%m-%d").date()
         end_date = datetime.strptime(end_str, "%Y-%m-%d").date()
         
-        all_rows = ws_visitors.get_all_values()
-        
-        si = StringIO()
-        cw = csv.writer(si)
-        cw.writerow(all_rows[0]) # Header
-        
-        for row in all_rows[1:]:
-            try:
-                row_date = datetime.strptime(row[0], "%d-%m-%Y").date()
-                if start_date <= row_date <= end_date:
-                    cw.writerow(row)
-            except: continue
+        fmt = request.args.get('format', 'csv').lower()
+        use_gzip = request.args.get('gzip') in ('1', 'true', 'yes')
 
-        output = si.getvalue()
+        header = visitors_cache.get_row(1) or []
+        # Date index seeks straight to the range; rows are read one at a time while streaming
+        row_numbers = visitor_dates.rows_between(start_date, end_date)
+        rows = itertools.chain(visit_archive.rows_between(start_date, end_date),
+                               (visitors_cache.get_row(n) for n in row_numbers))
+
+        chunks, mimetype, ext = export_stream(fmt, header, rows, gzip=use_gzip)
         
         # UPDATED: Filename with Date Range
-        filename = f"SRIT_VISITOR_REPORT_{start_str}_{end_str}.csv"
+        filename = f"SRIT_VISITOR_REPORT_{start_str}_{end_str}.{ext}"
         
         return Response(
-            output,
-            mimetype="text/csv",
+            stream_with_context(chunks),
+            mimetype=mimetype,
             headers={"Content-disposition": f"attachment; filename={filename}"}
         )
     except Exception as e:
         return str(e), 500
 
+@app.route('/api/admin/stats', methods=['GET'])
+def admin_stats():
+    """Precomputed counters for one day (?date=YYYY-MM-DD, default today IST)."""
+    if session.get('role') != 'Admin': return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    try:
+        day_str = request.args.get('date')
+        day = datetime.strptime(day_str, "%Y-%m-%d").date() if day_str else datetime.now(IST).date()
+        stats = visit_stats.summary(day)
+        stats['inside_now'] = open_visits.count()
+        stats['pending_bookings'] = booking_status.count("Pending")
+        return jsonify({'status': 'success', 'stats': stats})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        print(f"Stats Error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+def visitor_page_json(page):
+    # Rows go out as lists with the Pass ID appended, like filter_data
+    return {
+        'rows': [row + [pass_id_of(row, n)] for n, row in page['rows']],
+        'next_cursor': page['next_cursor'],
+        'total': page['total']
+    }
+
+def booking_page_json(page):
+    return {
+        'rows': [row for n, row in page['rows']],
+        'next_cursor': page['next_cursor'],
+        'total': page['total']
+    }
+
+def list_query_args(columns):
+    args = request.args
+    return {
+        'filters': {k: v for k, v in args.items() if k in columns},
+        'sort': args.get('sort') or None,
+        'descending': args.get('order', 'desc') != 'asc',
+        'cursor': args.get('cursor'),
+        'limit': args.get('limit', 50),
+    }
+
+@app.route('/api/admin/visitors', methods=['GET'])
+def admin_visitors():
+    """Visitor history, newest first. Extra args: from/to (YYYY-MM-DD), status=inside|out."""
+    if session.get('role') != 'Admin': return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    try:
+        candidates = None
+        if request.args.get('from') or request.args.get('to'):
+            start = datetime.strptime(request.args.get('from') or '1970-01-01', "%Y-%m-%d").date()
+            end = datetime.strptime(request.args.get('to') or '9999-12-31', "%Y-%m-%d").date()
+            candidates = visitor_dates.rows_between(start, end)
+
+        status = request.args.get('status')
+        if status in ('inside', 'out'):
+            open_rows = open_visits.open_rows()
+            open_set = set(open_rows)
+            if status == 'inside':
+                candidates = open_rows if candidates is None else [n for n in candidates if n in open_set]
+            else:
+                base = candidates if candidates is not None else range(2, visitors_cache.row_count() + 1)
+                candidates = [n for n in base if n not in open_set]
+
+        page = visitor_query.page(candidates=candidates, **list_query_args(VISITOR_COLUMNS))
+        return jsonify({'status': 'success', **visitor_page_json(page)})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        print(f"Visitor List Error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/admin/bookings', methods=['GET'])
+def admin_bookings():
+    """Bookings, newest first. view=upcoming (Pending) | past | all."""
+    if session.get('role') != 'Admin': return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    try:
+        view = request.args.get('view', 'all')
+        candidates = None
+        if view == 'upcoming': candidates = booking_status.rows_with("Pending")
+        elif view == 'past': candidates = booking_status.rows_without("Pending")
+
+        page = booking_query.page(candidates=candidates, **list_query_args(BOOKING_COLUMNS))
+        return jsonify({'status': 'success', **booking_page_json(page)})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        print(f"Booking List Error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 # NEW ROUTE: Search Visitor by Mobile
 @app.route('/api/admin/search_visitor', methods=['GET'])
 def search_visitor():
@@ -516,44 +979,35 @@ def search_visitor():
     if not mobile:
         return jsonify({'status': 'error', 'message': 'Mobile number required'})
 
-    if not ws_visitors: connect_to_db()
 
     try:
-        all_rows = ws_visitors.get_all_values()
         visitor_history = []
         visitor_details = {}
         visit_count = 0
-        
-        # Clean the search input (remove spaces/dashes)
-        clean_search_mobile = ''.join(filter(str.isdigit, mobile))
-
-        # Start from 1 to skip header
-        for idx, row in enumerate(all_rows[1:]):
-            # Ensure row has data
-            if len(row) > 2:
-                # Clean the sheet data (remove spaces/dashes)
-                sheet_mobile = str(row[2]).strip()
-                clean_sheet_mobile = ''.join(filter(str.isdigit, sheet_mobile))
-                
-                # Compare cleaned numbers
-                if clean_sheet_mobile == clean_search_mobile:
-                    visit_count += 1
-                    
-                    # Capture details (Safely handle missing columns)
-                    visitor_details = {
-                        'name': row[3] if len(row) > 3 else "-",
-                        'company': row[5] if len(row) > 5 else "-",
-                        'designation': row[4] if len(row) > 4 else "-",
-                        'photo': row[9] if len(row) > 9 else ""
-                    }
-                    
-                    # Add to history list (append pass ID which is idx + 2)
-                    row_copy = list(row)
-                    row_copy.append(idx + 2) # Pass ID
-                    visitor_history.append(row_copy)
+
+        # Archived visits (older) first, then the live sheet; the mobile index is
+        # keyed by the cleaned number (spaces/dashes removed)
+        archived = [(None, row) for row in visit_archive.rows_for_mobile(mobile)]
+        live = [(n, visitors_cache.get_row(n)) for n in visitor_mobiles.rows_for(mobile)]
+        for row_number, row in archived + live:
+            visit_count += 1
+
+            # Capture details (Safely handle missing columns)
+            visitor_details = {
+                'name': row[3] if len(row) > 3 else "-",
+                'company': row[5] if len(row) > 5 else "-",
+                'designation': row[4] if len(row) > 4 else "-",
+                'photo': f"/api/thumbnail/{row[13] if row_number is None else pass_id_of(row, row_number)}"
+                         if len(row) > 9 and row[9] and not is_pending_photo(row[9]) else ""
+            }
+
+            # Add to history list (append pass ID; older live rows use their sheet row)
+            row.append(row[13] if row_number is None else pass_id_of(row, row_number)) # Pass ID
+            visitor_history.append(row)
 
         if visit_count == 0:
-            return jsonify({'status': 'success', 'found': False})
+            # Not a known number: offer the closest visitors instead
+            return jsonify({'status': 'success', 'found': False, 'suggestions': visitor_suggestions(mobile, 10)})
 
         return jsonify({
             'status': 'success',
@@ -566,6 +1020,78 @@ def search_visitor():
     except Exception as e:
         print(f"Search Error: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    stale = {c.name: c.staleness() for c in (users_cache, visitors_cache, bookings_cache) if c.staleness() is not None}
+    circuit = sheets_client.breaker.state
+    return jsonify({
+        'status': 'degraded' if stale or circuit != 'closed' else 'ok',
+        'sheets_circuit': circuit,
+        'stale_seconds': stale,
+        'sheet_writes_pending': sheet_writer.pending_count(),
+        'photos_spooled': upload_queue.spooled(),
+        'workers': coordinator.stats() if coordinator else None,
+        'archive_last_run': archive_job.last_run,
+    })
+
+@app.route('/api/admin/reload_users', methods=['POST'])
+def reload_users():
+    """Drop the cached user directory after editing the Users sheet by hand."""
+    if session.get('role') != 'Admin': return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    users_cache.invalidate()
+    return jsonify({'status': 'success'})
+
+@app.route('/api/admin/cache_stats', methods=['GET'])
+def cache_stats():
+    if session.get('role') != 'Admin': return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    return jsonify({
+        'status': 'success',
+        'users': users_cache.stats(),
+        'visitors': visitors_cache.stats(),
+        'bookings': bookings_cache.stats(),
+        'sheet_writes': sheet_writer.stats(),
+        'sheets_client': sheets_client.stats(),
+        'photo_uploads': upload_queue.stats(),
+        'photo_processing': photo_stats.as_dict(),
+        'thumbnails': thumbnails.stats(),
+        'workers': coordinator.stats() if coordinator else None,
+        'archive': dict(visit_archive.stats(), last_run=archive_job.last_run)
+    })
+
+@app.route('/api/admin/archive', methods=['POST'])
+def run_archive():
+    """Archive old closed visits now instead of waiting for ARCHIVE_HOUR (?dry_run=1 only counts them)."""
+    if session.get('role') != 'Admin': return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    if STORAGE_BACKEND != 'sheets' or os.getenv("VERCEL"):
+        return jsonify({'status': 'error', 'message': 'Archiving needs the Google Sheets backend on a server with local disk'}), 400
+    try:
+        ensure_db()
+        summary = archive_job.run(dry_run=request.args.get('dry_run') in ('1', 'true', 'yes'))
+        return jsonify({'status': 'success', **summary})
+    except Exception as e:
+        print(f"Archive Error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
     
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint: Admin session, or 'Authorization: Bearer $METRICS_TOKEN'."""
+    token = request.headers.get('Authorization', '')
+    if session.get('role') != 'Admin' and not (METRICS_TOKEN and token == f"Bearer {METRICS_TOKEN}"):
+        return "Unauthorized", 403
+    return Response(metrics.prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/admin/profile', methods=['GET'])
+def profile_report():
+    """Merged cProfile output of sampled requests (PROFILE_ROUTES / PROFILE_SAMPLE_RATE)."""
+    if session.get('role') != 'Admin': return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    if not profiler.enabled:
+        return jsonify({'status': 'error', 'message': 'Profiler is off. Set PROFILE_ROUTES to enable it.'}), 404
+    if request.args.get('reset') in ('1', 'true', 'yes'):
+        profiler.reset()
+        return jsonify({'status': 'success'})
+    report = profiler.report(request.args.get('route'), limit=int(request.args.get('limit', 30)), sort=request.args.get('sort', 'cumulative'))
+    return Response(report or "No samples yet.\n", mimetype="text/plain")
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,315 @@
+"""
+Load test for the gate pass app against the in-memory Google stand-in.
+
+    python benchmark.py                       # defaults: 120 ms per API call
+    python benchmark.py --latency-ms 300 --error-rate 0.02 --json results.json
+    python benchmark.py --startup             # cold start timings, with and without a snapshot
+
+Replays three kinds of traffic through Flask's test client:
+  * morning_rush  - guards checking visitors in (lookup, pass ID, entry) and out
+  * dashboards    - security / admin screens polling their lists and stats
+  * exports       - admins paging history and downloading reports
+
+For every endpoint it reports p50/p95/p99 latency and upstream API calls per
+request, split into calls made while the request was running ("inline") and
+all calls the scenario caused, including background flushes and uploads.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+
+def percentile(values, p):
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, -(-len(ordered) * p // 100) - 1))]
+
+
+def sample_photo():
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + os.urandom(200_000)  # not a real JPEG; sent as-is
+    img = Image.effect_noise((1280, 720), 64).convert('RGB')
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=92)
+    return out.getvalue()
+
+
+def seed_history(backend, visitors, bookings, days):
+    """Fill the fake sheets with `days` of past visits plus some bookings."""
+    today = datetime.now()
+    rows = backend.sheets["Visitors"]
+    for i in range(visitors):
+        day = today - timedelta(days=random.randint(0, days))
+        hour = random.randint(8, 17)
+        rows.append([
+            day.strftime("%d-%m-%Y"), f"{hour % 12 or 12:02d}:{random.randint(0, 59):02d} {'AM' if hour < 12 else 'PM'}",
+            f"9{random.randint(100000000, 999999999)}", f"Visitor {i}", "Engineer", f"Company {i % 50}",
+            "-", f"Host {i % 40}", random.choice(["CSE", "IT", "MECH", "ECE", "EEE"]), "",
+            f"{min(hour + 1, 23) % 12 or 12:02d}:30 {'AM' if hour + 1 < 12 else 'PM'}",
+            "security@sritcbe.ac.in", "-", str(i + 2)
+        ])
+    rows[1:] = sorted(rows[1:], key=lambda r: datetime.strptime(r[0], "%d-%m-%Y"))
+
+    booked = backend.sheets["Bookings"]
+    for i in range(bookings):
+        booked.append([
+            today.strftime("%Y-%m-%d %H:%M:%S"), "host.cse@sritcbe.ac.in", f"Host {i % 40}", "CSE",
+            f"8{random.randint(100000000, 999999999)}", f"Guest {i}", "Meeting",
+            "Pending" if i % 3 else "Arrived", f"Company {i % 50}", "-"
+        ])
+
+
+class Recorder:
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.inline_calls = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def request(self, client, label, method, url, **kwargs):
+        before = self.backend.thread_calls()
+        start = time.perf_counter()
+        resp = client.open(url, method=method, **kwargs)
+        resp.get_data()  # drain streamed responses
+        elapsed = (time.perf_counter() - start) * 1000
+        calls = self.backend.thread_calls() - before
+        body = resp.get_json(silent=True) if resp.is_json else None
+        failed = resp.status_code >= 400 or (isinstance(body, dict) and body.get('status') == 'error')
+        with self.lock:
+            self.latency[label].append(elapsed)
+            self.inline_calls[label] += calls
+            if failed: self.errors[label] += 1
+        return resp
+
+
+def client_for(app, role, user):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['user'], s['role'], s['name'], s['dept'] = user, role, user.split('@')[0], role.upper()
+    return client
+
+
+def run_threads(n, target):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+
+def morning_rush(gate, rec, args, photo):
+    image = "data:image/jpeg;base64," + base64.b64encode(photo).decode()
+    known = [r[2] for r in gate.visitors_cache.get_rows()[1:200]]
+    booked = [r[4] for r in gate.bookings_cache.get_rows()[1:] if len(r) > 7 and r[7] == "Pending"]
+    checked_in = []
+
+    def guard(i):
+        client = client_for(gate.app, 'Security', f"guard{i}@sritcbe.ac.in")
+        for j in range(args.rush_visitors):
+            pool = random.choice([known, booked, None])
+            mobile = random.choice(pool) if pool else f"7{random.randint(100000000, 999999999)}"
+            rec.request(client, 'GET /api/check_visitor', 'GET', f"/api/check_visitor?mobile={mobile}")
+            rec.request(client, 'GET /api/get_next_id', 'GET', "/api/get_next_id")
+            rec.request(client, 'POST /api/entry', 'POST', "/api/entry", json={
+                'image': image, 'mobile': mobile, 'name': f"Rush {i}-{j}", 'designation': 'Guest',
+                'company': 'Acme', 'to_meet': 'Host 1', 'department': 'CSE', 'vehicle': '-'
+            })
+            checked_in.append(mobile)
+        for mobile in checked_in[i::args.clients * 2]:
+            rec.request(client, 'POST /api/exit', 'POST', "/api/exit", json={'mobile': mobile})
+
+    run_threads(args.clients, guard)
+
+
+def dashboards(gate, rec, args, photo):
+    def screen(i):
+        if i % 3 == 2:
+            client = client_for(gate.app, 'Admin', f"admin{i}@sritcbe.ac.in")
+            for _ in range(args.poll_rounds):
+                rec.request(client, 'GET /dashboard (admin)', 'GET', "/dashboard")
+                rec.request(client, 'GET /api/admin/stats', 'GET', "/api/admin/stats")
+        else:
+            client = client_for(gate.app, 'Security', f"guard{i}@sritcbe.ac.in")
+            for _ in range(args.poll_rounds):
+                rec.request(client, 'GET /api/get_active_visitors', 'GET', "/api/get_active_visitors")
+                rec.request(client, 'GET /api/get_today_bookings', 'GET', "/api/get_today_bookings")
+
+    run_threads(args.clients, screen)
+
+
+def exports(gate, rec, args, photo):
+    end = datetime.now().strftime("%Y-%m-%d")
+    start = (datetime.now() - timedelta(days=args.days)).strftime("%Y-%m-%d")
+
+    def admin(i):
+        client = client_for(gate.app, 'Admin', f"admin{i}@sritcbe.ac.in")
+        for _ in range(args.export_rounds):
+            rec.request(client, 'GET /api/admin/download_report', 'GET', f"/api/admin/download_report?from={start}&to={end}")
+            cursor = None
+            for _ in range(5):
+                url = "/api/admin/visitors?limit=50" + (f"&cursor={cursor}" if cursor else "")
+                resp = rec.request(client, 'GET /api/admin/visitors', 'GET', url)
+                cursor = (resp.get_json() or {}).get('next_cursor')
+                if not cursor: break
+
+    run_threads(max(1, args.clients // 2), admin)
+
+
+SCENARIOS = {'morning_rush': morning_rush, 'dashboards': dashboards, 'exports': exports}
+
+
+# Runs in a fresh interpreter so import costs are real. Seeding happens before
+# the clock starts; the Google client libraries are not preloaded.
+STARTUP_PROBE = r"""
+import os, sys, json, time, threading
+sys.path.insert(0, os.environ['BENCH_ROOT'])
+import fake_google, benchmark
+backend = fake_google.backend()
+benchmark.seed_history(backend, int(os.environ['BENCH_HISTORY']), 100, 90)
+backend.configure(latency_ms=float(os.environ['BENCH_LATENCY']))
+
+t0 = time.perf_counter()
+import app as gate
+t_import = time.perf_counter()
+client = benchmark.client_for(gate.app, 'Security', 'guard@sritcbe.ac.in')
+client.get('/')
+t_page = time.perf_counter()
+client.get('/api/get_active_visitors')
+t_data = time.perf_counter()
+for t in threading.enumerate():
+    if t.name.endswith('-snapshot'): t.join()
+print(json.dumps({'import_ms': (t_import - t0) * 1000, 'login_page_ms': (t_page - t0) * 1000, 'first_data_ms': (t_data - t0) * 1000}))
+"""
+
+
+def startup(args):
+    """Time a fresh process to import, serve the login page and serve its first list."""
+    data_dir = tempfile.mkdtemp(prefix='gatepass-startup-')
+    env = dict(os.environ, GOOGLE_BACKEND='fake', GATEPASS_DATA_DIR=data_dir,
+               BENCH_ROOT=os.path.dirname(os.path.abspath(__file__)),
+               BENCH_HISTORY=str(args.history), BENCH_LATENCY=str(args.latency_ms))
+    results = {}
+    for label in ('cold', 'snapshot'):
+        runs = []
+        for _ in range(args.startup_runs):
+            if label == 'cold':
+                for name in os.listdir(data_dir):
+                    if name == 'snapshots':
+                        for f in os.listdir(os.path.join(data_dir, name)): os.remove(os.path.join(data_dir, name, f))
+            out = subprocess.run([sys.executable, '-c', STARTUP_PROBE], env=env, capture_output=True, text=True)
+            if out.returncode != 0:
+                raise RuntimeError(out.stderr)
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        results[label] = {k: round(sorted(r[k] for r in runs)[len(runs) // 2], 1) for k in runs[0]}
+
+    print(f"\n🚀 startup ({args.history} visitor rows, {args.latency_ms:.0f} ms per API call, median of {args.startup_runs})")
+    print(f"   {'':10} {'import':>10} {'login page':>12} {'first list':>12}")
+    for label, r in results.items():
+        print(f"   {label:10} {r['import_ms']:>10} {r['login_page_ms']:>12} {r['first_data_ms']:>12}")
+    return results
+
+
+def wait_for_background(gate, timeout=120):
+    """Let queued uploads and sheet writes finish so their API calls are counted."""
+    deadline = time.time() + timeout
+    while gate.upload_queue.stats()['in_flight'] and time.time() < deadline:
+        time.sleep(0.05)
+    try: gate.sheet_writer.flush()
+    except Exception as e: print(f"⚠️ Final flush failed: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument('--latency-ms', type=float, default=120, help="mean latency of each fake API call")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of API calls failing with 429")
+    parser.add_argument('--history', type=int, default=20000, help="visitor rows seeded into the sheet")
+    parser.add_argument('--bookings', type=int, default=300)
+    parser.add_argument('--days', type=int, default=90, help="days of history to spread rows over")
+    parser.add_argument('--clients', type=int, default=6, help="concurrent clients per scenario")
+    parser.add_argument('--rush-visitors', type=int, default=10, help="check-ins per guard")
+    parser.add_argument('--poll-rounds', type=int, default=20)
+    parser.add_argument('--export-rounds', type=int, default=2)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="run only these (repeatable)")
+    parser.add_argument('--json', help="also write results to this file")
+    parser.add_argument('--startup', action='store_true', help="measure cold start instead of load")
+    parser.add_argument('--startup-runs', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results = {'config': vars(args), 'startup': startup(args)}
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+        return results
+
+    # Configure the app for the fake backend before it is imported
+    os.environ['GOOGLE_BACKEND'] = 'fake'
+    os.environ.setdefault('GOOGLE_DRIVE_FOLDER_ID', 'fake-root-folder')
+    os.environ.setdefault('GATEPASS_DATA_DIR', tempfile.mkdtemp(prefix='gatepass-bench-'))
+
+    import fake_google
+    backend = fake_google.backend()
+    seed_history(backend, args.history, args.bookings, args.days)
+
+    backend.configure(latency_ms=args.latency_ms, error_rate=args.error_rate)
+    import app as gate
+    gate.ensure_db()
+
+    photo = sample_photo()
+    results = {'config': vars(args), 'scenarios': {}}
+    for name in args.scenario or list(SCENARIOS):
+        rec = Recorder(backend)
+        calls_before = backend.total_calls()
+        started = time.perf_counter()
+        SCENARIOS[name](gate, rec, args, photo)
+        wall = time.perf_counter() - started
+        wait_for_background(gate)
+        upstream = backend.total_calls() - calls_before
+
+        requests = sum(len(v) for v in rec.latency.values())
+        endpoints = {}
+        for label, values in rec.latency.items():
+            endpoints[label] = {
+                'requests': len(values),
+                'errors': rec.errors[label],
+                'p50_ms': round(percentile(values, 50), 1),
+                'p95_ms': round(percentile(values, 95), 1),
+                'p99_ms': round(percentile(values, 99), 1),
+                'inline_calls_per_request': round(rec.inline_calls[label] / len(values), 2),
+            }
+        results['scenarios'][name] = {
+            'requests': requests,
+            'wall_seconds': round(wall, 2),
+            'throughput_rps': round(requests / wall, 1) if wall else None,
+            'upstream_calls': upstream,
+            'upstream_calls_per_request': round(upstream / requests, 2) if requests else None,
+            'endpoints': endpoints,
+        }
+
+        print(f"\n📊 {name}: {requests} requests in {wall:.1f}s ({results['scenarios'][name]['throughput_rps']} req/s), "
+              f"{upstream} upstream calls ({results['scenarios'][name]['upstream_calls_per_request']}/request)")
+        print(f"   {'endpoint':36} {'n':>5} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'calls/req':>10}")
+        for label, e in sorted(endpoints.items()):
+            print(f"   {label:36} {e['requests']:>5} {e['errors']:>4} {e['p50_ms']:>8} {e['p95_ms']:>8} {e['p99_ms']:>8} {e['inline_calls_per_request']:>10}")
+
+    results['upstream'] = backend.stats()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
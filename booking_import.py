@@ -0,0 +1,85 @@
+import os
+import io
+import csv
+import json
+
+from sheet_index import normalize_mobile
+
+# Largest file accepted by /api/bookings/import
+MAX_IMPORT_ROWS = int(os.getenv('BULK_BOOKING_MAX_ROWS', '1000'))
+
+REQUIRED_FIELDS = ('mobile', 'name', 'purpose')
+OPTIONAL_FIELDS = ('company', 'vehicle', 'to_meet', 'department')
+
+# Spreadsheet-style headers people tend to export, mapped to our field names
+HEADER_ALIASES = {
+    'mobile_number': 'mobile', 'phone': 'mobile', 'phone_number': 'mobile',
+    'visitor': 'name', 'visitor_name': 'name',
+    'host': 'to_meet', 'dept': 'department', 'vehicle_number': 'vehicle',
+}
+
+
+class InvalidUpload(ValueError):
+    """The upload as a whole could not be read (bad format, too many rows)."""
+
+
+def _field(header):
+    key = str(header or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return HEADER_ALIASES.get(key, key)
+
+
+def parse_records(raw, content_type='', filename=''):
+    """
+    Turn a CSV or JSON upload into a list of dicts keyed by field name.
+    JSON may be a list of objects or {"bookings": [...]}; CSV needs a header row.
+    """
+    try: text = raw.decode('utf-8-sig') if isinstance(raw, bytes) else raw
+    except UnicodeDecodeError: raise InvalidUpload("File must be UTF-8 text (CSV or JSON)")
+    if not text.strip(): raise InvalidUpload("No bookings in the upload")
+    is_json = 'json' in (content_type or '') or (filename or '').lower().endswith('.json') or text.lstrip()[:1] in ('[', '{')
+    if is_json:
+        try: data = json.loads(text)
+        except ValueError as e: raise InvalidUpload(f"Invalid JSON: {e}")
+        if isinstance(data, dict): data = data.get('bookings')
+        if not isinstance(data, list) or not all(isinstance(r, dict) for r in data):
+            raise InvalidUpload("JSON must be a list of bookings or {\"bookings\": [...]}")
+        records = [{_field(k): v for k, v in r.items()} for r in data]
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or 'mobile' not in {_field(h) for h in reader.fieldnames}:
+            raise InvalidUpload("CSV needs a header row with at least: " + ", ".join(REQUIRED_FIELDS))
+        records = [{_field(k): v for k, v in r.items() if k is not None} for r in reader]
+    if len(records) > MAX_IMPORT_ROWS:
+        raise InvalidUpload(f"Too many rows ({len(records)}); the limit is {MAX_IMPORT_ROWS}")
+    return records
+
+
+def validate(records, has_pending):
+    """
+    Check every record. has_pending(mobile) says whether a pending booking
+    already exists. Returns (accepted, rejected): accepted is a list of
+    (line, cleaned record), rejected a list of {'row', 'mobile', 'reason'}.
+    Lines are 1-based over the data rows.
+    """
+    accepted, rejected, seen = [], [], {}
+    for line, record in enumerate(records, start=1):
+        clean = {f: str(record.get(f) or '').strip() for f in REQUIRED_FIELDS + OPTIONAL_FIELDS}
+        mobile = normalize_mobile(clean['mobile'])
+        missing = [f for f in REQUIRED_FIELDS if not clean[f]]
+        if missing:
+            reason = "Missing " + ", ".join(missing)
+        elif len(mobile) != 10:
+            reason = "Mobile number must have 10 digits"
+        elif mobile in seen:
+            reason = f"Duplicate of row {seen[mobile]} in this file"
+        elif has_pending(mobile):
+            reason = "Duplicate: Visitor has pending booking."
+        else:
+            reason = None
+        if reason:
+            rejected.append({'row': line, 'mobile': clean['mobile'], 'reason': reason})
+            continue
+        seen[mobile] = line
+        clean['mobile'] = mobile
+        accepted.append((line, clean))
+    return accepted, rejected
@@ -0,0 +1,169 @@
+import threading
+from datetime import datetime
+from collections import Counter, defaultdict
+
+from sheet_index import SheetIndex
+
+# Dwell times are bucketed per minute up to this cap, so percentiles are read
+# from a fixed-size histogram rather than by sorting every visit.
+MAX_DWELL_MINUTES = 24 * 60
+
+
+class VisitStats(SheetIndex):
+    """
+    Running visitor counters, maintained like the other sheet indexes: built
+    once from history when the cache loads, then patched on each entry / exit.
+
+    Keeps per-day totals plus per-day breakdowns by department, host and
+    hour of arrival, and a dwell-time histogram (out time - in time) per day
+    and overall. Every query is a dict lookup or a walk over a fixed-size
+    histogram, independent of how many rows the sheet holds.
+
+    With an archive (visit_archive.VisitArchive), visits moved out of the
+    sheet are counted too: they are tallied into a second VisitStats, which
+    is rebuilt only when the archive changes, and added to every answer.
+    """
+
+    def __init__(self, date_col=0, in_col=1, host_col=7, dept_col=8, out_col=10, archive=None):
+        self.date_col = date_col
+        self.in_col = in_col
+        self.host_col = host_col
+        self.dept_col = dept_col
+        self.out_col = out_col
+        self.archive = archive
+        self._archived = None
+        self._archived_version = None
+        self._archived_lock = threading.Lock()
+        self._dates = {}
+        self._times = {}
+        self.clear()
+
+    def clear(self):
+        self.total = 0
+        self.by_day = Counter()
+        self.by_day_dept = defaultdict(Counter)
+        self.by_day_host = defaultdict(Counter)
+        self.by_day_hour = defaultdict(lambda: [0] * 24)
+        self.dwell_all = [0] * (MAX_DWELL_MINUTES + 1)
+        self.dwell_by_day = defaultdict(lambda: [0] * (MAX_DWELL_MINUTES + 1))
+
+    # --- parsing (cached per distinct string) ---
+
+    def _date(self, value):
+        if value not in self._dates:
+            try: self._dates[value] = datetime.strptime(value, "%d-%m-%Y").date()
+            except (ValueError, TypeError): self._dates[value] = None
+        return self._dates[value]
+
+    def _minutes(self, value):
+        """'09:05 AM' -> minutes since midnight."""
+        if value not in self._times:
+            try:
+                t = datetime.strptime(value.strip(), "%I:%M %p")
+                self._times[value] = t.hour * 60 + t.minute
+            except (ValueError, TypeError, AttributeError):
+                self._times[value] = None
+        return self._times[value]
+
+    def _cell(self, row, col):
+        return row[col] if len(row) > col else ""
+
+    # --- incremental maintenance ---
+
+    def _apply(self, row, sign):
+        day = self._date(self._cell(row, self.date_col))
+        if day is None: return
+        self.total += sign
+        self.by_day[day] += sign
+        self.by_day_dept[day][self._cell(row, self.dept_col) or "-"] += sign
+        self.by_day_host[day][self._cell(row, self.host_col) or "-"] += sign
+
+        in_min = self._minutes(self._cell(row, self.in_col))
+        if in_min is not None:
+            self.by_day_hour[day][in_min // 60] += sign
+            out_min = self._minutes(self._cell(row, self.out_col))
+            if out_min is not None:
+                dwell = out_min - in_min
+                if dwell < 0: dwell += 24 * 60  # left after midnight
+                dwell = min(dwell, MAX_DWELL_MINUTES)
+                self.dwell_all[dwell] += sign
+                self.dwell_by_day[day][dwell] += sign
+
+    def on_append(self, row_number, row):
+        self._apply(row, 1)
+
+    def on_update(self, row_number, col, old_value, row):
+        if col - 1 not in (self.date_col, self.in_col, self.host_col, self.dept_col, self.out_col): return
+        old_row = list(row)
+        old_row[col - 1] = old_value
+        self._apply(old_row, -1)
+        self._apply(row, 1)
+
+    # --- archived visits ---
+
+    def _archived_stats(self):
+        """Counters for the archived visits (None without an archive), recounted when it changes."""
+        if self.archive is None: return None
+        with self._archived_lock:
+            if self._archived_version != self.archive.version:
+                version = self.archive.version
+                stats = VisitStats(self.date_col, self.in_col, self.host_col, self.dept_col, self.out_col)
+                cols = (self.date_col, self.in_col, self.host_col, self.dept_col, self.out_col)
+                for row in self.archive.scan(cols):
+                    stats._apply(row, 1)
+                self._archived, self._archived_version = stats, version
+            return self._archived
+
+    # --- queries ---
+
+    @staticmethod
+    def _percentiles(histogram, points=(50, 90, 95, 99)):
+        count = sum(histogram)
+        if not count:
+            return {'count': 0, **{f"p{p}": None for p in points}}
+        result = {'count': count}
+        targets = sorted((p, max(1, -(-count * p // 100))) for p in points)
+        seen, i = 0, 0
+        for minutes, n in enumerate(histogram):
+            seen += n
+            while i < len(targets) and seen >= targets[i][1]:
+                result[f"p{targets[i][0]}"] = minutes
+                i += 1
+            if i == len(targets): break
+        return result
+
+    @staticmethod
+    def _add_lists(*lists):
+        return [sum(values) for values in zip(*lists)]
+
+    def summary(self, day, top_hosts=10):
+        """Snapshot for one date (datetime.date)."""
+        archived = self._archived_stats()
+        with self._sync():
+            parts = [self] if archived is None else [self, archived]
+            depts, hosts = Counter(), Counter()
+            for part in parts:
+                if day in part.by_day_dept: depts.update(part.by_day_dept[day])
+                if day in part.by_day_host: hosts.update(part.by_day_host[day])
+            hours = [p.by_day_hour[day] for p in parts if day in p.by_day_hour]
+            dwell = [p.dwell_by_day[day] for p in parts if day in p.dwell_by_day]
+            return {
+                'date': day.isoformat(),
+                'total_entries': sum(p.total for p in parts),
+                'entries': sum(p.by_day.get(day, 0) for p in parts),
+                'by_department': dict(depts),
+                'by_host': dict(hosts.most_common(top_hosts)),
+                'by_hour': self._add_lists(*hours) if hours else [0] * 24,
+                'dwell_minutes': self._percentiles(self._add_lists(*dwell) if dwell else []),
+                'dwell_minutes_all_time': self._percentiles(self._add_lists(*[p.dwell_all for p in parts])),
+            }
+
+    def entries_on(self, day):
+        archived = self._archived_stats()
+        with self._sync():
+            return self.by_day.get(day, 0) + (archived.by_day.get(day, 0) if archived else 0)
+
+    def total_entries(self):
+        archived = self._archived_stats()
+        with self._sync():
+            return self.total + (archived.total if archived else 0)
@@ -1,35 +1,95 @@
 import io
 import os
+import re
 import json
+import threading
 import pytz # NEW: For Timezone
-from google.oauth2.credentials import Credentials
 from dotenv import load_dotenv
 load_dotenv()
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
 from datetime import datetime
+from instrumentation import InstrumentedDrive
+
+# The Google client libraries take about a second to import, so they are
+# loaded on the first upload instead of on every cold start.
 
 SCOPES = ['https://www.googleapis.com/auth/drive']
 
 # NEW: Define IST Timezone
 IST = pytz.timezone('Asia/Kolkata')
 
+DRIVE_HTTP_TIMEOUT = int(os.getenv('DRIVE_HTTP_TIMEOUT', '60'))
+
+# One set of credentials for the whole process (refreshed in place by google-auth)
+_creds = None
+_creds_lock = threading.Lock()
+
+# httplib2 connections are not thread-safe, so each worker thread keeps its own
+# long-lived service; its keep-alive connection is reused across uploads.
+_local = threading.local()
+_generation = 0
+
+# (root_folder_id, 'DD-MM-YYYY') -> daily folder id. The IST date is part of the
+# key, so the cache rolls over at midnight on its own.
+_folder_cache = {}
+_folder_lock = threading.Lock()
+
+# With several worker processes the first upload of the day is serialized
+# across all of them too (see worker_sync.py)
+SHARED_FOLDER_LOCK = os.path.join(os.getenv('GATEPASS_DATA_DIR', 'data'), 'drive_folder.lock') if os.getenv('GATEPASS_SHARED') == '1' else None
+
+def _load_credentials():
+    global _creds
+    with _creds_lock:
+        if _creds is not None: return _creds
+        from google.oauth2.credentials import Credentials
+
+        # 1. Try Loading from Environment Variable (Vercel Production)
+        if os.environ.get('GOOGLE_TOKEN'):
+            try:
+                token_info = json.loads(os.environ.get('GOOGLE_TOKEN'))
+                _creds = Credentials.from_authorized_user_info(token_info, SCOPES)
+            except Exception as e:
+                print(f"❌ Env Token Error: {e}")
+                return None
+
+        # 2. Try Loading from Local File (Local Development)
+        elif os.path.exists('token.json'):
+            _creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+
+        return _creds
+
 def authenticate_drive():
-    # 1. Try Loading from Environment Variable (Vercel Production)
-    if os.environ.get('GOOGLE_TOKEN'):
-        try:
-            token_info = json.loads(os.environ.get('GOOGLE_TOKEN'))
-            return build('drive', 'v3', credentials=Credentials.from_authorized_user_info(token_info, SCOPES))
-        except Exception as e:
-            print(f"❌ Env Token Error: {e}")
-            return None
-
-    # 2. Try Loading from Local File (Local Development)
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-        return build('drive', 'v3', credentials=creds)
-    
-    return None
+    """
+    Returns this thread's cached Drive service, building it on first use.
+    Expired access tokens are refreshed automatically by AuthorizedHttp.
+    """
+    import fake_google
+    if fake_google.enabled(): return InstrumentedDrive(fake_google.backend().drive())
+
+    service = getattr(_local, 'service', None)
+    if service is not None and getattr(_local, 'generation', None) == _generation: return service
+
+    creds = _load_credentials()
+    if not creds: return None
+
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build
+
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=DRIVE_HTTP_TIMEOUT))
+    service = InstrumentedDrive(build('drive', 'v3', http=http, cache_discovery=False))
+    _local.service = service
+    _local.generation = _generation
+    return service
+
+def reset_drive_service():
+    """Drop cached credentials/services/folders (e.g. after the token is replaced)."""
+    global _creds, _generation
+    with _creds_lock:
+        _creds = None
+        _generation += 1  # every thread rebuilds its service on next use
+    with _folder_lock:
+        _folder_cache.clear()
 
 def get_or_create_daily_folder(service, root_folder_id):
     """
@@ -43,6 +103,30 @@ def get_or_create_daily_folder(service, root_folder_id):
         print("⚠️ Warning: root_folder_id is Missing! Uploading to Drive Root.")
         return None
 
+    key = (root_folder_id, folder_name)
+    cached = _folder_cache.get(key)
+    if cached: return cached
+
+    # Serialize the first lookup of the day so concurrent uploads
+    # don't each create their own copy of the folder.
+    with _folder_lock:
+        cached = _folder_cache.get(key)
+        if cached: return cached
+
+        if SHARED_FOLDER_LOCK:
+            from worker_sync import file_lock
+            with file_lock(SHARED_FOLDER_LOCK):
+                folder_id = _find_or_create_folder(service, root_folder_id, folder_name)
+        else:
+            folder_id = _find_or_create_folder(service, root_folder_id, folder_name)
+        if folder_id != root_folder_id:
+            # Forget previous days, keep today's
+            for old_key in [k for k in _folder_cache if k[0] == root_folder_id]:
+                del _folder_cache[old_key]
+            _folder_cache[key] = folder_id
+        return folder_id
+
+def _find_or_create_folder(service, root_folder_id, folder_name):
     try:
         # Search for the folder
         query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and '{root_folder_id}' in parents and trashed=false"
@@ -80,6 +164,7 @@ def upload_photo_to_drive(image_bytes, filename, root_folder_id):
         if target_folder_id:
             file_metadata['parents'] = [target_folder_id]
         
+        from googleapiclient.http import MediaIoBaseUpload
         media = MediaIoBaseUpload(io.BytesIO(image_bytes), mimetype='image/jpeg')
         
         file = service.files().create(
@@ -87,18 +172,26 @@ def upload_photo_to_drive(image_bytes, filename, root_folder_id):
             media_body=media,
             fields='id, webViewLink'
         ).execute()
-        
-        # 3. Make Public (Reader)
-        try:
-            service.permissions().create(
-                fileId=file.get('id'),
-                body={'type': 'anyone', 'role': 'reader'}
-            ).execute()
-        except:
-            pass 
 
+        # The file stays private to the gate account: dashboards load it
+        # through /api/photo and /api/thumbnail instead of a public link
         return file.get('webViewLink')
 
     except Exception as e:
         print(f"❌ Drive Upload Error: {e}")
+        return None
+
+def drive_file_id(link):
+    """File id from a Drive link as stored in the Visitors sheet (None if it isn't one)."""
+    match = re.search(r"/d/([\w-]+)|[?&]id=([\w-]+)", str(link or ''))
+    return (match.group(1) or match.group(2)) if match else None
+
+def download_photo_from_drive(file_id):
+    """Bytes of a Drive file, or None if it can't be fetched."""
+    try:
+        service = authenticate_drive()
+        if not service: return None
+        return service.files().get_media(fileId=file_id).execute()
+    except Exception as e:
+        print(f"❌ Drive Download Error: {e}")
         return None
\ No newline at end of file
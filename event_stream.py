@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+EVENT_HISTORY = 1000
+HEARTBEAT_SECONDS = 15
+
+# Each open stream holds a server thread (gunicorn gthread has 8 per worker).
+# A stream is closed after SSE_MAX_SECONDS and the browser reconnects with
+# Last-Event-ID, so a thread is never held indefinitely. At most
+# SSE_MAX_CLIENTS streams are open per process; past that /api/events
+# answers 503 and the dashboard switches to long-polling.
+SSE_MAX_SECONDS = float(os.getenv('SSE_MAX_SECONDS', '300'))
+SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', '4'))
+
+
+class EventBroker:
+    """
+    In-process feed of gate events (visitor in/out, booking created/arrived).
+
+    Every event gets an increasing integer id. IDs start from the boot time in
+    milliseconds, so an id a client saw before a restart is still older than
+    anything published afterwards. Clients resume by sending their last-seen
+    id. If it has already dropped out of the history window, they get a
+    single 'reset' event telling them to reload their lists.
+
+    With several worker processes, attach() sends published events to a
+    shared sink instead, and each worker feeds what the sink holds back in
+    with deliver(), so every worker's clients see every event.
+    """
+
+    def __init__(self, history=EVENT_HISTORY, max_streams=SSE_MAX_CLIENTS):
+        self._events = deque(maxlen=history)
+        self._cond = threading.Condition()
+        self._next_id = int(time.time() * 1000)
+        self._sink = None
+        self.published = 0
+        self.max_streams = max_streams
+        self.open_streams = 0
+
+    def attach(self, sink, last_id):
+        """Route publish() through sink(event_type, data) -> id; deliver() brings events back."""
+        with self._cond:
+            self._sink = sink
+            self._next_id = last_id  # ids now come from the sink
+
+    def publish(self, event_type, data):
+        if self._sink:
+            self.published += 1
+            return self._sink(event_type, data)
+        with self._cond:
+            self._next_id += 1
+            self._events.append((self._next_id, event_type, data))
+            self.published += 1
+            self._cond.notify_all()
+            return self._next_id
+
+    def deliver(self, event_id, event_type, data):
+        """Add an event that was published elsewhere under the given id."""
+        with self._cond:
+            self._next_id = max(self._next_id, event_id)
+            self._events.append((event_id, event_type, data))
+            self._cond.notify_all()
+
+    def last_id(self):
+        with self._cond:
+            return self._events[-1][0] if self._events else self._next_id
+
+    def _since(self, last_id):
+        # Caller must hold self._cond
+        if last_id is None:
+            return []
+        if self._events and last_id < self._events[0][0] - 1:
+            return [(self._events[-1][0], 'reset', {})]
+        return [e for e in self._events if e[0] > last_id]
+
+    def wait(self, last_id, timeout):
+        """Events after last_id, blocking up to timeout seconds for the first one."""
+        with self._cond:
+            events = self._since(last_id)
+            if not events:
+                self._cond.wait(timeout)
+                events = self._since(last_id)
+            return events
+
+    def open_stream(self):
+        """Claim one of the max_streams slots; False when all are taken. Release with close_stream()."""
+        with self._cond:
+            if self.open_streams >= self.max_streams: return False
+            self.open_streams += 1
+            return True
+
+    def close_stream(self):
+        with self._cond:
+            self.open_streams = max(0, self.open_streams - 1)
+
+    def stream(self, last_id=None, heartbeat=HEARTBEAT_SECONDS, max_seconds=SSE_MAX_SECONDS):
+        """
+        Generator of Server-Sent Events text. Runs until the client
+        disconnects or max_seconds have passed (the browser then reconnects
+        from the last id it saw).
+        """
+        if last_id is None:
+            last_id = self.last_id()
+        deadline = time.monotonic() + max_seconds
+        yield "retry: 3000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: return
+            events = self.wait(last_id, min(heartbeat, remaining))
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event_id, event_type, data in events:
+                last_id = event_id
+                yield f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+def parse_event_id(value):
+    try: return int(value)
+    except (TypeError, ValueError): return None
+
+
+def parse_timeout(value, limit):
+    """A client's wait in seconds, clamped to [0, limit]; limit if it is missing or not a number."""
+    try: timeout = float(value)
+    except (TypeError, ValueError): return limit
+    if timeout != timeout: return limit  # nan
+    return min(max(timeout, 0.0), limit)
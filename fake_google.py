@@ -0,0 +1,336 @@
+import os
+import re
+import time
+import uuid
+import random
+import threading
+import contextvars
+from collections import Counter
+
+# In-memory stand-in for the Google Sheets / Drive APIs, selected with
+# GOOGLE_BACKEND=fake. Used for offline development and benchmark.py. The
+# real client libraries are only imported to raise their exception types.
+FAKE_LATENCY_MS = float(os.getenv('FAKE_GOOGLE_LATENCY_MS', '0'))
+FAKE_ERROR_RATE = float(os.getenv('FAKE_GOOGLE_ERROR_RATE', '0'))
+
+DEFAULT_HEADERS = {
+    "Users": ["Email", "Role", "Name", "Department"],
+    "Visitors": ["Date", "In Time", "Mobile", "Name", "Designation", "Company", "Laptop",
+                 "To Meet", "Department", "Photo", "Out Time", "Security", "Vehicle", "Pass ID"],
+    "Bookings": ["Booked At", "Booked By", "Host", "Department", "Mobile", "Name",
+                 "Purpose", "Status", "Company", "Vehicle"],
+}
+
+
+class _QuotaResponse:
+    """Just enough of a requests.Response for gspread's APIError."""
+    status_code = 429
+    text = "Quota exceeded"
+
+    def json(self):
+        return {'error': {'code': 429, 'message': 'Quota exceeded for quota metric (fake)', 'status': 'RESOURCE_EXHAUSTED'}}
+
+
+class _BadRequestResponse:
+    status_code = 400
+
+    def __init__(self, message):
+        self.text = message
+
+    def json(self):
+        return {'error': {'code': 400, 'message': self.text, 'status': 'INVALID_ARGUMENT'}}
+
+
+class FakeGoogle:
+    """
+    Shared state for the fake APIs: worksheet data, Drive files and call
+    counters. Every API call sleeps for the configured latency (+/- 50%
+    jitter) and fails with a 429 at the configured error rate.
+    """
+
+    def __init__(self, latency_ms=FAKE_LATENCY_MS, error_rate=FAKE_ERROR_RATE):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+        # A mutable box per thread, shared with the calls it fans out (fanout.py runs them in a copy of its context)
+        self._request_calls = contextvars.ContextVar(f'fake_google_calls_{id(self)}', default=None)
+        self.sheets = {name: [list(header)] for name, header in DEFAULT_HEADERS.items()}
+        self.files = {}
+
+    def configure(self, latency_ms=None, error_rate=None):
+        if latency_ms is not None: self.latency_ms = latency_ms
+        if error_rate is not None: self.error_rate = error_rate
+
+    def call(self, api, method):
+        """Account for one upstream request; raises the API's own quota error."""
+        name = f"{api}.{method}"
+        counter = self._call_counter()
+        with self._lock:
+            self.calls[name] += 1
+            counter[0] += 1
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms * random.uniform(0.5, 1.5) / 1000)
+        if self.error_rate > 0 and random.random() < self.error_rate:
+            with self._lock:
+                self.errors[name] += 1
+            if api == 'drive':
+                import httplib2
+                from googleapiclient.errors import HttpError
+                raise HttpError(httplib2.Response({'status': 429}), b'{"error": {"code": 429, "message": "Rate limit exceeded (fake)"}}')
+            from gspread.exceptions import APIError
+            raise APIError(_QuotaResponse())
+
+    def _call_counter(self):
+        box = self._request_calls.get()
+        if box is None:
+            box = [0]
+            self._request_calls.set(box)
+        return box
+
+    def thread_calls(self):
+        """Upstream calls made so far by the current thread, including those it fanned out."""
+        return self._call_counter()[0]
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def stats(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'errors': dict(self.errors)}
+
+    def client(self):
+        return FakeClient(self)
+
+    def drive(self):
+        return FakeDriveService(self)
+
+
+# --- Sheets ---
+
+class FakeClient:
+    """Replaces the client returned by gspread.authorize()."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_by_key(self, key):
+        self.backend.call('sheets', 'open')
+        return FakeSpreadsheet(self.backend)
+
+    def open(self, title):
+        return self.open_by_key(title)
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def worksheet(self, name):
+        self.backend.call('sheets', 'worksheet')
+        if name not in self.backend.sheets:
+            from gspread.exceptions import WorksheetNotFound
+            raise WorksheetNotFound(name)
+        return FakeWorksheet(self.backend, name)
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        self.backend.call('sheets', 'add_worksheet')
+        with self.backend._lock:
+            if title in self.backend.sheets:
+                from gspread.exceptions import APIError
+                raise APIError(_BadRequestResponse(f'A sheet with the name "{title}" already exists.'))
+            self.backend.sheets[title] = []
+        return FakeWorksheet(self.backend, title)
+
+
+class FakeWorksheet:
+    """The subset of gspread.Worksheet the app uses, backed by a list of rows."""
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.title = name
+
+    @property
+    def _rows(self):
+        return self.backend.sheets[self.title]
+
+    def _call(self, method):
+        self.backend.call('sheets', method)
+
+    # --- reads ---
+
+    def get_all_values(self):
+        self._call('get_all_values')
+        with self.backend._lock:
+            width = max((len(r) for r in self._rows), default=0)
+            return [list(r) + [""] * (width - len(r)) for r in self._rows]
+
+    def row_values(self, row_number):
+        self._call('row_values')
+        with self.backend._lock:
+            return list(self._rows[row_number - 1]) if row_number <= len(self._rows) else []
+
+    def col_values(self, col):
+        self._call('col_values')
+        with self.backend._lock:
+            values = [r[col - 1] if len(r) >= col else "" for r in self._rows]
+        while values and not values[-1]: values.pop()
+        return values
+
+    def cell(self, row_number, col):
+        from gspread.cell import Cell
+        self._call('cell')
+        with self.backend._lock:
+            row = self._rows[row_number - 1] if row_number <= len(self._rows) else []
+            return Cell(row_number, col, row[col - 1] if len(row) >= col else "")
+
+    def findall(self, value):
+        from gspread.cell import Cell
+        self._call('findall')
+        with self.backend._lock:
+            return [Cell(r, c, v) for r, row in enumerate(self._rows, start=1)
+                    for c, v in enumerate(row, start=1) if v == str(value)]
+
+    def find(self, value):
+        from gspread.cell import Cell
+        self._call('find')
+        with self.backend._lock:
+            for r, row in enumerate(self._rows, start=1):
+                for c, v in enumerate(row, start=1):
+                    if v == str(value): return Cell(r, c, v)
+        return None
+
+    # --- writes ---
+
+    def append_rows(self, rows, **kwargs):
+        self._call('append_rows')
+        with self.backend._lock:
+            self._rows.extend([["" if v is None else str(v) for v in row] for row in rows])
+            return self._appended(len(rows), max((len(r) for r in rows), default=1))
+
+    def append_row(self, row, **kwargs):
+        self._call('append_row')
+        with self.backend._lock:
+            self._rows.append(["" if v is None else str(v) for v in row])
+            return self._appended(1, len(row))
+
+    def _appended(self, count, width):
+        # Caller must hold backend._lock. The values.append response, as gspread returns it.
+        from gspread.utils import rowcol_to_a1
+        end = len(self._rows)
+        updated = f"{self.title}!A{end - count + 1}:{rowcol_to_a1(end, max(width, 1))}"
+        return {'updates': {'updatedRange': updated, 'updatedRows': count}}
+
+    def update_cell(self, row_number, col, value):
+        self._call('update_cell')
+        with self.backend._lock:
+            self._set(row_number, col, value)
+
+    def batch_update(self, data, **kwargs):
+        from gspread.utils import a1_to_rowcol
+        self._call('batch_update')
+        with self.backend._lock:
+            for item in data:
+                top, left = a1_to_rowcol(item['range'].split(':')[0])
+                for dr, values in enumerate(item['values']):
+                    for dc, value in enumerate(values):
+                        self._set(top + dr, left + dc, value)
+
+    def delete_rows(self, start_index, end_index=None):
+        self._call('delete_rows')
+        with self.backend._lock:
+            del self._rows[start_index - 1:(end_index or start_index)]
+
+    def _set(self, row_number, col, value):
+        # Caller must hold backend._lock
+        while len(self._rows) < row_number: self._rows.append([])
+        row = self._rows[row_number - 1]
+        while len(row) < col: row.append("")
+        row[col - 1] = "" if value is None else str(value)
+
+
+# --- Drive ---
+
+class _Request:
+    def __init__(self, backend, method, fn):
+        self.backend = backend
+        self.method = method
+        self.fn = fn
+
+    def execute(self):
+        self.backend.call('drive', self.method)
+        return self.fn()
+
+
+class FakeDriveService:
+    """Replaces build('drive', 'v3', ...): files() and permissions() only."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def files(self):
+        return _FakeFiles(self.backend)
+
+    def permissions(self):
+        return _FakePermissions(self.backend)
+
+
+class _FakeFiles:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def list(self, q='', fields=None, **kwargs):
+        def run():
+            # Only the daily-folder lookup is issued by the app: match on name and parent
+            name = re.search(r"name='([^']*)'", q)
+            parent = re.search(r"'([^']*)' in parents", q)
+            name, parent = name and name.group(1), parent and parent.group(1)
+            with self.backend._lock:
+                found = [{'id': fid} for fid, f in self.backend.files.items()
+                         if f['name'] == name and (parent is None or parent in f['parents'])]
+            return {'files': found}
+        return _Request(self.backend, 'files.list', run)
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        def run():
+            fid = uuid.uuid4().hex
+            size = media_body.size() if media_body is not None else 0
+            content = media_body.getbytes(0, size) if size else b""
+            with self.backend._lock:
+                self.backend.files[fid] = {'name': body.get('name'), 'parents': body.get('parents', []), 'size': size,
+                                           'content': content}
+            return {'id': fid, 'webViewLink': f"https://drive.google.com/file/d/{fid}/view"}
+        return _Request(self.backend, 'files.create', run)
+
+    def get_media(self, fileId=None, **kwargs):
+        def run():
+            with self.backend._lock:
+                if fileId not in self.backend.files: raise FileNotFoundError(f"File not found: {fileId}")
+                return self.backend.files[fileId].get('content', b"")
+        return _Request(self.backend, 'files.get_media', run)
+
+
+class _FakePermissions:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def create(self, fileId=None, body=None, **kwargs):
+        return _Request(self.backend, 'permissions.create', lambda: {'id': 'anyoneWithLink'})
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def backend():
+    """The process-wide fake (created on first use)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None: _backend = FakeGoogle()
+        return _backend
+
+
+def enabled():
+    return os.getenv('GOOGLE_BACKEND', 'google').lower() == 'fake'
@@ -0,0 +1,61 @@
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# Upstream calls (Sheets / Drive) one process makes at the same time on behalf
+# of requests. Independent calls in a request overlap, so it waits for the
+# slowest of them rather than their sum; the bound keeps a burst of requests
+# from multiplying into a burst against the API quota.
+UPSTREAM_FANOUT = int(os.getenv('UPSTREAM_FANOUT', '4'))
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def _mark_pool_thread():
+    _local.in_pool = True
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=UPSTREAM_FANOUT, thread_name_prefix='upstream',
+                                           initializer=_mark_pool_thread)
+    return _pool
+
+
+def fan_out(*calls):
+    """
+    Run independent zero-argument calls concurrently and return their results
+    in order. None entries are skipped (their result is None). The first call
+    runs in the caller's thread, the rest on the shared pool, each in a copy
+    of the caller's context. Once all have finished, the first exception
+    raised (in argument order) is re-raised.
+    """
+    jobs = [(i, call) for i, call in enumerate(calls) if call is not None]
+    results = [None] * len(calls)
+    if len(jobs) < 2 or UPSTREAM_FANOUT <= 0 or getattr(_local, 'in_pool', False):
+        # Nothing to overlap, or already on a pool thread (waiting on the pool from it could deadlock)
+        for i, call in jobs: results[i] = call()
+        return results
+
+    pool = _get_pool()
+    futures = [(i, pool.submit(contextvars.copy_context().run, call)) for i, call in jobs[1:]]
+    first_index, first_call = jobs[0]
+    errors = []
+    try:
+        results[first_index] = first_call()
+    except Exception as e:
+        errors.append((first_index, e))
+    for i, future in futures:
+        try:
+            results[i] = future.result()
+        except Exception as e:
+            errors.append((i, e))
+    if errors:
+        raise min(errors, key=lambda item: item[0])[1]
+    return results
@@ -0,0 +1,33 @@
+# Production server for the gate PC / campus server:
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# One worker process per core, each with a pool of threads. With more than
+# one worker the app serves from the shared local SQLite database, whose
+# change log keeps every worker's caches identical; one elected worker
+# mirrors writes to the Google Sheet (see worker_sync.py).
+import os
+import multiprocessing
+
+workers = int(os.getenv('GATEPASS_WORKERS', str(multiprocessing.cpu_count())))
+threads = int(os.getenv('GATEPASS_THREADS', '8'))
+worker_class = 'gthread'
+bind = os.getenv('GATEPASS_BIND', '0.0.0.0:8000')
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# Each worker imports the app itself: SQLite connections and background
+# threads must not be carried across fork()
+preload_app = False
+
+if workers > 1:
+    os.environ['GATEPASS_SHARED'] = '1'
+    os.environ.setdefault('STORAGE_BACKEND', 'sqlite')
+
+
+def post_worker_init(worker):
+    # Connect now rather than on the first request, so the leader election
+    # (and with it the Sheet mirror) doesn't wait for traffic
+    import app
+    app.ensure_db()
@@ -0,0 +1,214 @@
+import io
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; photos are then uploaded untouched
+    Image = None
+
+PHOTO_MAX_DIMENSION = int(os.getenv('PHOTO_MAX_DIMENSION', '800'))
+PHOTO_JPEG_QUALITY = int(os.getenv('PHOTO_JPEG_QUALITY', '75'))
+THUMBNAIL_SIZE = int(os.getenv('PHOTO_THUMB_SIZE', '160'))
+THUMBNAIL_QUALITY = int(os.getenv('PHOTO_THUMB_QUALITY', '70'))
+THUMBNAIL_MEMORY_ITEMS = int(os.getenv('PHOTO_THUMB_MEMORY_ITEMS', '500'))
+# On-disk thumbnail cache; least recently used thumbnails go first past this size
+THUMBNAIL_DISK_BYTES = int(float(os.getenv('PHOTO_THUMB_CACHE_MB', '200')) * 1024 * 1024)
+
+ProcessedPhoto = namedtuple('ProcessedPhoto', ['data', 'thumbnail', 'original_bytes', 'saved_bytes'])
+
+
+def _encode_jpeg(img, quality):
+    out = io.BytesIO()
+    # Saving without exif=/icc_profile= drops camera metadata
+    img.save(out, format='JPEG', quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _to_rgb(img):
+    img = ImageOps.exif_transpose(img)  # honour orientation before the tag is dropped
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+class PhotoStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.skipped = 0
+        self.original_bytes = 0
+        self.output_bytes = 0
+
+    def record(self, original, output, skipped=False):
+        with self._lock:
+            if skipped: self.skipped += 1
+            else: self.processed += 1
+            self.original_bytes += original
+            self.output_bytes += output
+
+    def as_dict(self):
+        with self._lock:
+            saved = self.original_bytes - self.output_bytes
+            return {
+                'enabled': Image is not None,
+                'processed': self.processed,
+                'skipped': self.skipped,
+                'original_bytes': self.original_bytes,
+                'output_bytes': self.output_bytes,
+                'saved_bytes': saved,
+                'saved_ratio': round(saved / self.original_bytes, 3) if self.original_bytes else None,
+            }
+
+
+photo_stats = PhotoStats()
+
+
+def process_photo(image_bytes, max_dimension=PHOTO_MAX_DIMENSION, quality=PHOTO_JPEG_QUALITY):
+    """
+    Downscale, re-encode and strip metadata from a webcam capture, and build
+    a small thumbnail. Falls back to the original bytes (and no thumbnail) if
+    Pillow is missing or the image can't be decoded.
+    """
+    original = len(image_bytes)
+    if Image is None:
+        photo_stats.record(original, original, skipped=True)
+        return ProcessedPhoto(image_bytes, None, original, 0)
+
+    try:
+        img = _to_rgb(Image.open(io.BytesIO(image_bytes)))
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        data = _encode_jpeg(img, quality)
+
+        thumb = img.copy()
+        thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        thumbnail = _encode_jpeg(thumb, THUMBNAIL_QUALITY)
+    except Exception as e:
+        print(f"⚠️ Image Processing Error: {e}")
+        photo_stats.record(original, original, skipped=True)
+        return ProcessedPhoto(image_bytes, None, original, 0)
+
+    # Already-small captures can grow when re-encoded; keep whichever is smaller
+    if len(data) >= original:
+        data = image_bytes
+
+    photo_stats.record(original, len(data))
+    return ProcessedPhoto(data, thumbnail, original, original - len(data))
+
+
+def make_thumbnail(image_bytes):
+    """Thumbnail of a stored photo (e.g. one fetched back from Drive), or None without Pillow."""
+    if Image is None: return None
+    try:
+        img = _to_rgb(Image.open(io.BytesIO(image_bytes)))
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        return _encode_jpeg(img, THUMBNAIL_QUALITY)
+    except Exception as e:
+        print(f"⚠️ Thumbnail Error: {e}")
+        return None
+
+
+class ThumbnailStore:
+    """
+    Small in-memory LRU of recent thumbnails, keyed by pass id (sheet row).
+    With a directory, thumbnails are also written there so other worker
+    processes (and restarts) can serve them. The directory is an LRU too:
+    a read touches the file's mtime, and once the files add up to more than
+    max_bytes the oldest are deleted.
+    """
+
+    def __init__(self, max_items=THUMBNAIL_MEMORY_ITEMS, directory=None, max_bytes=THUMBNAIL_DISK_BYTES):
+        self.max_items = max_items
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self.hits = self.misses = self.evicted = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._files())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.jpg")
+
+    def put(self, key, data):
+        if not data: return
+        self._remember(key, data)
+        if self.directory:
+            path = self._path(key)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            try:
+                replaced = os.path.getsize(path) if os.path.exists(path) else 0
+                with open(tmp, 'wb') as f: f.write(data)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"⚠️ Could not save thumbnail {key}: {e}")
+                return
+            with self._lock:
+                self._disk_bytes += len(data) - replaced
+                over = self._disk_bytes > self.max_bytes
+            if over: self._evict()
+
+    def _files(self):
+        # (path, size, mtime) of every cached thumbnail
+        found = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.jpg'): continue
+                try: st = entry.stat()
+                except OSError: continue
+                found.append((entry.path, st.st_size, st.st_mtime))
+        return found
+
+    def _evict(self):
+        # Other workers write here too, so the total is re-counted from the directory
+        files = sorted(self._files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9  # some headroom, so one put doesn't rescan every time
+        removed = 0
+        for path, size, _ in files:
+            if total <= target: break
+            try: os.remove(path)
+            except OSError: continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.evicted += removed
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._items[key] = data
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None: self._items.move_to_end(key)
+        if self.directory:
+            try:
+                if data is None:
+                    with open(self._path(key), 'rb') as f: data = f.read()
+                    self._remember(key, data)
+                os.utime(self._path(key))  # recently used: evicted last
+            except OSError:
+                pass
+        with self._lock:
+            if data is None: self.misses += 1
+            else: self.hits += 1
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_items': len(self._items),
+                'disk_bytes': self._disk_bytes,
+                'max_disk_bytes': self.max_bytes if self.directory else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evicted': self.evicted,
+            }
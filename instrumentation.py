@@ -0,0 +1,319 @@
+import os
+import io
+import time
+import random
+import pstats
+import cProfile
+import threading
+import contextvars
+from collections import defaultdict
+
+# Opt-in sampling profiler: comma-separated route rules (or '*') and the
+# fraction of their requests to run under cProfile.
+PROFILE_ROUTES = {r.strip() for r in os.getenv('PROFILE_ROUTES', '').split(',') if r.strip()}
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0.05'))
+
+# Request duration histogram buckets (seconds)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upstream calls made outside a request (flusher, upload workers) are filed here
+BACKGROUND = 'background'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+class _RequestState:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.route = None
+        self.upstream = defaultdict(lambda: [0, 0.0])  # api -> [calls, seconds]
+
+
+class Metrics:
+    """
+    Process-wide counters for requests and upstream (Sheets / Drive / SQLite)
+    calls. Upstream calls are attributed to the route of the request they
+    were made for, so each response can report what it cost. The request is
+    tracked in a ContextVar rather than per thread, so calls fanned out to
+    the upstream pool (fanout.py runs them in a copy of the caller's
+    context) still count towards it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._request = contextvars.ContextVar(f'metrics_request_{id(self)}', default=None)
+        self.requests = defaultdict(int)                  # (route, method, status) -> n
+        self.request_seconds = defaultdict(float)         # route -> sum
+        self.request_buckets = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))
+        self.upstream_calls = defaultdict(int)            # (route, api, method) -> n
+        self.upstream_seconds = defaultdict(float)        # (route, api, method) -> sum
+        self.upstream_errors = defaultdict(int)           # (api, method) -> n
+        self._gauges = []
+
+    # --- per-request context ---
+
+    def start_request(self):
+        self._request.set(_RequestState())
+
+    def set_route(self, route):
+        state = self._request.get()
+        if state is not None: state.route = route
+
+    def current_route(self):
+        state = self._request.get()
+        return (state.route if state is not None else None) or BACKGROUND
+
+    def finish_request(self, method, status):
+        """Record the request; returns (seconds, {api: [calls, seconds]}) for headers."""
+        state = self._request.get()
+        if state is None: return None, {}
+        self._request.set(None)
+        elapsed = time.perf_counter() - state.started
+        route = state.route or BACKGROUND
+        with self._lock:
+            upstream = {api: list(v) for api, v in state.upstream.items()}
+            state.route = None  # fanned-out calls still running now count as background
+            state.upstream = None
+            self.requests[(route, method, status)] += 1
+            self.request_seconds[route] += elapsed
+            buckets = self.request_buckets[route]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if elapsed <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+        return elapsed, upstream
+
+    # --- upstream calls ---
+
+    def record_call(self, api, method, seconds, failed=False):
+        state = self._request.get()
+        with self._lock:
+            # Under the lock: calls fanned out from one request land here from several threads
+            route = (state.route if state is not None else None) or BACKGROUND
+            self.upstream_calls[(route, api, method)] += 1
+            self.upstream_seconds[(route, api, method)] += seconds
+            if failed: self.upstream_errors[(api, method)] += 1
+            if state is not None and state.upstream is not None:
+                state.upstream[api][0] += 1
+                state.upstream[api][1] += seconds
+
+    def timed(self, api, method, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_call(api, method, time.perf_counter() - start, failed=True)
+            raise
+        self.record_call(api, method, time.perf_counter() - start)
+        return result
+
+    # --- export ---
+
+    def add_gauge(self, name, help_text, fn):
+        """fn() returns a number, or a {label_value: number} dict labelled 'name'."""
+        self._gauges.append((name, help_text, fn))
+
+    def prometheus(self):
+        """Prometheus text exposition format."""
+        out = []
+        with self._lock:
+            out += ["# HELP gatepass_requests_total HTTP requests by route, method and status.",
+                    "# TYPE gatepass_requests_total counter"]
+            for (route, method, status), n in sorted(self.requests.items()):
+                out.append(f"gatepass_requests_total{{{_labels(route=route, method=method, status=status)}}} {n}")
+
+            out += ["# HELP gatepass_request_duration_seconds Time spent handling requests.",
+                    "# TYPE gatepass_request_duration_seconds histogram"]
+            for route, buckets in sorted(self.request_buckets.items()):
+                seen = 0
+                for bound, n in zip(DURATION_BUCKETS, buckets):
+                    seen += n
+                    out.append(f"gatepass_request_duration_seconds_bucket{{{_labels(route=route, le=bound)}}} {seen}")
+                seen += buckets[-1]
+                out.append(f"gatepass_request_duration_seconds_bucket{{{_labels(route=route, le='+Inf')}}} {seen}")
+                out.append(f"gatepass_request_duration_seconds_sum{{{_labels(route=route)}}} {self.request_seconds[route]:.6f}")
+                out.append(f"gatepass_request_duration_seconds_count{{{_labels(route=route)}}} {seen}")
+
+            out += ["# HELP gatepass_upstream_calls_total Calls to Sheets / Drive / SQLite by the route that made them.",
+                    "# TYPE gatepass_upstream_calls_total counter"]
+            for (route, api, method), n in sorted(self.upstream_calls.items()):
+                out.append(f"gatepass_upstream_calls_total{{{_labels(route=route, api=api, method=method)}}} {n}")
+
+            out += ["# HELP gatepass_upstream_seconds_total Time spent waiting on upstream calls.",
+                    "# TYPE gatepass_upstream_seconds_total counter"]
+            for (route, api, method), s in sorted(self.upstream_seconds.items()):
+                out.append(f"gatepass_upstream_seconds_total{{{_labels(route=route, api=api, method=method)}}} {s:.6f}")
+
+            out += ["# HELP gatepass_upstream_errors_total Upstream calls that raised.",
+                    "# TYPE gatepass_upstream_errors_total counter"]
+            for (api, method), n in sorted(self.upstream_errors.items()):
+                out.append(f"gatepass_upstream_errors_total{{{_labels(api=api, method=method)}}} {n}")
+
+        for name, help_text, fn in self._gauges:
+            try: value = fn()
+            except Exception: continue
+            out += [f"# HELP gatepass_{name} {help_text}", f"# TYPE gatepass_{name} gauge"]
+            if isinstance(value, dict):
+                for key, v in sorted(value.items()):
+                    out.append(f"gatepass_{name}{{{_labels(name=key)}}} {v}")
+            else:
+                out.append(f"gatepass_{name} {value}")
+        return "\n".join(out) + "\n"
+
+
+metrics = Metrics()
+
+
+def server_timing(elapsed, upstream):
+    """Server-Timing header value: total plus time spent per upstream API."""
+    parts = [f"app;dur={elapsed * 1000:.1f}"]
+    for api, (calls, seconds) in sorted(upstream.items()):
+        parts.append(f'{api};desc="{calls} calls";dur={seconds * 1000:.1f}')
+    return ", ".join(parts)
+
+
+# --- Proxies ---
+
+class InstrumentedWorksheet:
+    """Wraps a worksheet-like object; every method call is timed as one upstream call."""
+
+    def __init__(self, ws, api='sheets'):
+        self._ws = ws
+        self._api = api
+
+    def __getattr__(self, name):
+        attr = getattr(self._ws, name)
+        if not callable(attr) or name.startswith('_'): return attr
+        def call(*args, **kwargs):
+            return metrics.timed(self._api, name, attr, *args, **kwargs)
+        return call
+
+    @property
+    def unwrapped(self):
+        return self._ws
+
+
+class InstrumentedDrive:
+    """
+    Wraps a googleapiclient Drive service. Only .execute() goes over the
+    network, so that is what gets timed, named after the resource path
+    (e.g. 'files.create').
+    """
+
+    def __init__(self, target, path=''):
+        self._target = target
+        self._path = path
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr): return attr
+        if name == 'execute':
+            return lambda *a, **kw: metrics.timed('drive', self._path or 'execute', attr, *a, **kw)
+        path = f"{self._path}.{name}" if self._path else name
+        return lambda *a, **kw: InstrumentedDrive(attr(*a, **kw), path)
+
+
+# --- Sampling profiler ---
+
+class SamplingProfiler:
+    """
+    Runs a sampled fraction of requests to the chosen routes under cProfile and
+    merges the results per route. Only one request is profiled at a time, since
+    Python allows a single active profiler.
+    """
+
+    def __init__(self, routes=PROFILE_ROUTES, rate=PROFILE_SAMPLE_RATE):
+        self.routes = set(routes)
+        self.rate = rate
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.samples = defaultdict(int)
+
+    @property
+    def enabled(self):
+        return bool(self.routes) and self.rate > 0
+
+    def should_sample(self, route):
+        return self.enabled and ('*' in self.routes or route in self.routes) and random.random() < self.rate
+
+    def start(self):
+        """Returns a running profiler, or None if another request holds it."""
+        if not self._busy.acquire(blocking=False): return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # some other tool is already profiling
+            self._busy.release()
+            return None
+        return profiler
+
+    def stop(self, profiler, route):
+        try:
+            profiler.disable()
+        finally:
+            self._busy.release()
+        with self._lock:
+            if route in self._stats: self._stats[route].add(profiler)
+            else: self._stats[route] = pstats.Stats(profiler)
+            self.samples[route] += 1
+
+    def report(self, route=None, limit=30, sort='cumulative'):
+        """Top functions for one route (or every route) as text."""
+        with self._lock:
+            routes = [route] if route else sorted(self._stats)
+            out = io.StringIO()
+            for r in routes:
+                stats = self._stats.get(r)
+                if stats is None: continue
+                out.write(f"=== {r} ({self.samples[r]} sampled requests) ===\n")
+                stats.stream = out
+                stats.sort_stats(sort).print_stats(limit)
+            return out.getvalue()
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.samples.clear()
+
+
+profiler = SamplingProfiler()
+
+
+def init_app(app):
+    """Hook request timing, Server-Timing and the sampling profiler into a Flask app."""
+    from flask import request, g
+
+    @app.before_request
+    def _start_request():
+        metrics.start_request()
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.set_route(route)
+        g.profile = profiler.start() if profiler.should_sample(route) else None
+
+    @app.after_request
+    def _finish_request(response):
+        if getattr(g, 'profile', None) is not None:
+            profiler.stop(g.profile, metrics.current_route())
+            g.profile = None
+        elapsed, upstream = metrics.finish_request(request.method, response.status_code)
+        if elapsed is not None:
+            response.headers['Server-Timing'] = server_timing(elapsed, upstream)
+        return response
+
+    @app.teardown_request
+    def _abort_request(exc):
+        # after_request is skipped when a view raises; don't leak the profiler or the context
+        if getattr(g, 'profile', None) is not None:
+            profiler.stop(g.profile, metrics.current_route())
+            g.profile = None
+        if exc is not None:
+            metrics.finish_request(request.method, 500)
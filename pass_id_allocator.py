@@ -0,0 +1,131 @@
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def _file_lock(f):
+    """Exclusive lock on an open file, held across processes."""
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try: yield
+        finally: fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try: yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class PassIdAllocator:
+    """
+    Hands out unique, strictly increasing pass IDs.
+
+    The high-water mark lives in a small file that every worker process locks
+    while bumping it, so two gates checking in at the same moment never get the
+    same number, and restarts carry on where they left off. floor_fn() returns
+    the highest ID already present in the data; it guards against the file
+    being lost (e.g. a wiped /tmp) without reading the Sheet column.
+    """
+
+    def __init__(self, path, floor_fn=None):
+        self.path = path
+        self.floor_fn = floor_fn
+        self._lock = threading.Lock()
+        self.allocated = 0
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return os.fdopen(fd, 'r+')
+
+    def _read(self, f):
+        f.seek(0)
+        try: return int(f.read().strip() or 0)
+        except ValueError: return 0
+
+    def _write(self, f, value):
+        f.seek(0)
+        f.truncate()
+        f.write(str(value))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def allocate(self):
+        floor = self.floor_fn() if self.floor_fn else 0
+        with self._lock, self._open() as f, _file_lock(f):
+            next_id = max(self._read(f), floor) + 1
+            self._write(f, next_id)
+            self.allocated += 1
+            return next_id
+
+    def peek(self):
+        """Last ID handed out (without reserving a new one)."""
+        floor = self.floor_fn() if self.floor_fn else 0
+        with self._lock, self._open() as f, _file_lock(f):
+            return max(self._read(f), floor)
+
+
+class SheetPassIds:
+    """
+    Pass IDs for instances that share no disk (serverless), where a file
+    can't be the high-water mark. Each allocation appends one row to a
+    worksheet kept for the purpose, and Sheets reports back the row it
+    landed on; appends are applied one at a time, so no other instance can
+    get the same row. The ID is that row number plus the base stored in the
+    sheet's first row, which floor_fn() sets when the sheet is created.
+    Rows must never be deleted from that sheet.
+
+    One append per check-in and no reads, except the base once per process.
+    """
+
+    SHEET = "PassIds"
+
+    def __init__(self, storage, floor_fn, wrap=None):
+        self.storage = storage  # a SheetsStorage
+        self.floor_fn = floor_fn
+        self.wrap = wrap or (lambda ws: ws)
+        self._ws = None
+        self._base = None
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.last = 0
+
+    def _open(self):
+        with self._lock:
+            if self._ws is None:
+                self._ws = self.wrap(self.storage.ensure_worksheet(self.SHEET, ["Pass ID base", str(self.floor_fn())]))
+            if self._base is None:
+                header = self._ws.row_values(1)
+                try: self._base = int(header[1])
+                except (IndexError, ValueError):
+                    # Just created by another instance, which has not written the base yet
+                    raise RuntimeError(f"'{self.SHEET}' sheet has no base in row 1 yet")
+            return self._ws
+
+    def allocate(self):
+        ws = self._open()
+        result = ws.append_row([datetime.now(timezone.utc).isoformat(timespec='seconds')],
+                               value_input_option='RAW', insert_data_option='INSERT_ROWS', table_range='A1')
+        match = re.search(r"![A-Z]+(\d+)", (result or {}).get('updates', {}).get('updatedRange', ''))
+        if not match: raise RuntimeError(f"'{self.SHEET}' append did not report its row")
+        pass_id = self._base + int(match.group(1)) - 1
+        with self._lock:
+            self.allocated += 1
+            self.last = max(self.last, pass_id)
+        return pass_id
+
+    def peek(self):
+        """Last ID known to be handed out (without reserving or reading anything)."""
+        return max(self.floor_fn(), self.last)
+
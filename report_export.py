@@ -0,0 +1,104 @@
+import io
+import os
+import csv
+import json
+import zlib
+import tempfile
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # listed in requirements.txt; without it the dashboard offers CSV only
+    Workbook = None
+
+CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def available_formats():
+    """Formats export_stream can produce in this install."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'xlsx' or Workbook is not None]
+
+
+def iter_csv(header, rows):
+    """Yield the CSV in ~64 KB chunks as rows arrive, never holding the whole file."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= CHUNK_SIZE:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def iter_ndjson(header, rows):
+    """One JSON object per line, keyed by the sheet header."""
+    keys = [h or f"col_{i + 1}" for i, h in enumerate(header)]
+    chunk = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(keys, row)), ensure_ascii=False) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
+
+
+def iter_xlsx(header, rows):
+    """
+    XLSX is a zip archive, so it can't be emitted row by row. openpyxl's
+    write-only mode keeps memory flat while the file is built on disk; the
+    finished file is then streamed in chunks and deleted.
+    """
+    if Workbook is None:
+        raise RuntimeError("XLSX export needs the 'openpyxl' package")
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Visitors")
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(path)
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data: break
+                yield data
+    finally:
+        os.remove(path)
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data: yield data
+    yield compressor.flush()
+
+
+def export_stream(fmt, header, rows, gzip=False):
+    """Returns (chunk generator, mimetype, file extension) for the requested format."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}'")
+    if fmt == 'xlsx' and Workbook is None:
+        raise ValueError("XLSX export is not available (install openpyxl)")
+
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    chunks = {'csv': iter_csv, 'ndjson': iter_ndjson, 'xlsx': iter_xlsx}[fmt](header, rows)
+    if gzip:
+        return iter_gzip(chunks), 'application/gzip', ext + '.gz'
+    return chunks, mimetype, ext
@@ -0,0 +1,487 @@
+import os
+import gzip
+import json
+import time
+import threading
+
+from fanout import fan_out
+
+# How long a cached copy of a worksheet is trusted before it is re-downloaded.
+# Our own writes are applied to the cache immediately, so the TTL only bounds
+# how stale edits made directly in the Sheet (or by another instance) can be.
+# An expired copy keeps serving while its replacement downloads in the
+# background, so requests never wait on Sheets once a worksheet is loaded.
+DEFAULT_TTL = float(os.getenv('SHEET_CACHE_TTL', '30'))
+
+# While the Sheet can't be read, the last good copy is served and a refresh is
+# retried this often.
+STALE_RETRY_SECONDS = float(os.getenv('SHEET_STALE_RETRY', '5'))
+
+# Minimum seconds between rewrites of the on-disk snapshot used for warm starts
+SNAPSHOT_INTERVAL = float(os.getenv('SHEET_SNAPSHOT_INTERVAL', '60'))
+
+# Background refreshes discarded because writes raced them before one is done
+# in place (holding the lock) instead
+MAX_LOST_RACES = 3
+
+
+def _holds_cells(row, cells):
+    return all((row[c - 1] if len(row) >= c else "") == v for c, v in cells.items())
+
+
+def _changed_rows(old, rows):
+    """
+    Row numbers whose contents differ between two downloads of a sheet, or
+    None when the indexes are better rebuilt: nothing loaded yet, the header
+    changed, rows were deleted or narrowed, or more than a quarter changed.
+    """
+    if old is None or len(rows) < len(old) or not rows or rows[0] != old[0]: return None
+    changed = [n for n in range(2, len(old) + 1) if old[n - 1] != rows[n - 1]]
+    if len(changed) > len(rows) // 4: return None
+    if any(len(rows[n - 1]) < len(old[n - 1]) for n in changed): return None
+    return changed
+
+
+def _trimmed(row):
+    # get_all_values() pads rows to the widest one; compare without the padding
+    end = len(row)
+    while end and row[end - 1] == "": end -= 1
+    return row[:end]
+
+
+class SheetCache:
+    """
+    In-process, write-through copy of one worksheet.
+
+    Rows are stored exactly as gspread's get_all_values() returns them (header
+    included), so row_number N in this cache is row N in the Sheet.
+
+    Bound with a feed (a SQLiteStorage recording its changes), the cache
+    follows a database shared by several worker processes instead: writes go
+    straight to the table, and every read first replays the change log, so
+    all workers see the same rows and row numbers.
+
+    Other instances writing the same Sheet can shift rows under this copy.
+    Cell edits therefore carry the cells that identify their record (key_col
+    and identity_cols, 1-based): the WriteCoordinator re-places queued edits
+    when it sends them, and edits written directly check the row first.
+    """
+
+    def __init__(self, name, ttl=DEFAULT_TTL, writer=None, snapshot_path=None, key_col=None, identity_cols=()):
+        self.name = name
+        self.key_col = key_col
+        self.identity_cols = tuple(identity_cols)
+        self.ttl = ttl
+        self.writer = writer  # optional WriteCoordinator; None writes straight to ws
+        self.feed = None  # optional change log shared with other worker processes
+        self._feed_pos = 0
+        self.snapshot_path = snapshot_path  # optional gzip JSON copy for warm starts
+        self.ws = None
+        self._rows = None
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.writes = 0
+        self.indexes = []
+        self.degraded = None  # last refresh error while serving stale rows
+        self._good_at = 0.0
+        self._from_snapshot = False
+        self._snapshot_saved = 0.0
+        self._revalidating = False
+        self._lost_races = 0
+
+    def add_index(self, index):
+        """Register an index that is built on load and patched on every write and refresh."""
+        with self._lock:
+            index.cache = self
+            self.indexes.append(index)
+            if self._rows is not None:
+                index.rebuild(self._rows)
+        return index
+
+    def bind(self, ws, writer=None, feed=None):
+        """
+        Attach (or re-attach after reconnect) the underlying worksheet, and
+        optionally the WriteCoordinator its writes should be queued on or the
+        change feed it should follow.
+        """
+        with self._lock:
+            self.ws = ws
+            self.writer = writer
+            self.feed = feed
+            self._rows = None
+            self._from_snapshot = False
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+            self._from_snapshot = False
+
+    def expire(self):
+        """Treat the copy as past its TTL so the next read reloads it. Lock-free: called from the flusher thread."""
+        self._loaded_at = 0.0
+
+    def _is_fresh(self):
+        if self.feed is not None:
+            return self._rows is not None  # the change log keeps it exact; no TTL needed
+        return self._rows is not None and (time.monotonic() - self._loaded_at) < self.ttl
+
+    @property
+    def lock(self):
+        return self._lock
+
+    def ensure_loaded(self):
+        """Load, or start a refresh if the TTL has expired. Callers reading indexes hold self.lock."""
+        with self._lock:
+            self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        # Caller must hold self._lock
+        if self.feed is not None and self._rows is not None:
+            self._catch_up()
+        if self._is_fresh():
+            self.hits += 1
+            return
+        self.misses += 1
+        if self._rows is None:
+            if not self._load_snapshot(): self.refresh()
+            return
+        if self._lost_races < MAX_LOST_RACES:
+            # Keep answering from the current copy; the new one is fetched off the request path
+            self._start_revalidate()
+            return
+        # Writes keep landing mid-download; take the lock and refresh in place
+        try:
+            self.refresh()
+        except Exception as e:
+            self._mark_degraded(e)
+
+    def _mark_degraded(self, error):
+        # Caller must hold self._lock. Keep answering from the last good copy instead of failing every request.
+        if not self.degraded:
+            print(f"⚠️ Serving cached '{self.name}' rows; refresh failed: {error}")
+        self.degraded = str(error)
+        self._loaded_at = time.monotonic() - self.ttl + STALE_RETRY_SECONDS
+
+    def refresh(self):
+        """Re-download the whole worksheet, replacing the cached rows."""
+        with self._lock:
+            if self.ws is None:
+                raise RuntimeError(f"Worksheet '{self.name}' is not connected")
+            if self.writer and self.writer.pending_count(self.name):
+                # Queued rows must reach the Sheet before we re-read it
+                self.writer.flush(self.name)
+            position = self.feed.change_position() if self.feed is not None else 0
+            self._install(self.ws.get_all_values(), position)
+
+    def _install(self, rows, position=0, changed=False):
+        """
+        Swap in a fresh download. Caller must hold self._lock. position:
+        change log id the rows are at least as new as; changed: the rows that
+        differ from the cached ones if already worked out (see _changed_rows).
+
+        Only rows whose contents changed, and new rows, go through the
+        indexes; a full rebuild is left for first loads and deletions.
+        """
+        rows = [list(r) for r in rows]
+        if changed is False: changed = _changed_rows(self._rows, rows)
+        if changed is None:
+            self._rows = rows
+            for index in self.indexes:
+                index.rebuild(self._rows)
+        else:
+            for row_number in changed:
+                self._patch_row(row_number, rows[row_number - 1])
+            for row_number in range(len(self._rows) + 1, len(rows) + 1):
+                self._rows.append(rows[row_number - 1])
+                for index in self.indexes:
+                    index.on_append(row_number, self._rows[-1])
+        self._feed_pos = position
+        self._loaded_at = self._good_at = time.monotonic()
+        self._from_snapshot = False
+        self._lost_races = 0
+        self.degraded = None
+        self.refreshes += 1
+        self._save_snapshot()
+
+    def _patch_row(self, row_number, new_row):
+        # Caller must hold self._lock. Bring a cached row up to new_row (no narrower) a cell at a time, as writes do.
+        row = self._rows[row_number - 1]
+        for col, value in enumerate(new_row, start=1):
+            old_value = row[col - 1] if len(row) >= col else None
+            if old_value == value: continue
+            if len(row) < col: row.extend([""] * (col - len(row)))
+            row[col - 1] = value
+            for index in self.indexes:
+                index.on_update(row_number, col, old_value or "", row)
+
+    # --- WARM START SNAPSHOT ---
+
+    def _load_snapshot(self):
+        """
+        Serve the rows a previous process saved while the real download runs
+        in the background. Caller must hold self._lock.
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path): return False
+        try:
+            with gzip.open(self.snapshot_path, 'rt', encoding='utf-8') as f:
+                rows = json.load(f)
+            age = max(0.0, time.time() - os.path.getmtime(self.snapshot_path))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring '{self.name}' snapshot: {e}")
+            return False
+
+        self._rows = rows
+        self._from_snapshot = True
+        self._loaded_at = time.monotonic()
+        self._good_at = self._loaded_at - age
+        for index in self.indexes:
+            index.rebuild(self._rows)
+        print(f"⚡ '{self.name}' warmed from snapshot ({len(rows)} rows, {age:.0f}s old)")
+        self._start_revalidate()
+        return True
+
+    def _start_revalidate(self):
+        # Caller must hold self._lock
+        if self._revalidating: return
+        self._revalidating = True
+        threading.Thread(target=self._revalidate, name=f'{self.name}-refresh', daemon=True).start()
+
+    def _revalidate(self):
+        """Download the real rows and compare them without holding the lock, then swap them in."""
+        writes = self.writes
+        try:
+            if self.writer and self.writer.pending_count(self.name):
+                self.writer.flush(self.name)
+            position = self.feed.change_position() if self.feed is not None else 0
+            rows = self.ws.get_all_values()
+            old = self._rows
+            changed = _changed_rows(old, rows)
+        except Exception as e:
+            with self._lock:
+                self._revalidating = False
+                if self._rows is not None: self._mark_degraded(e)
+            return
+        with self._lock:
+            self._revalidating = False
+            if self._rows is None: return  # invalidated or re-bound meanwhile
+            if self.writes != writes:
+                # Rows written during the download may be missing from it; try again shortly
+                self._lost_races += 1
+                self._loaded_at = time.monotonic() - self.ttl + STALE_RETRY_SECONDS
+                return
+            # Rows were not written meanwhile, so the comparison still holds unless they were replaced
+            self._install(rows, position, changed if self._rows is old else False)
+
+    def _save_snapshot(self):
+        # Caller must hold self._lock; the file is written on a background thread
+        if not self.snapshot_path or time.monotonic() - self._snapshot_saved < SNAPSHOT_INTERVAL: return
+        self._snapshot_saved = time.monotonic()
+        rows = [list(r) for r in self._rows]
+
+        def write():
+            tmp = self.snapshot_path + '.tmp'
+            try:
+                os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+                with gzip.open(tmp, 'wt', encoding='utf-8', compresslevel=1) as f:
+                    json.dump(rows, f, separators=(',', ':'))
+                os.replace(tmp, self.snapshot_path)
+            except OSError as e:
+                print(f"⚠️ Could not save '{self.name}' snapshot: {e}")
+        threading.Thread(target=write, name=f'{self.name}-snapshot', daemon=True).start()
+
+    def _ensure_writable(self):
+        # Caller must hold self._lock. Writes land on rows from the live Sheet, never on a snapshot.
+        self._ensure_loaded()
+        if self._from_snapshot: self.refresh()
+
+    # --- READS ---
+
+    def get_rows(self):
+        """Copy of every row including the header. Safe for callers to mutate."""
+        with self._lock:
+            self._ensure_loaded()
+            return [list(r) for r in self._rows]
+
+    def get_row(self, row_number):
+        """Copy of a single 1-based Sheet row, or None if it does not exist."""
+        with self._lock:
+            self._ensure_loaded()
+            if 1 <= row_number <= len(self._rows):
+                return list(self._rows[row_number - 1])
+            return None
+
+    def row_count(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._rows)
+
+    # --- WRITES (write-through) ---
+
+    def append_row(self, row):
+        """Append to the Sheet (or its write queue), then to the cache. Returns the new 1-based row number."""
+        with self._lock:
+            self._ensure_writable()
+            if self.feed is not None:
+                row_number = self.ws.append_row(row)
+                self._catch_up()
+                return row_number
+            if self.writer: self.writer.append_row(self.name, row)
+            else: self.ws.append_row(row)
+            return self._append_cached([row])[0]
+
+    def append_rows(self, rows):
+        """Append several rows as one upstream write. Returns their 1-based row numbers."""
+        if not rows: return []
+        with self._lock:
+            self._ensure_writable()
+            if self.feed is not None:
+                numbers = self.ws.append_rows(rows)
+                self._catch_up()
+                return numbers
+            if self.writer: self.writer.append_rows(self.name, rows)
+            else: self.ws.append_rows(rows)
+            return self._append_cached(rows)
+
+    def _append_cached(self, rows):
+        # Caller must hold self._lock
+        numbers = []
+        for row in rows:
+            self._rows.append([str(v) if v is not None else "" for v in row])
+            self.writes += 1
+            row_number = len(self._rows)
+            for index in self.indexes:
+                index.on_append(row_number, self._rows[-1])
+            numbers.append(row_number)
+        return numbers
+
+    def update_cell(self, row_number, col, value):
+        """Update one cell (1-based row/col) in the Sheet, then in the cache."""
+        with self._lock:
+            self._ensure_writable()
+            if self.feed is not None:
+                self.ws.update_cell(row_number, col, value)
+                self._catch_up()
+                return
+            expect = self._identity(row_number, col)
+            if self.writer: self.writer.update_cell(self.name, row_number, col, value, expect=expect)
+            else:
+                row_number = self._confirm_row(row_number, expect)
+                self.ws.update_cell(row_number, col, value)
+            self._update_cached(row_number, col, value)
+
+    def _identity(self, row_number, col):
+        # Caller must hold self._lock. Cells of the cached row that identify its record (except the one being written).
+        if not 1 <= row_number <= len(self._rows): return None
+        row = self._rows[row_number - 1]
+        cols = list(self.identity_cols)
+        if self.key_col and len(row) >= self.key_col and row[self.key_col - 1]: cols.append(self.key_col)
+        return {c: (row[c - 1] if len(row) >= c else "") for c in cols if c != col} or None
+
+    def _confirm_row(self, row_number, expect):
+        # Caller must hold self._lock. The row now holding the record, reloading if it moved.
+        if not expect or _holds_cells(self.ws.row_values(row_number), expect): return row_number
+        self.refresh()
+        for n, row in enumerate(self._rows, start=1):
+            if n > 1 and _holds_cells(row, expect): return n
+        raise LookupError(f"The '{self.name}' row being updated is no longer in the Sheet")
+
+    def _update_cached(self, row_number, col, value):
+        # Caller must hold self._lock
+        if 1 <= row_number <= len(self._rows):
+            row = self._rows[row_number - 1]
+            if len(row) < col:
+                row.extend([""] * (col - len(row)))
+            old_value = row[col - 1]
+            row[col - 1] = str(value) if value is not None else ""
+            for index in self.indexes:
+                index.on_update(row_number, col, old_value, row)
+        self.writes += 1
+
+    def delete_keyed_rows(self, key_col, keys):
+        """
+        Delete the rows whose key_col cell (1-based) is one of keys, from the
+        Sheet and then the cache. Returns the number of rows deleted.
+
+        Row positions are re-read from the Sheet before each contiguous run is
+        deleted (bottom-up), so rows that moved, or a delete that went through
+        although it reported an error, never make it hit other rows.
+        """
+        if self.feed is not None:
+            raise RuntimeError(f"Rows can't be deleted from '{self.name}' while it follows a shared feed")
+        with self._lock:
+            self._ensure_writable()
+            if self.writer and self.writer.pending_count(self.name):
+                self.writer.flush(self.name)  # queued writes address rows by number
+            deleted = 0
+            try:
+                while True:
+                    column = self.ws.col_values(key_col)
+                    hits = {n for n, value in enumerate(column, start=1) if n > 1 and str(value) in keys}
+                    if not hits: break
+                    end = start = max(hits)
+                    while start - 1 in hits: start -= 1
+                    self.ws.delete_rows(start, end)
+                    deleted += end - start + 1
+            finally:
+                # Row numbers have shifted; start again from the Sheet
+                self._snapshot_saved = 0.0
+                self.refresh()
+            return deleted
+
+    # --- SHARED CHANGE FEED ---
+
+    def _catch_up(self):
+        # Caller must hold self._lock. Replays writes made since the last look, by any worker.
+        changes = self.feed.changes_since(self._feed_pos, self.name)
+        if changes is None:
+            self._rows = None  # the log no longer reaches back that far; reload
+            return
+        for change_id, _, op, row_number, col, value in changes:
+            if op == 'append':
+                row = json.loads(value)
+                if row_number == len(self._rows) + 1:
+                    self._append_cached([row])
+                elif row_number > len(self._rows) + 1:
+                    self._rows = None  # a gap should not happen; reload rather than guess
+                    return
+                elif _trimmed(self._rows[row_number - 1]) != _trimmed(row):
+                    # Already loaded with different content (reload raced the write)
+                    width = len(self._rows[row_number - 1])
+                    self._patch_row(row_number, row + [""] * (width - len(row)))
+            else:
+                self._update_cached(row_number, col, value)
+            self._feed_pos = change_id
+
+    def staleness(self):
+        """Age of the data while degraded or still on a snapshot, else None. Lock-free (read per response)."""
+        if not self.degraded and not self._from_snapshot: return None
+        return round(time.monotonic() - self._good_at, 1)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'sheet': self.name,
+                'rows': len(self._rows) if self._rows is not None else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'refreshes': self.refreshes,
+                'writes': self.writes,
+                'ttl_seconds': self.ttl,
+                'age_seconds': round(time.monotonic() - self._loaded_at, 1) if self._rows is not None else None,
+                'degraded': self.degraded,
+                'from_snapshot': self._from_snapshot,
+            }
+
+
+def load_together(*caches):
+    """
+    Make sure every cache has rows, downloading the ones that have none yet
+    at the same time (a cold start pays for the slowest sheet, not the sum).
+    Loaded caches are left to their own TTL handling. Raises the first error.
+    """
+    fan_out(*[cache.ensure_loaded if cache._rows is None else None for cache in caches])
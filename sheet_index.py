@@ -0,0 +1,263 @@
+import bisect
+from datetime import datetime
+
+
+def normalize_mobile(value):
+    """Digits only, so '98765 43210' and '98765-43210' index to the same key."""
+    return ''.join(filter(str.isdigit, str(value or '')))
+
+
+class SheetIndex:
+    """
+    Base class for secondary indexes kept alongside a SheetCache.
+
+    The cache calls rebuild() when a sheet is first loaded (or rows were
+    deleted), and on_append() / on_update() after each of our own writes and
+    for the rows a periodic reload found new or changed, so lookups never
+    rescan the sheet. Row numbers are 1-based Sheet rows; row 1 (the header)
+    is skipped.
+    """
+
+    cache = None
+
+    def rebuild(self, rows):
+        self.clear()
+        for i, row in enumerate(rows[1:], start=2):
+            self.on_append(i, row)
+
+    def clear(self):
+        raise NotImplementedError
+
+    def on_append(self, row_number, row):
+        raise NotImplementedError
+
+    def on_update(self, row_number, col, old_value, row):
+        raise NotImplementedError
+
+    def _sync(self):
+        # Refresh the parent cache if needed; returns its lock to hold while reading
+        self.cache.ensure_loaded()
+        return self.cache.lock
+
+
+class MobileIndex(SheetIndex):
+    """Normalized mobile number -> ascending list of row numbers."""
+
+    def __init__(self, col):
+        self.col = col  # 0-based column holding the mobile number
+        self._rows = {}
+
+    def clear(self):
+        self._rows = {}
+
+    def on_append(self, row_number, row):
+        if len(row) > self.col:
+            key = normalize_mobile(row[self.col])
+            if key:
+                self._rows.setdefault(key, []).append(row_number)
+
+    def on_update(self, row_number, col, old_value, row):
+        if col - 1 != self.col: return
+        old_key = normalize_mobile(old_value)
+        if old_key in self._rows and row_number in self._rows[old_key]:
+            self._rows[old_key].remove(row_number)
+        new_key = normalize_mobile(row[self.col])
+        if new_key:
+            bisect.insort(self._rows.setdefault(new_key, []), row_number)
+
+    def rows_for(self, mobile):
+        with self._sync():
+            return list(self._rows.get(normalize_mobile(mobile), ()))
+
+    def last_row_for(self, mobile):
+        with self._sync():
+            rows = self._rows.get(normalize_mobile(mobile))
+            return rows[-1] if rows else None
+
+
+class KeyIndex(SheetIndex):
+    """Case-insensitive unique key (e.g. a user's email) -> first row holding it."""
+
+    def __init__(self, col):
+        self.col = col
+        self._rows = {}
+
+    def clear(self):
+        self._rows = {}
+
+    @staticmethod
+    def _key(value):
+        return str(value or '').strip().lower()
+
+    def on_append(self, row_number, row):
+        if len(row) > self.col:
+            key = self._key(row[self.col])
+            if key and (key not in self._rows or row_number < self._rows[key]):
+                self._rows[key] = row_number
+
+    def on_update(self, row_number, col, old_value, row):
+        if col - 1 != self.col: return
+        old_key = self._key(old_value)
+        if self._rows.get(old_key) == row_number:
+            del self._rows[old_key]
+        self.on_append(row_number, row)
+
+    def row_for(self, value):
+        with self._sync():
+            return self._rows.get(self._key(value))
+
+
+class StatusIndex(SheetIndex):
+    """Status value (e.g. 'Pending', 'Arrived') -> set of row numbers."""
+
+    def __init__(self, col):
+        self.col = col
+        self._rows = {}
+
+    def clear(self):
+        self._rows = {}
+
+    def on_append(self, row_number, row):
+        if len(row) > self.col:
+            self._rows.setdefault(row[self.col], set()).add(row_number)
+
+    def on_update(self, row_number, col, old_value, row):
+        if col - 1 != self.col: return
+        self._rows.get(old_value, set()).discard(row_number)
+        self._rows.setdefault(row[self.col], set()).add(row_number)
+
+    def rows_with(self, status):
+        with self._sync():
+            return sorted(self._rows.get(status, ()))
+
+    def rows_without(self, status):
+        """Rows that have a status column set to anything other than status."""
+        with self._sync():
+            return sorted(n for s, rows in self._rows.items() if s != status for n in rows)
+
+    def count(self, status):
+        with self._sync():
+            return len(self._rows.get(status, ()))
+
+    def has(self, row_number, status):
+        with self._sync():
+            return row_number in self._rows.get(status, ())
+
+
+class DateIndex(SheetIndex):
+    """
+    Entry date -> row numbers, with the distinct dates kept sorted so a date
+    range is found with two binary searches instead of a full scan.
+    """
+
+    def __init__(self, col, fmt="%d-%m-%Y"):
+        self.col = col
+        self.fmt = fmt
+        self._rows = {}
+        self._dates = []
+        self._parsed = {}
+
+    def clear(self):
+        self._rows = {}
+        self._dates = []
+
+    def parse(self, value):
+        """Parse a date string once; every later row with the same string is a dict hit."""
+        if value not in self._parsed:
+            try:
+                self._parsed[value] = datetime.strptime(value, self.fmt).date()
+            except (ValueError, TypeError):
+                self._parsed[value] = None
+        return self._parsed[value]
+
+    def on_append(self, row_number, row):
+        if len(row) <= self.col: return
+        day = self.parse(row[self.col])
+        if day is None: return
+        if day not in self._rows:
+            self._rows[day] = []
+            bisect.insort(self._dates, day)
+        self._rows[day].append(row_number)
+
+    def on_update(self, row_number, col, old_value, row):
+        if col - 1 != self.col: return
+        old_day = self.parse(old_value)
+        if old_day in self._rows and row_number in self._rows[old_day]:
+            self._rows[old_day].remove(row_number)
+        self.on_append(row_number, row)
+
+    def rows_between(self, start_date, end_date):
+        """Ascending row numbers whose date falls in [start_date, end_date]."""
+        with self._sync():
+            lo = bisect.bisect_left(self._dates, start_date)
+            hi = bisect.bisect_right(self._dates, end_date)
+            result = []
+            for day in self._dates[lo:hi]:
+                result.extend(self._rows[day])
+            result.sort()
+            return result
+
+    def count_on(self, day):
+        with self._sync():
+            return len(self._rows.get(day, ()))
+
+
+class OpenVisitIndex(SheetIndex):
+    """
+    Visitor rows whose out-time cell is still blank, i.e. people on campus.
+
+    Only rows wide enough to have the out-time column count, matching how the
+    dashboards have always decided who is active.
+    """
+
+    def __init__(self, col=10):
+        self.col = col
+        self._open = set()
+
+    def clear(self):
+        self._open = set()
+
+    def on_append(self, row_number, row):
+        if len(row) > self.col and row[self.col] == "":
+            self._open.add(row_number)
+
+    def on_update(self, row_number, col, old_value, row):
+        if col - 1 != self.col: return
+        if row[self.col] == "": self._open.add(row_number)
+        else: self._open.discard(row_number)
+
+    def open_rows(self):
+        """Ascending row numbers of open visits. O(active), not O(history)."""
+        with self._sync():
+            return sorted(self._open)
+
+    def is_open(self, row_number):
+        with self._sync():
+            return row_number in self._open
+
+    def count(self):
+        with self._sync():
+            return len(self._open)
+
+
+class MaxValueIndex(SheetIndex):
+    """Largest integer seen in one column (e.g. the highest pass ID issued)."""
+
+    def __init__(self, col):
+        self.col = col
+        self.max_value = 0
+
+    def clear(self):
+        self.max_value = 0
+
+    def on_append(self, row_number, row):
+        if len(row) > self.col:
+            try: self.max_value = max(self.max_value, int(row[self.col]))
+            except (ValueError, TypeError): pass
+
+    def on_update(self, row_number, col, old_value, row):
+        if col - 1 == self.col: self.on_append(row_number, row)
+
+    def value(self):
+        with self._sync():
+            return self.max_value
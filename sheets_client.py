@@ -0,0 +1,243 @@
+import os
+import time
+import random
+import threading
+
+# Google's default Sheets quota is 60 requests per minute per user.
+SHEETS_REQUESTS_PER_MINUTE = float(os.getenv('SHEETS_REQUESTS_PER_MINUTE', '60'))
+SHEETS_BURST = int(os.getenv('SHEETS_BURST', '15'))
+SHEETS_MAX_RETRIES = int(os.getenv('SHEETS_MAX_RETRIES', '3'))
+SHEETS_BACKOFF = float(os.getenv('SHEETS_BACKOFF', '1'))
+SHEETS_MAX_WAIT = float(os.getenv('SHEETS_MAX_WAIT', '20'))  # longest a call queues for a token
+BREAKER_FAILURES = int(os.getenv('SHEETS_BREAKER_FAILURES', '5'))
+BREAKER_RESET = float(os.getenv('SHEETS_BREAKER_RESET', '30'))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Worksheet methods that only read; identical concurrent reads are coalesced
+READ_METHODS = {'get_all_values', 'row_values', 'col_values', 'cell', 'find', 'findall'}
+
+# Calls that must not be repeated if an attempt may already have gone through:
+# a lost response to an append would add the row twice. Only a 429, which
+# Sheets sends before doing anything, is retried for them; the WriteCoordinator
+# checks what landed before it sends the rest again.
+NOT_RETRIED = {'append_row', 'append_rows', 'update_cell', 'batch_update', 'delete_rows'}
+
+
+class UpstreamUnavailable(Exception):
+    """Sheets is rate limited or failing and the call was not attempted (or gave up)."""
+
+
+def is_retryable(error):
+    import requests
+    from gspread.exceptions import APIError
+    if isinstance(error, APIError):
+        return getattr(error.response, 'status_code', None) in RETRYABLE_STATUS
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, TimeoutError))
+
+
+def is_refused(error):
+    """A quota rejection: the request was turned away without being applied."""
+    from gspread.exceptions import APIError
+    return isinstance(error, APIError) and getattr(error.response, 'status_code', None) == 429
+
+
+class TokenBucket:
+    """Refills at rate tokens/second up to capacity; acquire() waits for a token."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            self.waited += wait
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive upstream failures; open fails
+    fast for `reset` seconds, then lets a single trial call through
+    (half-open). Its success closes the breaker, its failure re-opens it.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.failures = failures
+        self.reset = reset
+        self.state = 'closed'
+        self._count = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+        self.trips = 0
+        self.last_error = None
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed': return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset:
+                self.state = 'half-open'
+                self._trial = False
+            if self.state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._count = 0
+            self._trial = False
+
+    def failure(self, error):
+        with self._lock:
+            self._count += 1
+            self.last_error = str(error)
+            if self.state == 'half-open' or self._count >= self.failures:
+                if self.state != 'open':
+                    self.trips += 1
+                    print(f"🔌 Sheets circuit open for {self.reset:.0f}s: {error}")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+    def retry_in(self):
+        with self._lock:
+            if self.state != 'open': return 0
+            return max(0.0, self.reset - (time.monotonic() - self._opened_at))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SheetsClient:
+    """
+    Every Sheets call from the app goes through here: wait for a rate-limit
+    token, retry 429 / 5xx / network errors with jittered exponential backoff,
+    and stop calling altogether while the circuit breaker is open. Identical
+    reads already in flight are shared instead of sent again.
+    """
+
+    def __init__(self, per_minute=SHEETS_REQUESTS_PER_MINUTE, burst=SHEETS_BURST,
+                 max_retries=SHEETS_MAX_RETRIES, backoff=SHEETS_BACKOFF):
+        self.bucket = TokenBucket(per_minute / 60.0, burst)
+        self.breaker = CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def call(self, fn, key=None, retry=True):
+        """
+        Run fn() against Sheets. key (reads only) lets concurrent identical
+        calls share one request; retry=False retries only quota rejections.
+        """
+        if key is None:
+            return self._call(fn, retry)
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error: raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._call(fn)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _call(self, fn, retry=True):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise UpstreamUnavailable(f"Sheets unavailable, retrying in {self.breaker.retry_in():.0f}s ({self.breaker.last_error})")
+            if not self.bucket.acquire(SHEETS_MAX_WAIT):
+                self.rejected += 1
+                raise UpstreamUnavailable("Sheets request quota exhausted")
+            self.calls += 1
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.success()  # the API answered; it just said no
+                    raise
+                attempt += 1
+                # A half-open trial gets one shot; anything else gets its retries
+                if attempt > (self.max_retries if retry or is_refused(e) else 0) or self.breaker.state != 'closed':
+                    self.breaker.failure(e)
+                    raise UpstreamUnavailable(f"Sheets call failed after {attempt} attempts: {e}") from e
+                self.retries += 1
+                delay = self.backoff * (2 ** (attempt - 1))
+                time.sleep(delay + random.uniform(0, delay))
+                continue
+            self.breaker.success()
+            return result
+
+    def stats(self):
+        return {
+            'state': self.breaker.state,
+            'retry_in_seconds': round(self.breaker.retry_in(), 1),
+            'last_error': self.breaker.last_error,
+            'trips': self.breaker.trips,
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'rate_limit_wait_seconds': round(self.bucket.waited, 2),
+        }
+
+
+class ResilientWorksheet:
+    """Worksheet proxy that sends every method call through a SheetsClient."""
+
+    def __init__(self, ws, client):
+        self._ws = ws
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._ws, name)
+        if not callable(attr) or name.startswith('_'): return attr
+        def call(*args, **kwargs):
+            key = (id(self._ws), name, repr(args), repr(sorted(kwargs.items()))) if name in READ_METHODS else None
+            return self._client.call(lambda: attr(*args, **kwargs), key=key, retry=name not in NOT_RETRIED)
+        return call
+
+
+sheets_client = SheetsClient()
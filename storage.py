@@ -0,0 +1,396 @@
+import os
+import json
+import sqlite3
+import threading
+
+TABLE_NAMES = ("Users", "Visitors", "Bookings")
+
+# Columns that get a SQLite index (1-based, like Sheet columns)
+INDEXED_COLUMNS = {
+    "Users": [1],          # email
+    "Visitors": [1, 3],    # date, mobile
+    "Bookings": [5, 8],    # mobile, status
+}
+
+# Column holding each row's unique key (1-based), used to make replayed
+# appends idempotent. Bookings rows have no natural key.
+KEY_COLUMNS = {
+    "Users": 1,            # email
+    "Visitors": 14,        # pass ID
+}
+
+# Cells set when a row is appended and never edited after. With the key they
+# identify a record whose row number can't be trusted (another instance
+# appended first); Bookings rows rely on them alone.
+IDENTITY_COLUMNS = {
+    "Users": (1,),             # email
+    "Visitors": (1, 2, 3, 4),  # date, in time, mobile, name
+    "Bookings": (1, 2, 5, 6),  # booked at, booked by, mobile, name
+}
+
+
+class SheetsStorage:
+    """
+    The Google Sheet itself: tables are gspread worksheets. Nothing is fetched
+    until a table is first used, so connecting costs no API calls.
+    """
+
+    name = 'sheets'
+
+    def __init__(self, gc, sheet_id=None, sheet_name=None):
+        self.gc = gc
+        self.sheet_id = sheet_id
+        self.sheet_name = sheet_name
+        self._spreadsheet = None
+        self._lock = threading.Lock()
+        self._tables = {}
+
+    def worksheet(self, name):
+        """The real gspread worksheet (opened once, on first use)."""
+        with self._lock:
+            if self._spreadsheet is None:
+                self._spreadsheet = self.gc.open_by_key(self.sheet_id) if self.sheet_id else self.gc.open(self.sheet_name)
+            spreadsheet = self._spreadsheet
+        return spreadsheet.worksheet(name)  # outside the lock: tables loading together look up in parallel
+
+    def table(self, name):
+        if name not in self._tables:
+            self._tables[name] = LazyWorksheet(self, name)
+        return self._tables[name]
+
+    def ensure_worksheet(self, name, header):
+        """The worksheet called name, created with header as its first row if there is none yet."""
+        from gspread.exceptions import APIError, WorksheetNotFound
+        from gspread.utils import rowcol_to_a1
+        try: return self.worksheet(name)
+        except WorksheetNotFound: pass
+        with self._lock:
+            spreadsheet = self._spreadsheet
+        try:
+            ws = spreadsheet.add_worksheet(title=name, rows=1, cols=len(header))
+        except APIError:
+            return self.worksheet(name)  # another instance created it first
+        ws.batch_update([{'range': f"A1:{rowcol_to_a1(1, len(header))}", 'values': [header]}])
+        print(f"📄 Created worksheet '{name}'")
+        return ws
+
+
+class LazyWorksheet:
+    """Stands in for a worksheet until the first call, then forwards to it."""
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.title = name
+        self._ws = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        if self._ws is None:
+            with self._lock:
+                if self._ws is None:
+                    self._ws = self.storage.worksheet(self.title)
+        return getattr(self._ws, attr)
+
+
+class SQLiteTable:
+    """
+    A worksheet-shaped table in SQLite. It provides the subset of the gspread
+    Worksheet API that the app uses, so it can sit behind SheetCache,
+    WriteCoordinator or the login code unchanged. row_num matches the Sheet
+    row number, and row 1 is the header.
+    """
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.title = name
+        self._table = f'"{name}"'
+        self._width = 0
+        self._schema_version = None  # schema the cached width was read from
+        self._create()
+
+    # --- schema ---
+
+    def _create(self):
+        with self.storage.write() as db:
+            db.execute(f"CREATE TABLE IF NOT EXISTS {self._table} (row_num INTEGER PRIMARY KEY)")
+            for col in INDEXED_COLUMNS.get(self.title, []):
+                self._ensure_width(db, col)
+                db.execute(f'CREATE INDEX IF NOT EXISTS "ix_{self.title}_c{col}" ON {self._table} (c{col})')
+
+    def _refresh_width(self, db):
+        # Other processes sharing the file may have added columns since we last looked
+        self._width = len(db.execute(f"PRAGMA table_info({self._table})").fetchall()) - 1
+        self._schema_version = db.execute("PRAGMA schema_version").fetchone()[0]
+
+    def _ensure_width(self, db, width):
+        # Called inside a write transaction, so the width read here can't change under us
+        self._refresh_width(db)
+        if self._width >= width: return
+        while self._width < width:
+            self._width += 1
+            db.execute(f"ALTER TABLE {self._table} ADD COLUMN c{self._width} TEXT")
+        self._schema_version = None  # re-read once committed (or rolled back)
+
+    def _reader(self):
+        """Read connection, with the column count brought up to date if the schema changed."""
+        conn = self.storage.read()
+        if conn.execute("PRAGMA schema_version").fetchone()[0] != self._schema_version:
+            self._refresh_width(conn)
+        return conn
+
+    def _cols(self):
+        return ", ".join(f"c{i}" for i in range(1, self._width + 1))
+
+    # --- reads ---
+
+    def _to_row(self, values):
+        row = ["" if v is None else str(v) for v in values]
+        while row and row[-1] == "": row.pop()
+        return row
+
+    def get_all_values(self):
+        conn = self._reader()
+        if not self._width: return []
+        rows = [self._to_row(r) for r in conn.execute(
+            f"SELECT {self._cols()} FROM {self._table} ORDER BY row_num")]
+        # Pad to a rectangle like gspread does
+        width = max((len(r) for r in rows), default=0)
+        return [r + [""] * (width - len(r)) for r in rows]
+
+    def row_values(self, row_number):
+        r = self._reader().execute(f"SELECT {self._cols()} FROM {self._table} WHERE row_num = ?", (row_number,)).fetchone()
+        return self._to_row(r) if r else []
+
+    def cell(self, row_number, col):
+        from gspread.cell import Cell  # gspread is only loaded when a Cell is actually needed
+        row = self.row_values(row_number)
+        return Cell(row_number, col, row[col - 1] if len(row) >= col else "")
+
+    def col_values(self, col):
+        conn = self._reader()
+        if col > self._width: return []
+        values = [r[0] for r in conn.execute(f"SELECT c{col} FROM {self._table} ORDER BY row_num")]
+        while values and not values[-1]: values.pop()
+        return ["" if v is None else v for v in values]
+
+    def find(self, value):
+        """First cell equal to value (row-major), or None like gspread 6."""
+        for cell in self.findall(value):
+            return cell
+        return None
+
+    def findall(self, value):
+        conn = self._reader()
+        if not self._width: return []
+        from gspread.cell import Cell
+        where = " OR ".join(f"c{i} = ?" for i in range(1, self._width + 1))
+        cells = []
+        for r in conn.execute(
+                f"SELECT row_num, {self._cols()} FROM {self._table} WHERE {where} ORDER BY row_num",
+                [str(value)] * self._width):
+            for i, v in enumerate(r[1:], start=1):
+                if v == str(value): cells.append(Cell(r[0], i, v))
+        return cells
+
+    # --- writes ---
+
+    def append_rows(self, rows, **kwargs):
+        """Insert rows after the last one; returns their row numbers."""
+        return self._insert(rows, record=True)
+
+    def _insert(self, rows, record):
+        rows = [["" if v is None else str(v) for v in row] for row in rows]
+        if not rows: return []
+        with self.storage.write() as db:
+            self._ensure_width(db, max(len(r) for r in rows))
+            next_row = (db.execute(f"SELECT MAX(row_num) FROM {self._table}").fetchone()[0] or 0) + 1
+            for i, row in enumerate(rows):
+                cols = ", ".join(["row_num"] + [f"c{j}" for j in range(1, len(row) + 1)])
+                marks = ", ".join("?" * (len(row) + 1))
+                db.execute(f"INSERT INTO {self._table} ({cols}) VALUES ({marks})", [next_row + i] + row)
+                if record: self.storage.record_change(db, self.title, 'append', next_row + i, value=json.dumps(row))
+        return list(range(next_row, next_row + len(rows)))
+
+    def append_row(self, row, **kwargs):
+        return self.append_rows([row])[0]
+
+    def update_cell(self, row_number, col, value):
+        self._update_cells([(row_number, col, value)])
+
+    def batch_update(self, data, **kwargs):
+        from gspread.utils import a1_to_rowcol
+        cells = []
+        for item in data:
+            top, left = a1_to_rowcol(item['range'].split(':')[0])
+            for dr, values in enumerate(item['values']):
+                for dc, value in enumerate(values):
+                    cells.append((top + dr, left + dc, value))
+        self._update_cells(cells)
+
+    def _update_cells(self, cells):
+        with self.storage.write() as db:
+            self._ensure_width(db, max(c for _, c, _ in cells))
+            for row_number, col, value in cells:
+                value = "" if value is None else str(value)
+                db.execute(f"INSERT OR IGNORE INTO {self._table} (row_num) VALUES (?)", (row_number,))
+                db.execute(f"UPDATE {self._table} SET c{col} = ? WHERE row_num = ?", (value, row_number))
+                self.storage.record_change(db, self.title, 'update', row_number, col, value)
+
+    def is_empty(self):
+        return self.storage.read().execute(f"SELECT 1 FROM {self._table} LIMIT 1").fetchone() is None
+
+
+class SQLiteStorage:
+    """
+    Local SQLite database in WAL mode: readers never block the single writer.
+    Each thread gets its own connection, so sqlite3's per-connection statement
+    cache keeps the parameterized queries prepared between calls.
+
+    With track_changes every write is also recorded, in the same transaction,
+    in an ordered change log. Several worker processes sharing the database
+    replay it to keep their caches identical (see worker_sync.py).
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, track_changes=False):
+        self.path = path
+        self.track_changes = track_changes
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._tables = {}
+        if track_changes:
+            with self.write() as db:
+                db.execute("CREATE TABLE IF NOT EXISTS _changes (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                           "tbl TEXT, op TEXT, row_num INTEGER, col INTEGER, value TEXT)")
+                db.execute("CREATE TABLE IF NOT EXISTS _meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def read(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, cached_statements=256, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    class _Tx:
+        def __init__(self, storage):
+            self.storage = storage
+
+        def __enter__(self):
+            self.storage._write_lock.acquire()
+            self.conn = self.storage.read()
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn
+
+        def __exit__(self, exc_type, exc, tb):
+            try:
+                if exc_type: self.conn.rollback()
+                else: self.conn.commit()
+            finally:
+                self.storage._write_lock.release()
+
+    def write(self):
+        """Context manager for one write transaction."""
+        return self._Tx(self)
+
+    def table(self, name):
+        if name not in self._tables:
+            self._tables[name] = SQLiteTable(self, name)
+        return self._tables[name]
+
+    def import_from(self, source):
+        """Copy every table from another storage into empty local tables (first run)."""
+        from worker_sync import file_lock
+        # Workers starting together must not both import
+        with file_lock(self.path + '.import.lock'):
+            for name in TABLE_NAMES:
+                local = self.table(name)
+                if local.is_empty():
+                    rows = source.table(name).get_all_values()
+                    local._insert(rows, record=False)  # already in the source; nothing to mirror
+                    print(f"📥 Imported {len(rows)} rows of '{name}' into SQLite")
+
+    # --- CHANGE LOG ---
+
+    def record_change(self, db, table, op, row_number, col=None, value=None):
+        # Called inside the write transaction that made the change
+        if not self.track_changes: return
+        db.execute("INSERT INTO _changes (tbl, op, row_num, col, value) VALUES (?, ?, ?, ?, ?)",
+                   (table, op, row_number, col, value))
+
+    def change_position(self):
+        """Id of the latest recorded change (0 if none)."""
+        return self.read().execute("SELECT COALESCE(MAX(id), 0) FROM _changes").fetchone()[0]
+
+    def changes_since(self, position, table=None, limit=None):
+        """
+        (id, table, op, row_num, col, value) tuples after position, oldest
+        first. None if the log has been pruned past position, in which case
+        the caller must reload.
+        """
+        if position < self.get_meta('pruned', 0): return None
+        sql = "SELECT id, tbl, op, row_num, col, value FROM _changes WHERE id > ?"
+        args = [position]
+        if table:
+            sql += " AND tbl = ?"
+            args.append(table)
+        sql += " ORDER BY id"
+        if limit:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return self.read().execute(sql, args).fetchall()
+
+    def prune_changes(self, upto):
+        """Forget changes with id <= upto."""
+        with self.write() as db:
+            db.execute("DELETE FROM _changes WHERE id <= ?", (upto,))
+            db.execute("INSERT OR REPLACE INTO _meta (key, value) VALUES ('pruned', ?)", (str(upto),))
+
+    def get_meta(self, key, default=None):
+        row = self.read().execute("SELECT value FROM _meta WHERE key = ?", (key,)).fetchone()
+        if row is None: return default
+        return type(default)(row[0]) if default is not None else row[0]
+
+    def set_meta(self, key, value):
+        with self.write() as db:
+            db.execute("INSERT OR REPLACE INTO _meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+class MirroredTable:
+    """
+    Local table whose writes are also queued (via a WriteCoordinator) to the
+    matching Google Sheet. Reads never leave the machine; the Sheet stays
+    current for staff who still open it.
+    """
+
+    def __init__(self, local, mirror, name):
+        self.local = local
+        self.mirror = mirror
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(self.local, attr)
+
+    def append_row(self, row, **kwargs):
+        self.append_rows([row])
+
+    def append_rows(self, rows, **kwargs):
+        numbers = self.local.append_rows(rows)
+        for row in rows: self.mirror.append_row(self.name, row)
+        return numbers
+
+    def update_cell(self, row_number, col, value):
+        self.local.update_cell(row_number, col, value)
+        self.mirror.update_cell(self.name, row_number, col, value)
+
+    def batch_update(self, data, **kwargs):
+        from gspread.utils import a1_to_rowcol
+        self.local.batch_update(data)
+        for item in data:
+            top, left = a1_to_rowcol(item['range'].split(':')[0])
+            for dr, values in enumerate(item['values']):
+                for dc, value in enumerate(values):
+                    self.mirror.update_cell(self.name, top + dr, left + dc, value)
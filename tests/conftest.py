@@ -0,0 +1,65 @@
+import os
+import sys
+import base64
+import tempfile
+
+import pytest
+
+# The app is a set of top-level modules, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings are read when modules are imported, so they are set before any test
+# module is: app.py runs on the in-memory Google stand-in, writing through with
+# inline photo uploads
+os.environ.update(GOOGLE_BACKEND='fake', GATEPASS_DATA_DIR=tempfile.mkdtemp(prefix="gatepass-tests-"),
+                  GOOGLE_SHEET_ID='fake', GOOGLE_DRIVE_FOLDER_ID='folder', PHOTO_UPLOAD_WORKERS='0',
+                  SHEET_SNAPSHOTS='0', SHEET_FLUSH_INTERVAL='0', SHEETS_REQUESTS_PER_MINUTE='60000')
+
+
+@pytest.fixture(scope="session")
+def gate_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def gate(gate_module, tmp_path):
+    """The app with empty sheets (headers only) and cold caches."""
+    import fake_google
+    from image_processor import ThumbnailStore
+    backend = fake_google.backend()
+    with backend._lock:
+        backend.sheets.clear()
+        backend.sheets.update({name: [list(header)] for name, header in fake_google.DEFAULT_HEADERS.items()})
+        backend.files.clear()
+        backend.calls.clear()
+        backend.errors.clear()
+    assert gate_module.ensure_db()
+    for cache in (gate_module.users_cache, gate_module.visitors_cache, gate_module.bookings_cache):
+        cache.invalidate()
+    if os.path.exists(gate_module.pass_ids.path): os.remove(gate_module.pass_ids.path)
+    gate_module.thumbnails = ThumbnailStore(directory=str(tmp_path / "thumbnails"))
+    return gate_module
+
+
+@pytest.fixture
+def google(gate):
+    import fake_google
+    return fake_google.backend()
+
+
+def login(gate, role, email):
+    from benchmark import client_for
+    return client_for(gate.app, role, email)
+
+
+def photo_data_url():
+    from benchmark import sample_photo
+    return "data:image/jpeg;base64," + base64.b64encode(sample_photo()).decode()
+
+
+def check_in(client, mobile, name="Ravi", **fields):
+    payload = {'image': photo_data_url(), 'mobile': mobile, 'name': name, 'designation': 'Guest', 'company': 'Acme',
+               'to_meet': 'Host', 'department': 'CSE', 'vehicle': '-'}
+    payload.update(fields)
+    return client.post('/api/entry', json=payload).get_json()
@@ -0,0 +1,38 @@
+from conftest import check_in, login
+
+
+def test_active_list_and_check_out_use_the_open_visits(gate, google):
+    guard = login(gate, 'Security', 'guard@x')
+    first = check_in(guard, "9000000001", "Asha")
+    check_in(guard, "9000000002", "Ravi")
+    assert first['status'] == 'success'
+
+    active = guard.get('/api/get_active_visitors').get_json()
+    assert [v['name'] for v in active] == ["Ravi", "Asha"]   # newest first
+
+    out = guard.post('/api/exit', json={'mobile': "9000000001", 'out_time': "17:30"}).get_json()
+    assert out == {'status': 'success', 'out_time': "05:30 PM", 'offline': False}
+    assert [v['name'] for v in guard.get('/api/get_active_visitors').get_json()] == ["Ravi"]
+    assert google.sheets['Visitors'][1][10] == "05:30 PM"
+
+    again = guard.post('/api/exit', json={'mobile': "9000000001"}).get_json()
+    assert again['status'] == 'error' and "Already OUT" in again['message']
+
+
+def test_check_out_of_an_unknown_visitor(gate):
+    guard = login(gate, 'Security', 'guard@x')
+    assert guard.post('/api/exit', json={'mobile': "9999999999"}).get_json()['status'] == 'error'
+
+
+def test_visits_closed_in_the_sheet_leave_the_list_on_refresh(gate, google):
+    guard = login(gate, 'Security', 'guard@x')
+    check_in(guard, "9000000001", "Asha")
+    google.sheets['Visitors'][1][10] = "06:00 PM"             # closed by hand in the Sheet
+    gate.visitors_cache.refresh()
+    assert guard.get('/api/get_active_visitors').get_json() == []
+    assert gate.open_visits.count() == 0
+
+
+def test_only_security_sees_the_active_list(gate):
+    check_in(login(gate, 'Security', 'guard@x'), "9000000001")
+    assert login(gate, 'Faculty', 'host@x').get('/api/get_active_visitors').get_json() == []
@@ -0,0 +1,95 @@
+import pytest
+
+from admin_query import RowQuery, VISITOR_COLUMNS, decode_cursor, encode_cursor
+from fake_google import FakeGoogle, FakeWorksheet
+from sheet_cache import SheetCache
+from conftest import login
+
+
+def visit(n, company="Acme", date="16-10-2026", out_time=""):
+    return [date, "10:00 AM", f"90000000{n:02d}", f"Visitor {n}", "", company, "", "", "", "", out_time, "", "", str(n)]
+
+
+@pytest.fixture
+def query():
+    google = FakeGoogle(latency_ms=0, error_rate=0)
+    google.sheets["Visitors"] += [visit(n, company="Acme" if n % 2 else "Globex") for n in range(1, 8)]
+    cache = SheetCache("Visitors")
+    cache.bind(FakeWorksheet(google, "Visitors"))
+    return RowQuery(cache, VISITOR_COLUMNS)
+
+
+def names(page):
+    return [row[3] for n, row in page['rows']]
+
+
+def walk(query, **kwargs):
+    """Every page of a query, following next_cursor."""
+    pages, cursor = [], None
+    while True:
+        page = query.page(cursor=cursor, **kwargs)
+        pages.append(names(page))
+        cursor = page['next_cursor']
+        if cursor is None: return pages
+
+
+def test_pages_newest_first_by_default(query):
+    assert walk(query, limit=3) == [["Visitor 7", "Visitor 6", "Visitor 5"], ["Visitor 4", "Visitor 3", "Visitor 2"],
+                                    ["Visitor 1"]]
+    assert query.page(limit=3)['total'] == 7
+    assert walk(query, limit=4, descending=False) == [["Visitor 1", "Visitor 2", "Visitor 3", "Visitor 4"],
+                                                      ["Visitor 5", "Visitor 6", "Visitor 7"]]
+
+
+def test_cursor_is_stable_while_rows_arrive(query):
+    first = query.page(limit=3)
+    query.cache.append_row(visit(8))
+    query.cache.append_row(visit(9))
+    second = query.page(limit=3, cursor=first['next_cursor'])
+    assert names(second) == ["Visitor 4", "Visitor 3", "Visitor 2"]   # no repeats, no gaps
+    assert second['total'] == 9
+
+
+def test_column_sort_is_keyset_paginated(query):
+    pages = walk(query, sort='company', descending=False, limit=3)
+    assert pages == [["Visitor 1", "Visitor 3", "Visitor 5"], ["Visitor 7", "Visitor 2", "Visitor 4"], ["Visitor 6"]]
+    assert walk(query, sort='company', limit=4) == [["Visitor 6", "Visitor 4", "Visitor 2", "Visitor 7"],
+                                                    ["Visitor 5", "Visitor 3", "Visitor 1"]]
+    # Chronological columns fall back to sheet order
+    assert names(query.page(sort='date', limit=2)) == ["Visitor 7", "Visitor 6"]
+
+
+def test_filters_match_substrings_case_insensitively(query):
+    page = query.page(filters={'company': "glo"}, limit=2)
+    assert names(page) == ["Visitor 6", "Visitor 4"] and page['total'] == 3
+    assert names(query.page(filters={'company': "GLO"}, cursor=page['next_cursor'], limit=2)) == ["Visitor 2"]
+    assert names(query.page(candidates=[2, 3, 4], filters={'company': "acme"})) == ["Visitor 3", "Visitor 1"]
+
+
+def test_bad_arguments_are_rejected(query):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        query.page(cursor="not-a-cursor")
+    with pytest.raises(ValueError, match="Unknown sort column"):
+        query.page(sort='shoe_size')
+    assert len(query.page(limit=0)['rows']) == 1
+    assert decode_cursor(encode_cursor("acme", 5)) == ("acme", 5)
+
+
+def test_admin_visitor_list_route(gate, google):
+    google.sheets['Visitors'] += [visit(1, date="14-10-2026", out_time="05:00 PM"), visit(2, date="15-10-2026"),
+                                  visit(3, date="16-10-2026", out_time="06:00 PM")]
+    admin = login(gate, 'Admin', 'admin@x')
+
+    page = admin.get('/api/admin/visitors?limit=2').get_json()
+    assert [row[3] for row in page['rows']] == ["Visitor 3", "Visitor 2"] and page['total'] == 3
+    rest = admin.get(f"/api/admin/visitors?limit=2&cursor={page['next_cursor']}").get_json()
+    assert [row[3] for row in rest['rows']] == ["Visitor 1"] and rest['next_cursor'] is None
+
+    inside = admin.get('/api/admin/visitors?status=inside').get_json()
+    assert [row[3] for row in inside['rows']] == ["Visitor 2"]
+    out = admin.get('/api/admin/visitors?status=out&from=2026-10-15').get_json()
+    assert [row[3] for row in out['rows']] == ["Visitor 3"]
+
+    bad = admin.get('/api/admin/visitors?cursor=garbage')
+    assert bad.status_code == 400 and bad.get_json()['message'] == "Invalid cursor"
+    assert login(gate, 'Security', 'guard@x').get('/api/admin/visitors').status_code == 403
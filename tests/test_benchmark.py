@@ -0,0 +1,56 @@
+import time
+from argparse import Namespace
+
+import pytest
+from gspread.exceptions import APIError
+
+import benchmark
+from fake_google import FakeGoogle, FakeWorksheet
+from sheets_client import is_retryable
+
+
+def test_fake_calls_are_slowed_and_counted():
+    google = FakeGoogle(latency_ms=20, error_rate=0)
+    ws = FakeWorksheet(google, "Users")
+    started = time.perf_counter()
+    ws.append_row(["a@x", "Admin"])
+    ws.get_all_values()
+    assert time.perf_counter() - started >= 0.02          # two calls of 10-30 ms each
+    assert google.calls == {'sheets.append_row': 1, 'sheets.get_all_values': 1}
+    assert google.thread_calls() == google.total_calls() == 2
+
+
+def test_fake_quota_errors_look_like_the_real_ones():
+    google = FakeGoogle(latency_ms=0, error_rate=1)
+    with pytest.raises(APIError) as raised:
+        FakeWorksheet(google, "Users").get_all_values()
+    assert raised.value.response.status_code == 429 and is_retryable(raised.value)
+    assert google.stats()['errors'] == {'sheets.get_all_values': 1}
+
+
+def test_percentiles():
+    values = list(range(1, 101))
+    assert [benchmark.percentile(values, p) for p in (50, 95, 99)] == [50, 95, 99]
+    assert benchmark.percentile([7], 99) == 7 and benchmark.percentile([], 50) is None
+
+
+def test_recorder_counts_inline_calls_and_errors(gate, google):
+    rec = benchmark.Recorder(google)
+    guard = benchmark.client_for(gate.app, 'Security', 'guard@x')
+    rec.request(guard, 'active', 'GET', "/api/get_active_visitors")   # cold caches load inline
+    rec.request(guard, 'active', 'GET', "/api/get_active_visitors")
+    rec.request(guard, 'exit', 'POST', "/api/exit", json={'mobile': "9999999999"})
+    assert len(rec.latency['active']) == 2 and rec.inline_calls['active'] > 0
+    assert rec.errors == {'exit': 1}
+
+
+def test_scenarios_replay_against_the_app(gate, google):
+    benchmark.seed_history(google, visitors=30, bookings=6, days=5)
+    args = Namespace(clients=2, rush_visitors=2, poll_rounds=2, export_rounds=1, days=5)
+    photo = benchmark.sample_photo()
+    for name, scenario in benchmark.SCENARIOS.items():
+        rec = benchmark.Recorder(google)
+        scenario(gate, rec, args, photo)
+        assert rec.latency, name
+        assert set(rec.errors) <= {'POST /api/exit'}, name   # a mobile drawn twice is already out the second time
+    assert gate.visitors_cache.row_count() == 1 + 30 + 4
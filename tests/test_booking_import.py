@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+from booking_import import InvalidUpload, parse_records, validate
+from conftest import login
+
+CSV = """Phone Number,Visitor Name,Purpose,Company
+98765 43210,Asha,Interview,Acme
+,Ravi,Meeting,
+12345,Kumar,Meeting,
+98765-43210,Asha again,Interview,
+9000000001,Bala,,
+9000000002,Chandra,Seminar,
+"""
+
+
+def reasons(rejected):
+    return [(r['row'], r['reason']) for r in rejected]
+
+
+def test_every_rejected_row_says_why():
+    records = parse_records(CSV.encode(), 'text/csv', 'bookings.csv')
+    accepted, rejected = validate(records, has_pending=lambda mobile: mobile == "9000000002")
+    assert [(line, r['mobile'], r['name'], r['company']) for line, r in accepted] == [(1, "9876543210", "Asha", "Acme")]
+    assert reasons(rejected) == [
+        (2, "Missing mobile"),
+        (3, "Mobile number must have 10 digits"),
+        (4, "Duplicate of row 1 in this file"),
+        (5, "Missing purpose"),
+        (6, "Duplicate: Visitor has pending booking."),
+    ]
+    assert rejected[2]['mobile'] == "98765-43210"          # reported as uploaded
+
+
+def test_json_uploads_use_the_same_field_names():
+    raw = json.dumps({'bookings': [{'Mobile Number': "9000000001", 'visitor': "Asha", 'purpose': "Visit", 'Host': "Dr. K"}]})
+    assert parse_records(raw, 'application/json') == [{'mobile': "9000000001", 'name': "Asha", 'purpose': "Visit",
+                                                       'to_meet': "Dr. K"}]
+
+
+@pytest.mark.parametrize("raw, message", [
+    (b"", "No bookings in the upload"),
+    (b"\xff\xfe", "File must be UTF-8"),
+    (b"name,purpose\nAsha,Visit\n", "CSV needs a header row"),
+    (b"[1, 2]", "JSON must be a list of bookings"),
+    (b"{not json", "Invalid JSON"),
+])
+def test_unreadable_uploads_are_refused_as_a_whole(raw, message):
+    with pytest.raises(InvalidUpload, match=message):
+        parse_records(raw)
+
+
+def test_too_many_rows(monkeypatch):
+    monkeypatch.setattr('booking_import.MAX_IMPORT_ROWS', 2)
+    with pytest.raises(InvalidUpload, match="Too many rows"):
+        parse_records("mobile,name,purpose\n" + "9000000001,A,B\n" * 3)
+
+
+def test_import_route_writes_accepted_rows_in_one_append(gate, google):
+    host = login(gate, 'Faculty', 'asha.cse@sritcbe.ac.in')
+    assert host.post('/api/book_visitor', json={'mobile': "9000000002", 'name': "Chandra", 'purpose': "Visit"}
+                     ).get_json()['status'] == 'success'
+
+    dry = host.post('/api/bookings/import?dry_run=1', data={'file': (io.BytesIO(CSV.encode()), 'bookings.csv')}).get_json()
+    assert dry['dry_run'] and len(dry['accepted']) == 1 and len(google.sheets['Bookings']) == 2
+
+    google.calls.clear()
+    result = host.post('/api/bookings/import', data={'file': (io.BytesIO(CSV.encode()), 'bookings.csv')}).get_json()
+    assert result['accepted'] == [{'row': 1, 'mobile': "9876543210", 'name': "Asha"}]
+    assert reasons(result['rejected'])[-1] == (6, "Duplicate: Visitor has pending booking.")
+    assert google.calls['sheets.append_rows'] == 1
+    assert [row[4:8] for row in google.sheets['Bookings'][1:]] == [["9000000002", "Chandra", "Visit", "Pending"],
+                                                                  ["9876543210", "Asha", "Interview", "Pending"]]
+
+    bad = host.post('/api/bookings/import', data=b"{broken", content_type='application/json')
+    assert bad.status_code == 400
+    assert login(gate, 'Security', 'guard@x').post('/api/bookings/import', data=CSV).status_code == 403
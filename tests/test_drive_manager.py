@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+import drive_manager
+import fake_google
+
+
+@pytest.fixture
+def google():
+    backend = fake_google.backend()
+    with backend._lock:
+        backend.files.clear()
+    backend.calls.clear()
+    drive_manager.reset_drive_service()
+    yield backend
+    drive_manager.reset_drive_service()
+
+
+def folders(google):
+    return [f for f in google.files.values() if f['name'] != "v.jpg"]
+
+
+def test_daily_folder_is_looked_up_once_and_created_once(google):
+    links = []
+
+    def upload():
+        links.append(drive_manager.upload_photo_to_drive(b"jpeg", "v.jpg", "root"))
+
+    threads = [threading.Thread(target=upload) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert len(folders(google)) == 1
+    assert google.calls['drive.files.list'] == 1     # later uploads use the remembered id
+    assert google.calls['drive.files.create'] == 1 + 8
+    folder_id = next(fid for fid, f in google.files.items() if f['name'] != "v.jpg")
+    assert all(f['parents'] == [folder_id] for f in google.files.values() if f['name'] == "v.jpg")
+    assert all(drive_manager.drive_file_id(link) in google.files for link in links)
+
+
+def test_existing_folder_is_reused_after_a_restart(google):
+    drive_manager.upload_photo_to_drive(b"jpeg", "v.jpg", "root")
+    drive_manager.reset_drive_service()                # e.g. a new process
+    drive_manager.upload_photo_to_drive(b"jpeg", "v.jpg", "root")
+    assert len(folders(google)) == 1
+    assert google.calls['drive.files.list'] == 2
+
+
+def test_failed_lookup_falls_back_to_the_root_and_is_not_remembered(google, monkeypatch):
+    service = drive_manager.authenticate_drive()
+    monkeypatch.setattr(drive_manager, '_find_or_create_folder', lambda *a: "root")
+    assert drive_manager.get_or_create_daily_folder(service, "root") == "root"
+    monkeypatch.undo()
+    assert drive_manager.get_or_create_daily_folder(service, "root") != "root"
+
+
+def test_file_ids_are_read_from_either_link_form():
+    assert drive_manager.drive_file_id("https://drive.google.com/file/d/abc-1_2/view") == "abc-1_2"
+    assert drive_manager.drive_file_id("https://drive.google.com/open?id=xyz") == "xyz"
+    assert drive_manager.drive_file_id("pending-upload:123") is None
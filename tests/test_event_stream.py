@@ -0,0 +1,62 @@
+import time
+import threading
+
+from conftest import login
+from event_stream import EventBroker, parse_timeout
+
+
+def test_stream_ends_after_max_seconds_so_the_thread_is_freed():
+    broker = EventBroker()
+    started = time.monotonic()
+    chunks = list(broker.stream(heartbeat=0.05, max_seconds=0.2))
+    assert time.monotonic() - started < 1
+    assert chunks[0].startswith("retry:")
+    assert ": keep-alive\n\n" in chunks
+
+
+def test_stream_resumes_from_last_event_id():
+    broker = EventBroker()
+    first = broker.publish('visitor_in', {'pass_id': 1})
+    broker.publish('visitor_out', {'pass_id': 1})
+    stream = broker.stream(last_id=first, heartbeat=0.05, max_seconds=0.2)
+    chunks = list(stream)
+    assert any('event: visitor_out' in c for c in chunks)
+    assert not any('event: visitor_in' in c for c in chunks)
+
+
+def test_stream_slots_are_capped():
+    broker = EventBroker(max_streams=2)
+    assert broker.open_stream() and broker.open_stream()
+    assert not broker.open_stream()
+    broker.close_stream()
+    assert broker.open_stream()
+
+
+def test_long_poll_wakes_on_publish():
+    broker = EventBroker()
+    last = broker.last_id()
+    threading.Timer(0.05, broker.publish, ('booking_created', {'mobile': '1'})).start()
+    found = broker.wait(last, timeout=2)
+    assert [(t, d) for _, t, d in found] == [('booking_created', {'mobile': '1'})]
+
+
+def test_poll_timeout_is_parsed_leniently_and_clamped():
+    assert parse_timeout(None, 25) == 25
+    assert parse_timeout("abc", 25) == 25
+    assert parse_timeout("nan", 25) == 25
+    assert parse_timeout("-3", 25) == 0
+    assert parse_timeout("inf", 25) == 25
+    assert parse_timeout("2.5", 25) == 2.5
+
+
+def test_poll_route_rejects_nothing_it_can_not_parse(gate):
+    guard = login(gate, 'Security', 'guard@x')
+    last_id = guard.get('/api/events/poll').get_json()['last_id']
+    gate.events.publish('visitor_in', {'pass_id': 5})
+    for timeout in ("abc", "-1", ""):
+        response = guard.get(f'/api/events/poll?since={last_id}&timeout={timeout}')
+        assert response.status_code == 200
+        assert [e['data'] for e in response.get_json()['events']] == [{'pass_id': 5}]
+    started = time.monotonic()
+    assert guard.get(f'/api/events/poll?since={last_id + 10**9}&timeout=-5').get_json()['events'] == []
+    assert time.monotonic() - started < 1
@@ -0,0 +1,53 @@
+import io
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image
+
+from image_processor import THUMBNAIL_SIZE, make_thumbnail, process_photo
+
+
+def jpeg(width, height, exif=None, quality=95):
+    img = Image.effect_noise((width, height), 64).convert('RGB')
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=quality, **({'exif': exif} if exif else {}))
+    return out.getvalue()
+
+
+def opened(data):
+    return Image.open(io.BytesIO(data))
+
+
+def test_large_capture_is_downscaled_and_stripped():
+    exif = Image.Exif()
+    exif[0x0110] = "Webcam 9000"                       # camera model
+    original = jpeg(1920, 1080, exif=exif.tobytes())
+    photo = process_photo(original, max_dimension=800)
+    img = opened(photo.data)
+    assert img.size == (800, 450)
+    assert not img.getexif()
+    assert photo.original_bytes == len(original)
+    assert photo.saved_bytes == len(original) - len(photo.data) > 0
+    assert max(opened(photo.thumbnail).size) == THUMBNAIL_SIZE
+
+
+def test_orientation_is_applied_before_the_tag_is_dropped():
+    exif = Image.Exif()
+    exif[0x0112] = 6                                   # rotated 90 degrees
+    photo = process_photo(jpeg(400, 200, exif=exif.tobytes()))
+    assert opened(photo.data).size == (200, 400)
+
+
+def test_small_capture_that_would_grow_is_kept_as_is():
+    original = jpeg(64, 64, quality=10)
+    photo = process_photo(original, quality=95)
+    assert photo.data == original
+    assert photo.saved_bytes == 0
+
+
+def test_undecodable_bytes_are_uploaded_untouched():
+    photo = process_photo(b"not an image")
+    assert photo.data == b"not an image"
+    assert photo.thumbnail is None
+    assert make_thumbnail(b"not an image") is None
@@ -0,0 +1,75 @@
+import threading
+
+from fanout import fan_out
+from instrumentation import Metrics, BACKGROUND
+from conftest import login
+
+
+def test_fanned_out_calls_count_towards_the_request():
+    metrics = Metrics()
+    call = lambda method: (lambda: metrics.timed('sheets', method, lambda: None))
+
+    metrics.start_request()
+    metrics.set_route('dashboard')
+    fan_out(call('get_all_values'), call('get_all_values'), call('col_values'))
+    elapsed, upstream = metrics.finish_request('GET', 200)
+
+    assert upstream['sheets'][0] == 3
+    assert metrics.upstream_calls[('dashboard', 'sheets', 'get_all_values')] == 2
+    assert metrics.upstream_calls[('dashboard', 'sheets', 'col_values')] == 1
+    assert not any(route == BACKGROUND for route, _, _ in metrics.upstream_calls)
+
+
+def test_calls_outside_a_request_are_background():
+    metrics = Metrics()
+    metrics.start_request()
+    metrics.set_route('entry')
+    worker = threading.Thread(target=lambda: metrics.timed('drive', 'files.create', lambda: None))
+    worker.start()
+    worker.join()
+    _, upstream = metrics.finish_request('POST', 200)
+    metrics.timed('sheets', 'append_rows', lambda: None)  # after the response went out
+
+    assert upstream == {}
+    assert metrics.upstream_calls[(BACKGROUND, 'drive', 'files.create')] == 1
+    assert metrics.upstream_calls[(BACKGROUND, 'sheets', 'append_rows')] == 1
+
+
+def test_drive_calls_are_named_after_the_resource():
+    import instrumentation
+    from fake_google import FakeDriveService, FakeGoogle
+    metrics = Metrics()
+    drive = instrumentation.InstrumentedDrive(FakeDriveService(FakeGoogle(latency_ms=0, error_rate=0)))
+    original, instrumentation.metrics = instrumentation.metrics, metrics
+    try:
+        drive.files().list(q="name='x'").execute()
+    finally:
+        instrumentation.metrics = original
+    assert metrics.upstream_calls[(BACKGROUND, 'drive', 'files.list')] == 1
+
+
+def test_responses_carry_server_timing_and_metrics_are_scraped(gate, monkeypatch):
+    guard = login(gate, 'Security', 'guard@x')
+    timing = guard.get('/api/get_active_visitors').headers['Server-Timing']
+    assert timing.startswith("app;dur=") and 'sheets;desc="' in timing     # the cold cache loaded inline
+
+    assert guard.get('/metrics').status_code == 403
+    text = login(gate, 'Admin', 'admin@x').get('/metrics').get_data(as_text=True)
+    assert 'gatepass_requests_total{route="/api/get_active_visitors",method="GET",status="200"}' in text
+    assert 'gatepass_upstream_calls_total{route="/api/get_active_visitors",api="sheets",method="get_all_values"}' in text
+
+    monkeypatch.setattr(gate, 'METRICS_TOKEN', "s3cret")
+    scraper = gate.app.test_client()
+    assert scraper.get('/metrics', headers={'Authorization': "Bearer s3cret"}).status_code == 200
+    assert scraper.get('/metrics', headers={'Authorization': "Bearer wrong"}).status_code == 403
+
+
+def test_sampled_requests_are_profiled(gate, monkeypatch):
+    monkeypatch.setattr(gate.profiler, 'routes', {'/api/get_next_id'})
+    monkeypatch.setattr(gate.profiler, 'rate', 1.0)
+    gate.profiler.reset()
+    admin = login(gate, 'Admin', 'admin@x')
+    admin.get('/api/get_next_id')
+    assert gate.profiler.samples == {'/api/get_next_id': 1}
+    report = admin.get('/api/admin/profile').get_data(as_text=True)
+    assert report.startswith("=== /api/get_next_id (1 sampled requests) ===")
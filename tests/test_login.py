@@ -0,0 +1,41 @@
+def log_in(client, email, name="Someone"):
+    return client.post('/api/login', json={'email': email, 'name': name}).get_json()
+
+
+def test_staff_roles_come_from_the_cached_directory(gate, google):
+    google.sheets['Users'] += [["guard@sritcbe.ac.in", "Security"], ["Head@sritcbe.ac.in", "Admin"]]
+    client = gate.app.test_client()
+    assert log_in(client, "guard@sritcbe.ac.in")['status'] == 'success'
+    with client.session_transaction() as s:
+        assert (s['role'], s['dept']) == ('Security', 'SECURITY')
+
+    google.calls.clear()
+    assert log_in(client, " HEAD@sritcbe.ac.in ")['status'] == 'success'
+    with client.session_transaction() as s:
+        assert (s['user'], s['role'], s['dept']) == ('head@sritcbe.ac.in', 'Admin', 'ADMIN')
+    assert log_in(client, "stranger@gmail.com") == {'status': 'error', 'message': 'Access Denied: User not found.'}
+    assert google.total_calls() == 0                      # no find()/cell() round trips once loaded
+
+
+def test_new_faculty_are_registered_once_without_waiting_on_sheets(gate, google, monkeypatch):
+    monkeypatch.setattr(gate.sheet_writer, 'flush_interval', 60)   # queue writes as in production
+    gate.users_cache.row_count()
+    google.calls.clear()
+    client = gate.app.test_client()
+    for _ in range(2):
+        assert log_in(client, "asha.cse@sritcbe.ac.in", "Asha")['status'] == 'success'
+    with client.session_transaction() as s:
+        assert (s['role'], s['dept']) == ('Faculty', 'CSE')
+    assert google.total_calls() == 0 and gate.sheet_writer.pending_count('Users') == 1
+
+    gate.sheet_writer.flush()
+    assert google.sheets['Users'][1:] == [["asha.cse@sritcbe.ac.in", "Faculty", "Asha", "CSE"]]
+
+
+def test_directory_picks_up_users_added_in_the_sheet(gate, google):
+    gate.users_cache.row_count()
+    google.sheets['Users'].append(["new.guard@sritcbe.ac.in", "Security"])
+    client = gate.app.test_client()
+    assert log_in(client, "new.guard@sritcbe.ac.in")['status'] == 'error'
+    gate.users_cache.refresh()                            # what the TTL does in the background
+    assert log_in(client, "new.guard@sritcbe.ac.in")['status'] == 'success'
@@ -0,0 +1,67 @@
+import threading
+
+from fake_google import FakeGoogle
+from pass_id_allocator import PassIdAllocator, SheetPassIds
+from storage import SheetsStorage
+
+
+def test_peek_does_not_reserve(tmp_path):
+    ids = PassIdAllocator(str(tmp_path / "pass_id.hwm"), floor_fn=lambda: 41)
+    assert ids.peek() == 41
+    assert ids.peek() == 41                       # page loads and retries cost nothing
+    assert ids.allocate() == 42
+    assert ids.peek() == 42
+
+
+def test_workers_sharing_the_file_never_hand_out_the_same_id(tmp_path):
+    path = str(tmp_path / "pass_id.hwm")
+    workers = [PassIdAllocator(path) for _ in range(4)]
+    issued = []
+
+    def gate(ids):
+        for _ in range(50):
+            issued.append(ids.allocate())
+
+    threads = [threading.Thread(target=gate, args=(ids,)) for ids in workers]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert sorted(issued) == list(range(1, 201))
+
+
+def test_lost_file_continues_above_the_data(tmp_path):
+    path = tmp_path / "pass_id.hwm"
+    saved = [10]
+    ids = PassIdAllocator(str(path), floor_fn=lambda: max(saved))
+    saved.append(ids.allocate())
+    assert saved[-1] == 11
+    path.unlink()                                 # e.g. a wiped /tmp
+    assert ids.allocate() == 12
+
+
+def test_serverless_instances_take_ids_from_the_rows_their_appends_land_on():
+    google = FakeGoogle()
+    instances = [SheetPassIds(SheetsStorage(google.client(), sheet_id="fake"), floor_fn=lambda: 41) for _ in range(3)]
+    issued = []
+
+    def gate(ids):
+        for _ in range(20):
+            issued.append(ids.allocate())
+
+    threads = [threading.Thread(target=gate, args=(ids,)) for ids in instances]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert sorted(issued) == list(range(42, 102))
+    assert google.sheets["PassIds"][0] == ["Pass ID base", "41"]
+    assert google.calls["sheets.add_worksheet"] == 1
+    assert not any(google.calls[f"sheets.{m}"] for m in ("col_values", "get_all_values", "findall"))
+
+
+def test_serverless_base_is_kept_when_the_data_moves_on():
+    google = FakeGoogle()
+    first = SheetPassIds(SheetsStorage(google.client(), sheet_id="fake"), floor_fn=lambda: 10)
+    assert first.allocate() == 11
+    later = SheetPassIds(SheetsStorage(google.client(), sheet_id="fake"), floor_fn=lambda: 500)
+    assert later.allocate() == 12                 # the base was fixed when the sheet was created
+    calls = google.total_calls()
+    later.peek()
+    assert google.total_calls() == calls          # a preview reads nothing from Sheets
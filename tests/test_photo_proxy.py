@@ -0,0 +1,55 @@
+from conftest import check_in, login
+
+
+def test_photos_are_for_the_gate_and_admins_only(gate):
+    guard = login(gate, 'Security', 'guard@x')
+    pass_id = check_in(guard, "9000000001")['pass_id']
+    for path in (f"/api/photo/{pass_id}", f"/api/thumbnail/{pass_id}"):
+        assert guard.get(path).status_code == 200
+        assert login(gate, 'Admin', 'admin@x').get(path).status_code == 200
+        assert login(gate, 'Faculty', 'host@x').get(path).status_code == 403
+        assert gate.app.test_client().get(path).status_code == 403
+
+
+def test_thumbnails_are_cached_by_the_browser_and_the_server(gate, google):
+    guard = login(gate, 'Security', 'guard@x')
+    pass_id = check_in(guard, "9000000001")['pass_id']
+    google.calls.clear()
+
+    first = guard.get(f"/api/thumbnail/{pass_id}")           # made at check-in: no Drive call
+    assert first.status_code == 200 and first.mimetype == "image/jpeg"
+    assert first.cache_control.private and first.cache_control.max_age == gate.PHOTO_BROWSER_CACHE_SECONDS
+    again = guard.get(f"/api/thumbnail/{pass_id}", headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and again.get_data() == b""
+    assert google.total_calls() == 0
+
+
+def test_missing_thumbnails_are_made_from_drive_once(gate, google, tmp_path):
+    from image_processor import ThumbnailStore
+    guard = login(gate, 'Security', 'guard@x')
+    pass_id = check_in(guard, "9000000001")['pass_id']
+    gate.thumbnails = ThumbnailStore(directory=str(tmp_path / "other-server"))
+    google.calls.clear()
+
+    for _ in range(2):
+        assert guard.get(f"/api/thumbnail/{pass_id}").status_code == 200
+    assert google.calls['drive.files.get_media'] == 1
+    full = guard.get(f"/api/photo/{pass_id}")
+    stored = next(f['content'] for f in google.files.values() if f['size'])
+    assert full.status_code == 200 and full.get_data() == stored
+
+
+def test_photos_that_are_not_there_are_404(gate, google):
+    guard = login(gate, 'Security', 'guard@x')
+    assert guard.get("/api/photo/999").status_code == 404
+    assert guard.get("/api/thumbnail/999").status_code == 404
+
+    pass_id = check_in(guard, "9000000001")['pass_id']
+    google.files.clear()                                       # removed from Drive
+    assert guard.get(f"/api/photo/{pass_id}").status_code == 404
+
+    google.sheets['Visitors'].append(["16-10-2026", "10:00 AM", "9000000002", "Asha"] + [""] * 9 + ["50"])
+    gate.visitors_cache.refresh()                              # a visit with no photo link yet
+    google.calls.clear()
+    assert guard.get("/api/thumbnail/50").status_code == 404
+    assert google.calls['drive.files.get_media'] == 0        # nothing to fetch
@@ -0,0 +1,25 @@
+import io
+
+import pytest
+
+import report_export
+from report_export import export_stream, available_formats
+
+HEADER = ["Date", "Name", "Pass ID"]
+ROWS = [["01-10-2026", "Ravi", "2"], ["02-10-2026", "Asha", "3"]]
+
+
+def test_xlsx_report_opens_with_every_row():
+    openpyxl = pytest.importorskip("openpyxl")
+    chunks, mimetype, ext = export_stream('xlsx', HEADER, iter(ROWS))
+    book = openpyxl.load_workbook(io.BytesIO(b"".join(chunks)))
+    assert ext == 'xlsx'
+    assert [list(r) for r in book.active.iter_rows(values_only=True)] == [HEADER] + ROWS
+
+
+def test_xlsx_is_not_offered_without_openpyxl(monkeypatch):
+    monkeypatch.setattr(report_export, 'Workbook', None)
+    assert 'xlsx' not in available_formats()
+    assert 'csv' in available_formats()
+    with pytest.raises(ValueError):
+        export_stream('xlsx', HEADER, iter(ROWS))
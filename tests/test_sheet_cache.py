@@ -0,0 +1,158 @@
+import pytest
+
+from fake_google import FakeGoogle, FakeWorksheet
+from sheet_cache import SheetCache
+from sheet_index import KeyIndex, OpenVisitIndex, SheetIndex
+from storage import KEY_COLUMNS, IDENTITY_COLUMNS
+from write_coordinator import WriteCoordinator
+
+
+def visit(pass_id, name="Ravi", out_time=""):
+    return ["16-10-2026", "10:00 AM", "9876543210", name, "", "", "", "", "", "", out_time, "", "", str(pass_id)]
+
+
+@pytest.fixture
+def google():
+    return FakeGoogle()
+
+
+def instance(google, tmp_path, name, queued=True):
+    """One app instance: its own Visitors cache (and write queue, writing through as on Vercel)."""
+    cache = SheetCache("Visitors", key_col=KEY_COLUMNS["Visitors"], identity_cols=IDENTITY_COLUMNS["Visitors"])
+    ws = FakeWorksheet(google, "Visitors")
+    writer = None
+    if queued:
+        writer = WriteCoordinator(str(tmp_path / f"{name}.jsonl"), flush_interval=0)
+        writer.register("Visitors", ws, key_col=KEY_COLUMNS["Visitors"], on_moved=cache.expire)
+    cache.bind(ws, writer=writer)
+    cache.pass_ids = cache.add_index(KeyIndex(col=13))
+    cache.open_visits = cache.add_index(OpenVisitIndex(col=10))
+    return cache
+
+
+def sheet(google):
+    return [(row[3], row[10]) for row in google.sheets["Visitors"][1:]]
+
+
+def test_writes_go_to_the_sheet_and_the_cache(google, tmp_path):
+    cache = instance(google, tmp_path, "a")
+    assert cache.append_row(visit(2, "Asha")) == 2
+    cache.update_cell(2, 11, "11:00 AM")
+    assert sheet(google) == [("Asha", "11:00 AM")]
+    assert cache.get_row(2)[10] == "11:00 AM"
+    assert cache.pass_ids.row_for("2") == 2
+    assert cache.open_visits.count() == 0
+
+
+def test_check_out_lands_on_its_own_row_after_another_instance_appended(google, tmp_path):
+    a = instance(google, tmp_path, "a")
+    b = instance(google, tmp_path, "b")
+    a.row_count(), b.row_count()                  # both loaded before either writes
+
+    a.append_row(visit(2, "Alice"))
+    assert b.append_row(visit(3, "Bob")) == 2     # b's copy doesn't know about Alice yet...
+    b.update_cell(b.pass_ids.row_for("3"), 11, "10:00 AM")
+    assert sheet(google) == [("Alice", ""), ("Bob", "10:00 AM")]  # ...but the write finds Bob
+
+    b.refresh()                                   # b was told to reload
+    assert b.pass_ids.row_for("3") == 3
+    assert b.get_row(3)[10] == "10:00 AM"
+
+
+def test_direct_write_checks_the_row_and_reloads_when_it_moved(google, tmp_path):
+    a = instance(google, tmp_path, "a", queued=False)
+    b = instance(google, tmp_path, "b", queued=False)
+    a.row_count(), b.row_count()
+
+    a.append_row(visit(2, "Alice"))
+    b.append_row(visit(3, "Bob"))
+    b.update_cell(2, 11, "10:00 AM")              # row 2 in b's stale copy
+    assert sheet(google) == [("Alice", ""), ("Bob", "10:00 AM")]
+    assert b.get_row(3)[10] == "10:00 AM"
+    assert b.get_row(2)[3] == "Alice"
+
+
+def test_edit_to_a_row_deleted_elsewhere_is_not_applied(google, tmp_path):
+    cache = instance(google, tmp_path, "a", queued=False)
+    cache.append_row(visit(2, "Alice"))
+    del google.sheets["Visitors"][1]              # removed by hand in the Sheet
+    google.sheets["Visitors"].append(visit(3, "Bob"))
+    with pytest.raises(LookupError):
+        cache.update_cell(2, 11, "10:00 AM")
+    assert sheet(google) == [("Bob", "")]
+
+
+def test_refresh_waits_for_queued_writes(google, tmp_path):
+    cache = instance(google, tmp_path, "a")
+    cache.writer.flush_interval = 60              # queue instead of writing through
+    cache.append_row(visit(2, "Asha"))
+    assert sheet(google) == []
+    cache.refresh()
+    assert sheet(google) == [("Asha", "")]
+    assert cache.row_count() == 2
+
+
+def test_stale_rows_are_served_while_the_sheet_is_unreachable(google, tmp_path, monkeypatch):
+    cache = instance(google, tmp_path, "a")
+    cache.append_row(visit(2, "Asha"))
+    cache.ttl = 0
+    cache._lost_races = 99                        # refresh in place rather than in the background
+
+    def down():
+        raise ConnectionError("offline")
+    monkeypatch.setattr(cache.ws, "get_all_values", down)
+    assert cache.get_row(2)[3] == "Asha"
+    assert cache.degraded == "offline"
+    assert cache.staleness() is not None
+
+
+class Recorder(SheetIndex):
+    """Counts how the cache maintains its indexes."""
+
+    def __init__(self):
+        self.rebuilds, self.appended, self.updated = 0, [], []
+
+    def rebuild(self, rows):
+        self.rebuilds += 1
+        super().rebuild(rows)
+
+    def clear(self):
+        self.appended, self.updated = [], []
+
+    def on_append(self, row_number, row):
+        self.appended.append(row_number)
+
+    def on_update(self, row_number, col, old_value, row):
+        self.updated.append((row_number, col, old_value, row[col - 1]))
+
+
+def test_refresh_reindexes_only_changed_and_new_rows(google, tmp_path):
+    google.sheets["Visitors"] += [visit(n, f"Visitor {n}") for n in range(2, 12)]
+    cache = instance(google, tmp_path, "a", queued=False)
+    recorder = cache.add_index(Recorder())
+    assert cache.row_count() == 11 and recorder.rebuilds == 1
+
+    google.sheets["Visitors"][3][10] = "05:00 PM"           # closed by hand in the Sheet
+    google.sheets["Visitors"].append(visit(12, "Visitor 12"))
+    recorder.clear()
+    cache.refresh()
+    assert recorder.rebuilds == 1
+    assert recorder.updated == [(4, 11, "", "05:00 PM")] and recorder.appended == [12]
+    assert cache.open_visits.open_rows() == [n for n in range(2, 13) if n != 4]
+    assert cache.pass_ids.row_for("12") == 12
+
+    del google.sheets["Visitors"][5]                          # rows deleted: start again
+    cache.refresh()
+    assert recorder.rebuilds == 2
+    assert cache.pass_ids.row_for("12") == 11 and cache.pass_ids.row_for("6") is None
+
+
+def test_background_reload_patches_the_indexes(google, tmp_path):
+    google.sheets["Visitors"] += [visit(n, f"Visitor {n}") for n in range(2, 12)]
+    cache = instance(google, tmp_path, "a", queued=False)
+    recorder = cache.add_index(Recorder())
+    cache.row_count()
+    google.sheets["Visitors"][2][13] = "99"                  # pass ID corrected by hand
+    cache._revalidate()
+    assert recorder.rebuilds == 1 and recorder.updated == [(3, 14, "3", "99")]
+    assert cache.pass_ids.row_for("99") == 3 and cache.pass_ids.row_for("3") is None
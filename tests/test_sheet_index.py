@@ -0,0 +1,74 @@
+from datetime import date
+
+import pytest
+
+from fake_google import FakeGoogle, FakeWorksheet
+from sheet_cache import SheetCache
+from sheet_index import DateIndex, KeyIndex, MaxValueIndex, MobileIndex, StatusIndex
+
+
+def booking(mobile, status="Pending", booked_at="16-10-2026 09:00"):
+    return [booked_at, "host@x", "Host", "CSE", mobile, "Asha", "Meeting", status]
+
+
+@pytest.fixture
+def google():
+    return FakeGoogle()
+
+
+@pytest.fixture
+def bookings(google):
+    google.sheets["Bookings"] += [booking("98765 43210"), booking("9000000001", "Arrived"), booking("98765-43210")]
+    cache = SheetCache("Bookings")
+    cache.bind(FakeWorksheet(google, "Bookings"))
+    cache.mobiles = cache.add_index(MobileIndex(col=4))
+    cache.status = cache.add_index(StatusIndex(col=7))
+    return cache
+
+
+def test_mobile_lookups_ignore_formatting(bookings):
+    assert bookings.mobiles.rows_for("9876543210") == [2, 4]
+    assert bookings.mobiles.last_row_for("98765 43210") == 4
+    assert bookings.mobiles.rows_for("1234") == []
+
+
+def test_indexes_follow_our_own_writes_without_a_reload(bookings, google):
+    bookings.row_count()
+    refreshes = bookings.refreshes
+    bookings.append_row(booking("9000000002"))
+    bookings.update_cell(2, 8, "Arrived")
+    assert bookings.mobiles.rows_for("9000000002") == [5]
+    assert bookings.status.rows_with("Pending") == [4, 5]
+    assert bookings.status.rows_with("Arrived") == [2, 3]
+    assert bookings.status.has(2, "Arrived") and not bookings.status.has(2, "Pending")
+    assert bookings.refreshes == refreshes
+    assert google.calls["sheets.get_all_values"] == 1
+
+
+def test_indexes_pick_up_edits_made_in_the_sheet_on_refresh(bookings, google):
+    bookings.row_count()
+    google.sheets["Bookings"][3][7] = "Cancelled"
+    google.sheets["Bookings"].append(booking("9000000003"))
+    bookings.refresh()
+    assert bookings.status.rows_with("Cancelled") == [4]
+    assert bookings.status.rows_without("Cancelled") == [2, 3, 5]
+    assert bookings.mobiles.rows_for("9876543210") == [2, 4]
+    assert bookings.mobiles.rows_for("9000000003") == [5]
+
+
+def test_dates_keys_and_max_values(google):
+    rows = google.sheets["Visitors"]
+    for day, pass_id, email in (("15-10-2026", "4", "A@x"), ("14-10-2026", "9", "b@x"), ("16-10-2026", "", "a@x"), ("bad", "x", "")):
+        rows.append([day, "", "", "", "", "", "", "", "", "", "", email, "", pass_id])
+    cache = SheetCache("Visitors")
+    cache.bind(FakeWorksheet(google, "Visitors"))
+    dates = cache.add_index(DateIndex(col=0))
+    guards = cache.add_index(KeyIndex(col=11))
+    max_id = cache.add_index(MaxValueIndex(col=13))
+
+    assert dates.rows_between(date(2026, 10, 15), date(2026, 10, 16)) == [2, 4]
+    assert dates.count_on(date(2026, 10, 14)) == 1
+    assert guards.row_for(" a@X ") == 2              # first row with the key, case-insensitive
+    assert max_id.value() == 9
+    cache.update_cell(4, 14, "12")
+    assert max_id.value() == 12
@@ -0,0 +1,53 @@
+import pytest
+from gspread.exceptions import APIError
+
+from fake_google import FakeGoogle, FakeWorksheet, _QuotaResponse
+from sheets_client import ResilientWorksheet, SheetsClient, UpstreamUnavailable
+
+
+class Flaky(FakeWorksheet):
+    """Fails the next calls to the named methods, after (landed) or before (refused) doing them."""
+
+    def __init__(self, backend, name):
+        super().__init__(backend, name)
+        self.failures = {}
+
+    def _fail(self, method, landed):
+        if self.failures.get(method):
+            self.failures[method] -= 1
+            if landed: raise ConnectionError("response lost")
+            raise APIError(_QuotaResponse())
+
+    def append_rows(self, rows, **kwargs):
+        self._fail('append_rows', landed=False)
+        result = super().append_rows(rows, **kwargs)
+        self._fail('lost', landed=True)
+        return result
+
+    def get_all_values(self):
+        self._fail('get_all_values', landed=True)
+        return super().get_all_values()
+
+
+@pytest.fixture
+def ws():
+    google = FakeGoogle(latency_ms=0, error_rate=0)
+    return Flaky(google, "Users")
+
+
+def test_a_write_whose_response_was_lost_is_not_sent_again(ws):
+    client = SheetsClient(per_minute=60000, burst=100, max_retries=3, backoff=0)
+    ws.failures['lost'] = 1
+    with pytest.raises(UpstreamUnavailable):
+        ResilientWorksheet(ws, client).append_rows([["a@x", "Admin", "Asha", "CSE"]])
+    assert ws.backend.sheets["Users"][1:] == [["a@x", "Admin", "Asha", "CSE"]]
+    assert client.retries == 0
+
+
+def test_writes_refused_by_the_quota_and_failed_reads_are_retried(ws):
+    client = SheetsClient(per_minute=60000, burst=100, max_retries=3, backoff=0)
+    resilient = ResilientWorksheet(ws, client)
+    ws.failures.update(append_rows=2, get_all_values=2)
+    resilient.append_rows([["a@x", "Admin", "Asha", "CSE"]])
+    assert resilient.get_all_values()[1:] == [["a@x", "Admin", "Asha", "CSE"]]
+    assert client.retries == 4 and client.breaker.state == 'closed'
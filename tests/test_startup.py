@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import threading
+import subprocess
+
+from fake_google import FakeGoogle, FakeWorksheet
+from sheet_cache import SheetCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter: this test session has long since imported everything
+COLD_IMPORT = r"""
+import sys, json
+import fake_google, app
+status = app.app.test_client().get('/').status_code
+print(json.dumps({'status': status, 'calls': fake_google.backend().total_calls(), 'connected': app.ws_visitors is not None,
+                  'loaded': [m for m in ('gspread', 'googleapiclient.discovery') if m in sys.modules]}))
+"""
+
+
+def test_login_page_is_served_before_anything_connects(tmp_path):
+    env = dict(os.environ, PYTHONPATH=ROOT, GATEPASS_DATA_DIR=str(tmp_path))
+    out = subprocess.run([sys.executable, '-c', COLD_IMPORT], env=env, cwd=str(tmp_path),
+                         capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == {'status': 200, 'calls': 0, 'connected': False, 'loaded': []}
+
+
+def test_concurrent_first_requests_connect_once(gate, monkeypatch):
+    attempts = []
+    started = threading.Event()
+
+    def connect():
+        attempts.append(1)
+        started.wait(1)
+        monkeypatch.setattr(gate, 'ws_visitors', object())
+        return True
+
+    monkeypatch.setattr(gate, 'ws_visitors', None)
+    monkeypatch.setattr(gate, 'connect_to_db', connect)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(gate.ensure_db())) for _ in range(8)]
+    for t in threads: t.start()
+    started.set()
+    for t in threads: t.join()
+    assert results == [True] * 8 and len(attempts) == 1
+
+
+def test_failed_connection_backs_off(gate, monkeypatch):
+    attempts = []
+    monkeypatch.setattr(gate, 'ws_visitors', None)
+    monkeypatch.setattr(gate, '_db_failed_at', None)
+    monkeypatch.setattr(gate, 'connect_to_db', lambda: bool(attempts.append(1)))
+    assert gate.ensure_db() is False and gate.ensure_db() is False
+    assert len(attempts) == 1
+
+
+def test_snapshot_serves_the_first_read_of_a_new_process(tmp_path, monkeypatch):
+    google = FakeGoogle(latency_ms=0, error_rate=0)
+    google.sheets["Users"] += [["a@x", "Admin", "Asha", "ADMIN"]]
+    path = str(tmp_path / "Users.json.gz")
+
+    first = SheetCache("Users", snapshot_path=path)
+    first.bind(FakeWorksheet(google, "Users"))
+    first.row_count()
+    for t in threading.enumerate():
+        if t.name == 'Users-snapshot': t.join()
+    assert os.path.exists(path)
+
+    google.sheets["Users"].append(["b@x", "Security", "Bala", "GATE"])
+    google.calls.clear()
+    monkeypatch.setattr(SheetCache, '_start_revalidate', lambda self: None)   # hold the background download back
+    second = SheetCache("Users", snapshot_path=path)
+    second.bind(FakeWorksheet(google, "Users"))
+    assert second.get_rows()[1:] == [["a@x", "Admin", "Asha", "ADMIN"]]
+    assert google.total_calls() == 0 and second.staleness() is not None
+    second.append_row(["c@x", "Faculty", "Chandra", "CSE"])       # writes never land on snapshot rows
+    assert second.get_rows()[1:] == [["a@x", "Admin", "Asha", "ADMIN"], ["b@x", "Security", "Bala", "GATE"],
+                                     ["c@x", "Faculty", "Chandra", "CSE"]]
+    assert second.staleness() is None
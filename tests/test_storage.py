@@ -0,0 +1,81 @@
+from fake_google import FakeClient, FakeGoogle
+from storage import KEY_COLUMNS, MirroredTable, SheetsStorage, SQLiteStorage
+from write_coordinator import WriteCoordinator
+
+
+def test_two_handles_see_each_others_columns(tmp_path):
+    # Two gunicorn workers open the same database file
+    path = str(tmp_path / "gatepass.db")
+    a = SQLiteStorage(path, track_changes=True).table("Bookings")
+    b = SQLiteStorage(path, track_changes=True).table("Bookings")
+    b.get_all_values()  # b caches the width it saw before a widened the table
+
+    a.append_rows([["a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k"]])
+    assert b.row_values(1) == ["a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k"]
+    assert b.get_all_values() == [["a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k"]]
+
+    # Appending wider rows from both handles must not re-add a column the other created
+    a.append_rows([["x"] * 12])
+    b.append_rows([["y"] * 13])
+    b.update_cell(1, 14, "z")
+    assert a.row_values(3) == ["y"] * 13
+    assert a.cell(1, 14).value == "z"
+    assert a.col_values(13) == ["", "", "y"]
+    assert [c.row for c in a.findall("y")] == [3] * 13
+
+
+def test_rolled_back_widening_is_not_remembered(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "gatepass.db"))
+    table = storage.table("Users")
+    try:
+        with storage.write() as db:
+            table._ensure_width(db, 6)
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    table.append_rows([["u@x", "Admin"]])
+    assert table.get_all_values() == [["u@x", "Admin"]]
+    assert table._width == 2
+
+
+def test_sqlite_tables_answer_like_worksheets(tmp_path):
+    google = FakeGoogle(latency_ms=0, error_rate=0)
+    storages = [SheetsStorage(FakeClient(google), "fake"), SQLiteStorage(str(tmp_path / "gatepass.db"))]
+    google.sheets["Users"] = []
+    for storage in storages:
+        table = storage.table("Users")
+        table.append_rows([["a@x", "Admin", "Asha", "CSE"], ["b@x", "Security"]])
+        table.append_row(["c@x", "Faculty", "Chandra", "ECE"])
+        table.update_cell(2, 3, "Bala")
+    sheet, local = (storage.table("Users") for storage in storages)
+    assert local.get_all_values() == sheet.get_all_values()
+    assert local.row_values(2) == sheet.row_values(2) == ["b@x", "Security", "Bala"]
+    assert local.col_values(1) == sheet.col_values(1) == ["a@x", "b@x", "c@x"]
+    assert local.find("c@x").row == sheet.find("c@x").row == 3
+    assert local.cell(3, 3).value == sheet.cell(3, 3).value == "Chandra"
+
+
+def test_sqlite_runs_in_wal_mode(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "gatepass.db"))
+    assert storage.read().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_local_writes_are_mirrored_to_the_sheet(tmp_path):
+    google = FakeGoogle(latency_ms=0, error_rate=0)
+    google.sheets["Users"] += [["a@x", "Admin", "Asha", "CSE"]]
+    sheets = SheetsStorage(FakeClient(google), "fake")
+    local = SQLiteStorage(str(tmp_path / "gatepass.db"))
+    local.import_from(sheets)
+    assert local.table("Users").get_all_values() == google.sheets["Users"]
+
+    writer = WriteCoordinator(str(tmp_path / "journal.jsonl"), flush_interval=60)
+    writer.register("Users", sheets.table("Users"), key_col=KEY_COLUMNS["Users"])
+    users = MirroredTable(local.table("Users"), writer, "Users")
+    google.calls.clear()
+    users.append_row(["b@x", "Security", "Bala", "GATE"])
+    users.update_cell(2, 4, "EEE")
+    assert local.table("Users").row_values(3) == ["b@x", "Security", "Bala", "GATE"]
+    assert google.total_calls() == 0                       # the check-in path never waits on Sheets
+    writer.flush()
+    assert writer.pending_count() == 0
+    assert google.sheets["Users"] == local.table("Users").get_all_values()
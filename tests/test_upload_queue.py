@@ -0,0 +1,111 @@
+import threading
+import time
+
+import upload_queue
+from conftest import check_in, login
+from upload_queue import UploadQueue
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_photo_taken_while_drive_is_down_is_uploaded_after_a_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_queue, 'UPLOAD_RETRY_INTERVAL', 3600)  # no in-process retry during the test
+    spool = str(tmp_path / "spool")
+
+    def drive_down(image_bytes, filename, folder_id):
+        raise ConnectionError("offline")
+
+    failed = []
+    queue = UploadQueue(drive_down, workers=0, spool_dir=spool)
+    job_id = queue.submit(queue.new_job_id(), b"jpeg", "v.jpg", "folder", on_failed=failed.append, key=7)
+    assert queue.status(job_id)['status'] == 'waiting'
+    assert queue.spooled() == 1
+    assert failed == []
+
+    # Process restarts with Drive back
+    uploaded, done = [], []
+
+    def drive_up(image_bytes, filename, folder_id):
+        uploaded.append((image_bytes, filename, folder_id))
+        return "https://drive/v.jpg"
+
+    restarted = UploadQueue(drive_up, workers=0, spool_dir=spool)
+    restarted.restore(on_done=lambda key, link: done.append((key, link)))
+    wait_for(lambda: restarted.spooled() == 0)
+    assert uploaded == [(b"jpeg", "v.jpg", "folder")]
+    assert done == [(7, "https://drive/v.jpg")]
+
+
+def test_uploaded_photo_whose_callback_failed_is_not_uploaded_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_queue, 'UPLOAD_RETRY_INTERVAL', 3600)
+    spool = str(tmp_path / "spool")
+    uploads = []
+
+    def drive(image_bytes, filename, folder_id):
+        uploads.append(filename)
+        return "https://drive/v.jpg"
+
+    def sheet_down(link):
+        raise ConnectionError("sheet offline")
+
+    queue = UploadQueue(drive, workers=0, spool_dir=spool)
+    queue.submit(queue.new_job_id(), b"jpeg", "v.jpg", "folder", on_done=sheet_down, key=7)
+    assert queue.spooled() == 1
+
+    done = []
+    restarted = UploadQueue(drive, workers=0, spool_dir=spool)
+    restarted.restore(on_done=lambda key, link: done.append((key, link)))
+    wait_for(lambda: restarted.spooled() == 0)
+    assert uploads == ["v.jpg"]                      # the saved link is reused
+    assert done == [(7, "https://drive/v.jpg")]
+
+
+def test_upload_runs_off_the_request_thread_and_reports_its_link(tmp_path):
+    started = threading.Event()
+    release = threading.Event()
+
+    def drive(image_bytes, filename, folder_id):
+        started.set()
+        release.wait(5)
+        return "https://drive/v.jpg"
+
+    done = []
+    queue = UploadQueue(drive, workers=1, backoff=0)
+    job_id = queue.submit(queue.new_job_id(), b"jpeg", "v.jpg", "folder", on_done=done.append)
+    assert started.wait(5)
+    assert queue.status(job_id)['status'] == 'uploading'   # submit() returned while the upload runs
+    release.set()
+    wait_for(lambda: queue.status(job_id)['status'] == 'done')
+    assert done == ["https://drive/v.jpg"]
+    assert queue.stats()['completed'] == 1
+
+
+def test_failed_attempts_are_retried_then_given_up(tmp_path):
+    attempts = []
+
+    def flaky(image_bytes, filename, folder_id):
+        attempts.append(1)
+        if len(attempts) < 3: raise ConnectionError("timeout")
+        return None if len(attempts) == 3 else "https://drive/v.jpg"
+
+    failed = []
+    queue = UploadQueue(flaky, workers=0, max_attempts=3, backoff=0)
+    job_id = queue.submit(queue.new_job_id(), b"jpeg", "v.jpg", "folder", on_failed=failed.append)
+    assert queue.status(job_id)['status'] == 'failed'
+    assert queue.status(job_id)['attempts'] == 3
+    assert failed == ["Drive returned no link"]
+    assert queue.stats()['retries'] == 2
+
+
+def test_check_in_returns_before_the_photo_link_is_written(gate, google):
+    guard = login(gate, 'Security', 'guard@x')
+    result = check_in(guard, "9000000001")
+    assert result['photo'].startswith(upload_queue.PENDING_PHOTO_PREFIX)
+    status = guard.get(f"/api/upload_status/{result['upload_id']}").get_json()
+    assert status['upload']['status'] == 'done'            # uploaded inline here (PHOTO_UPLOAD_WORKERS=0)
+    assert google.sheets['Visitors'][1][9] == status['upload']['link']
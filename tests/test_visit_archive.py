@@ -0,0 +1,149 @@
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from daily_stats import VisitStats
+from fake_google import FakeGoogle, FakeWorksheet
+from sheet_cache import SheetCache
+from sheet_index import KeyIndex
+from visit_archive import VisitArchive, ArchiveJob
+
+OLD = date.today() - timedelta(days=100)
+RECENT = date.today() - timedelta(days=1)
+
+
+def visit(day, pass_id, mobile="9876543210", out="11:00 AM"):
+    return [day.strftime("%d-%m-%Y"), "10:00 AM", mobile, "Ravi", "Engineer", "Acme", "No",
+            "Host", "CSE", "", out, "guard", "", str(pass_id)]
+
+
+class FlakyWorksheet(FakeWorksheet):
+    """Fails delete_rows on request: before deleting, or after (a delete that went through but reported an error)."""
+
+    fail = None
+
+    def delete_rows(self, start_index, end_index=None):
+        if self.fail == 'before':
+            self.fail = None
+            raise ConnectionError("network down")
+        super().delete_rows(start_index, end_index)
+        if self.fail == 'after':
+            self.fail = None
+            raise ConnectionError("response lost")
+
+
+@pytest.fixture
+def setup(tmp_path):
+    google = FakeGoogle()
+    sheet = google.sheets['Visitors']
+    sheet.append(visit(OLD, 2))
+    sheet.append(visit(OLD, 3, out=""))                  # still inside: stays live
+    sheet.append(visit(OLD + timedelta(days=1), 4, mobile="9000000000"))
+    sheet.append(visit(RECENT, 5))
+    sheet.append(visit(OLD + timedelta(days=2), 6))
+    ws = FlakyWorksheet(google, 'Visitors')
+    archive = VisitArchive(str(tmp_path / "archive"))
+    cache = SheetCache("Visitors")
+    stats = cache.add_index(VisitStats(archive=archive))
+    pass_ids = cache.add_index(KeyIndex(col=13))
+    cache.bind(ws)
+    job = ArchiveJob(cache, archive, after_days=30)
+    return sheet, ws, archive, cache, stats, pass_ids, job
+
+
+def live_ids(sheet):
+    return [row[13] for row in sheet[1:]]
+
+
+def test_archived_days_stay_in_stats(setup):
+    sheet, ws, archive, cache, stats, pass_ids, job = setup
+    before = stats.summary(OLD)
+    total = stats.total_entries()
+
+    summary = job.run()
+
+    assert summary['removed'] == 3
+    assert live_ids(sheet) == ["3", "5"]
+    assert stats.summary(OLD) == before
+    assert stats.entries_on(OLD + timedelta(days=1)) == 1
+    assert stats.total_entries() == total
+    assert stats.summary(OLD)['dwell_minutes']['count'] == 1  # the open visit has no dwell yet
+
+
+def test_crash_between_archive_and_delete_finishes_on_next_run(setup):
+    sheet, ws, archive, cache, stats, pass_ids, job = setup
+    ws.fail = 'before'
+    with pytest.raises(ConnectionError):
+        job.run()
+    assert archive.count() == 3
+    assert live_ids(sheet) == ["2", "3", "4", "5", "6"]  # a copy in both, not in neither
+
+    summary = job.run()
+    assert summary['archived'] == 0                      # already archived: not added twice
+    assert summary['removed'] == 3
+    assert archive.count() == 3
+    assert live_ids(sheet) == ["3", "5"]
+    assert cache.get_row(pass_ids.row_for("5"))[13] == "5"
+
+
+def test_delete_that_reported_an_error_is_not_repeated(setup):
+    sheet, ws, archive, cache, stats, pass_ids, job = setup
+    ws.fail = 'after'  # the bottom run (row 6) is deleted, then the call fails
+    with pytest.raises(ConnectionError):
+        job.run()
+    assert live_ids(sheet) == ["2", "3", "4", "5"]
+
+    job.run()
+    assert live_ids(sheet) == ["3", "5"]
+    assert sorted(r[13] for r in archive.scan([13])) == ["2", "4", "6"]
+
+
+def test_row_number_pass_ids_are_frozen_before_rows_move(setup):
+    sheet, ws, archive, cache, stats, pass_ids, job = setup
+    sheet[4][13] = ""  # RECENT visit written before pass IDs existed: its ID is its row number, 5
+    job.run()
+    assert live_ids(sheet) == ["3", "5"]
+
+
+def test_archive_survives_reopen_and_drops_replaced_versions(tmp_path, setup):
+    sheet, ws, archive, cache, stats, pass_ids, job = setup
+    job.run()
+    header = sheet[0]
+    archive.add(header, [visit(OLD, 7)])                 # same month: a new partition version
+    reopened = VisitArchive(archive.directory)
+    assert reopened.count() == 4
+    assert [r[13] for r in reopened.rows_between(OLD, OLD)] == ["2", "7"]
+    assert [r[13] for r in reopened.rows_for_mobile("9000000000")] == ["4"]
+    assert reopened.row_for_key(6)[13] == "6"
+    reopened.add(header, [visit(OLD, 8)])
+    # The version just replaced stays for readers still using it; older ones are gone
+    versions = sorted(d.name for d in (tmp_path / "archive").iterdir() if d.is_dir())
+    month = OLD.strftime('%Y-%m')
+    assert versions == [f"{month}.v2", f"{month}.v3"]
+    assert reopened.manifest['partitions'][month]['dir'] == f"{month}.v3"
+
+
+def test_writes_go_on_while_the_archive_is_written(setup, monkeypatch):
+    sheet, ws, archive, cache, stats, pass_ids, job = setup
+    cache.row_count()
+    add = archive.add
+    during = {}
+
+    def slow_add(header, rows, replace=False):
+        if not replace:
+            # A check-in, and an edit to a row being archived, while the partitions are written
+            writer = threading.Thread(target=lambda: (cache.append_row(visit(RECENT, 7)),
+                                                      cache.update_cell(pass_ids.row_for("4"), 10, "photo-link")))
+            writer.start()
+            writer.join(2)
+            during['blocked'] = writer.is_alive()
+        return add(header, rows, replace)
+    monkeypatch.setattr(archive, 'add', slow_add)
+
+    summary = job.run()
+    assert during == {'blocked': False}
+    assert summary['removed'] == 3 and summary['re_archived'] == 1
+    assert live_ids(sheet) == ["3", "5", "7"]
+    assert archive.row_for_key(4)[9] == "photo-link"     # the edit made it into the archive
+    assert archive.count() == 3
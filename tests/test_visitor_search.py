@@ -0,0 +1,77 @@
+import pytest
+
+from fake_google import FakeGoogle, FakeWorksheet
+from sheet_cache import SheetCache
+from visitor_search import VisitorSearch
+from conftest import login
+
+
+def visit(mobile, name, company="-", vehicle="-", date="16-10-2026"):
+    return [date, "10:00 AM", mobile, name, "Guest", company, "", "", "", "", "", "", vehicle, ""]
+
+
+@pytest.fixture
+def visitors():
+    google = FakeGoogle(latency_ms=0, error_rate=0)
+    google.sheets["Visitors"] += [
+        visit("98765 43210", "Rajesh Kumar", "Acme Tools", "TN 38 AB 1234"),
+        visit("9000000001", "Raja Ravi", "Globex"),
+        visit("9000000002", "Priya", "Acme Tools", "KA 01 Z 777"),
+        visit("98765-43210", "Rajesh Kumar", "Acme Tools"),            # a second visit, same person
+    ]
+    cache = SheetCache("Visitors")
+    cache.bind(FakeWorksheet(google, "Visitors"))
+    cache.search = cache.add_index(VisitorSearch(mobile_col=2, name_col=3, company_col=5, vehicle_col=12))
+    return cache
+
+
+def found(cache, query):
+    return [mobile for mobile, *_ in cache.search.search(query)]
+
+
+def test_name_prefixes_rank_exact_words_first(visitors):
+    assert found(visitors, "raj") == ["9876543210", "9000000001"]   # most recent visit first among equals
+    assert found(visitors, "raja") == ["9000000001"]                # not a typo of 'rajesh', which is two edits away
+    mobile, score, last_row, visits = visitors.search.search("rajesh")[0]
+    assert (mobile, last_row, visits) == ("9876543210", 5, 2)
+
+
+def test_one_typo_still_finds_long_words(visitors):
+    assert found(visitors, "rajsh") == ["9876543210"]               # letter left out
+    assert found(visitors, "rajesj") == ["9876543210"]              # letter swapped for another
+    assert found(visitors, "priyaa") == ["9000000002"]              # letter added
+    assert found(visitors, "globx") == ["9000000001"]               # company words too
+    assert found(visitors, "prkxa") == []                           # two letters wrong is too far
+    assert found(visitors, "ravx") == ["9000000001"]
+    assert found(visitors, "rvi") == []                             # shorter words must be typed right
+
+
+def test_numbers_match_from_either_end(visitors):
+    assert found(visitors, "98765") == ["9876543210"]
+    assert found(visitors, "3210") == ["9876543210"]
+    assert found(visitors, "00002") == ["9000000002"]
+    assert found(visitors, "0000") == []                            # the middle of a number is not indexed
+
+
+def test_plates_and_several_words(visitors):
+    assert found(visitors, "TN 38 AB 1234") == ["9876543210"]
+    assert found(visitors, "777") == ["9000000002"]
+    assert found(visitors, "acme raj") == ["9876543210"]            # every word must match
+    assert found(visitors, "acme") == ["9876543210", "9000000002"]
+
+
+def test_edits_and_new_visits_are_searchable_at_once(visitors):
+    visitors.update_cell(3, 4, "Ravi Shankar")
+    assert found(visitors, "raja") == []
+    assert found(visitors, "shankar") == ["9000000001"]
+    visitors.append_row(visit("9111111111", "Rajan"))
+    assert found(visitors, "rajan")[0] == "9111111111"
+
+
+def test_suggest_route(gate, google):
+    google.sheets["Visitors"] += [visit("9000000001", "Rajesh", "Acme")]
+    guard = login(gate, 'Security', 'guard@x')
+    result = guard.get('/api/suggest_visitors?q=rajsh').get_json()
+    assert [(r['mobile'], r['name'], r['visits']) for r in result['results']] == [("9000000001", "Rajesh", 1)]
+    assert guard.get('/api/suggest_visitors?q=r').get_json()['results'] == []
+    assert login(gate, 'Faculty', 'host@x').get('/api/suggest_visitors?q=raj').status_code == 403
@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from fake_google import FakeGoogle, FakeWorksheet
+from sheet_cache import SheetCache
+from storage import SheetsStorage, SQLiteStorage, KEY_COLUMNS
+from worker_sync import SheetMirror
+from write_coordinator import WriteCoordinator
+
+
+class FlakyWorksheet(FakeWorksheet):
+    """The next append_rows lands but its response is lost when fail is set."""
+
+    fail = False
+
+    def append_rows(self, rows, **kwargs):
+        super().append_rows(rows, **kwargs)
+        if self.fail:
+            self.fail = False
+            raise ConnectionError("lost")
+
+
+def visit(pass_id, name="Ravi"):
+    return ["16-10-2026", "10:00 AM", "9876543210", name, "", "", "", "", "", "", "", "", "", str(pass_id)]
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def google():
+    return FakeGoogle()
+
+
+@pytest.fixture
+def db_path(tmp_path, google):
+    path = str(tmp_path / "gatepass.db")
+    SQLiteStorage(path, track_changes=True).import_from(SheetsStorage(google.client(), sheet_id="fake"))
+    return path
+
+
+def worker(db_path):
+    """What one gunicorn worker holds: its own connection and Visitors cache following the shared log."""
+    storage = SQLiteStorage(db_path, track_changes=True)
+    cache = SheetCache("Visitors")
+    cache.bind(storage.table("Visitors"), feed=storage)
+    return storage, cache
+
+
+def test_two_workers_see_the_same_rows_and_row_numbers(db_path):
+    _, a = worker(db_path)
+    _, b = worker(db_path)
+    assert a.row_count() == b.row_count() == 1   # both loaded before either writes
+
+    assert a.append_row(visit(2, "Asha")) == 2
+    assert b.append_row(visit(3, "Ravi")) == 3   # b's row goes after a's, not on top of it
+    b.update_cell(2, 11, "11:00 AM")             # check-out on the row a created
+    assert a.append_row(visit(4, "Meena")) == 4
+
+    assert a.get_rows() == b.get_rows()
+    assert [row[13] for row in a.get_rows()[1:]] == ["2", "3", "4"]
+    assert a.get_row(2)[10] == "11:00 AM"
+
+
+def test_new_leader_mirrors_each_change_once_after_the_old_one_dies(db_path, google, tmp_path):
+    journal = str(tmp_path / "sheet_journal.jsonl")
+    storage_a, cache_a = worker(db_path)
+    storage_b, cache_b = worker(db_path)
+
+    def leader(storage):
+        writer = WriteCoordinator(journal, flush_interval=60)
+        sheet = FlakyWorksheet(google, "Visitors")
+        writer.register("Visitors", sheet, key_col=KEY_COLUMNS["Visitors"])
+        return SheetMirror(storage, writer, interval=3600), writer, sheet
+
+    # Worker A leads; its flush lands but the response never comes back, then it dies
+    mirror_a, writer_a, sheet_a = leader(storage_a)
+    mirror_a.writer.open_journal()
+    cache_a.append_row(visit(2))
+    cache_b.append_row(visit(3))
+    assert mirror_a.pump() == 2
+    sheet_a.fail = True
+    with pytest.raises(ConnectionError):
+        writer_a.flush()
+    cache_b.append_row(visit(4))                 # written after the last pump; not mirrored yet
+
+    # Worker B is elected and carries on from the journal and the saved position
+    mirror_b, writer_b, _ = leader(storage_b)
+    mirror_b.start()
+    wait_for(lambda: storage_b.get_meta('mirrored', 0) == storage_b.change_position())
+    writer_b.flush()
+    assert [row[13] for row in google.sheets["Visitors"][1:]] == ["2", "3", "4"]
+    assert writer_b.pending_count() == 0
@@ -0,0 +1,178 @@
+import json
+
+import pytest
+
+from fake_google import FakeGoogle, FakeWorksheet
+from sheets_client import ResilientWorksheet, SheetsClient, UpstreamUnavailable
+from write_coordinator import WriteCoordinator
+
+
+class FlakyWorksheet(FakeWorksheet):
+    """Fails the next append_rows / batch_update: 'down' before it is applied, 'lost' after (response never arrives)."""
+
+    fail = None
+
+    def _maybe_fail(self, when):
+        if self.fail == when:
+            self.fail = None
+            raise ConnectionError(f"{when}")
+
+    def append_rows(self, rows, **kwargs):
+        self._maybe_fail('down')
+        super().append_rows(rows, **kwargs)
+        self._maybe_fail('lost')
+
+    def batch_update(self, data, **kwargs):
+        self._maybe_fail('down')
+        super().batch_update(data, **kwargs)
+        self._maybe_fail('lost')
+
+
+def visit(pass_id, name="Ravi"):
+    return ["16-10-2026", "10:00 AM", "9876543210", name, "", "", "", "", "", "", "", "", "", str(pass_id)]
+
+
+@pytest.fixture
+def google():
+    return FakeGoogle()
+
+
+def coordinator(google, journal):
+    writer = WriteCoordinator(str(journal), flush_interval=60)  # flushed by hand
+    sheets = {name: FlakyWorksheet(google, name) for name in ('Visitors', 'Bookings')}
+    writer.register('Visitors', sheets['Visitors'], key_col=14)
+    writer.register('Bookings', sheets['Bookings'])
+    return writer, sheets
+
+
+def pass_ids(google):
+    return [row[13] for row in google.sheets['Visitors'][1:]]
+
+
+def test_replay_after_partial_flush_sends_only_what_is_missing(google, tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    writer, sheets = coordinator(google, journal)
+    writer.append_row('Visitors', visit(2))
+    writer.append_row('Bookings', ["b1"])
+    writer.update_cell('Visitors', 2, 11, "11:00 AM")
+    sheets['Bookings'].fail = 'down'
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    assert pass_ids(google) == ["2"]               # the Visitors batch went through
+    assert google.sheets['Visitors'][1][10] == "11:00 AM"
+
+    # Process dies; the next one replays the journal
+    replayed, _ = coordinator(google, journal)
+    assert replayed.pending_count() == 1
+    replayed.flush()
+    assert google.sheets['Bookings'][1:] == [["b1"]]
+    assert pass_ids(google) == ["2"]
+    assert replayed.pending_count() == 0
+
+
+def test_append_whose_response_was_lost_is_not_sent_twice(google, tmp_path):
+    writer, sheets = coordinator(google, tmp_path / "journal.jsonl")
+    writer.append_row('Visitors', visit(2))
+    writer.append_row('Visitors', visit(3))
+    sheets['Visitors'].fail = 'lost'
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    writer.update_cell('Visitors', 2, 10, "https://drive/photo")  # e.g. the upload finished meanwhile
+
+    writer.flush()
+    assert pass_ids(google) == ["2", "3"]
+    assert google.sheets['Visitors'][1][9] == "https://drive/photo"
+    assert writer.stats()['deduplicated'] == 2
+
+
+def test_lost_append_through_the_retrying_client_lands_once(google, tmp_path):
+    writer = WriteCoordinator(str(tmp_path / "journal.jsonl"), flush_interval=60)
+    flaky = FlakyWorksheet(google, 'Visitors')
+    client = SheetsClient(per_minute=60000, burst=100, max_retries=3, backoff=0)
+    writer.register('Visitors', ResilientWorksheet(flaky, client), key_col=14)
+    writer.append_row('Visitors', visit(2))
+    flaky.fail = 'lost'
+    with pytest.raises(UpstreamUnavailable):
+        writer.flush()
+    writer.flush()
+    assert pass_ids(google) == ["2"]
+    assert writer.pending_count() == 0
+
+
+def test_replay_does_not_drop_a_different_row_with_the_same_pass_id(google, tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    writer, sheets = coordinator(google, journal)
+    writer.append_row('Visitors', visit(7, name="Asha"))
+    sheets['Visitors'].fail = 'down'
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    # Another serverless instance handed out the same pass ID to someone else
+    google.sheets['Visitors'].append(visit(7, name="Kumar"))
+
+    replayed, _ = coordinator(google, journal)
+    replayed.flush()
+    assert [(row[3], row[13]) for row in google.sheets['Visitors'][1:]] == [("Kumar", "7"), ("Asha", "7")]
+
+
+def test_replay_after_crash_mid_send_skips_rows_that_landed(google, tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    writer, sheets = coordinator(google, journal)
+    writer.append_row('Visitors', visit(2))
+    sheets['Visitors'].fail = 'lost'
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    with open(journal, 'a') as f:
+        f.write('{"sheet": "Visitors", "op": "app')  # torn line from the crash
+
+    replayed, _ = coordinator(google, journal)
+    replayed.flush()
+    assert pass_ids(google) == ["2"]
+    entries = [json.loads(line) for line in open(journal) if line.strip()]
+    assert all('wid' in e for e in entries if e.get('op') == 'append')
+
+
+def test_writes_made_while_the_sheet_is_down_go_out_in_order_when_it_returns(google, tmp_path):
+    writer, sheets = coordinator(google, tmp_path / "journal.jsonl")
+    writer.append_row('Visitors', visit(2))
+    writer.update_cell('Visitors', 2, 11, "11:00 AM")      # check-out aimed at the row above
+    for _ in range(3):                                   # several failed rounds
+        sheets['Visitors'].fail = 'down'
+        with pytest.raises(ConnectionError):
+            writer.flush()
+        assert writer.pending_count() == 2
+    writer.flush()
+    assert pass_ids(google) == ["2"]
+    assert google.sheets['Visitors'][1][10] == "11:00 AM"
+    assert writer.pending_count() == 0
+
+
+def test_edit_follows_its_row_when_another_instance_appended_first(google, tmp_path):
+    writer, sheets = coordinator(google, tmp_path / "journal.jsonl")
+    moved = []
+    writer.register('Visitors', sheets['Visitors'], key_col=14, on_moved=lambda: moved.append(1))
+    google.sheets['Visitors'].append(visit(2, name="Alice"))   # instance A
+    writer.append_row('Visitors', visit(3, name="Bob"))         # instance B thinks Bob is row 2
+    writer.update_cell('Visitors', 2, 11, "10:00 AM", expect={14: "3", 4: "Bob"})
+    writer.flush()
+    assert [(row[3], row[10]) for row in google.sheets['Visitors'][1:]] == [("Alice", ""), ("Bob", "10:00 AM")]
+    assert writer.stats()['moved'] == 1
+    assert moved == [1]
+
+
+def test_edit_whose_row_is_gone_is_dropped_not_misapplied(google, tmp_path):
+    writer, _ = coordinator(google, tmp_path / "journal.jsonl")
+    google.sheets['Visitors'].append(visit(2, name="Alice"))
+    writer.update_cell('Visitors', 2, 11, "10:00 AM", expect={14: "9", 4: "Zed"})
+    writer.flush()
+    assert google.sheets['Visitors'][1][10] == ""
+    assert writer.pending_count() == 0
+    assert writer.stats()['dropped'] == 1
+
+
+def test_keyless_edit_is_matched_on_its_identifying_cells(google, tmp_path):
+    writer, _ = coordinator(google, tmp_path / "journal.jsonl")
+    google.sheets['Bookings'].append(["09:00", "host@x", "", "", "7000000001", "Asha", "", "Pending"])
+    google.sheets['Bookings'].append(["09:05", "host@x", "", "", "7000000002", "Ravi", "", "Pending"])
+    writer.update_cell('Bookings', 2, 8, "Arrived", expect={1: "09:05", 5: "7000000002"})
+    writer.flush()
+    assert [row[7] for row in google.sheets['Bookings'][1:]] == ["Pending", "Arrived"]
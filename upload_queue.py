@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import uuid
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Stored in the Visitors photo column until the Drive upload finishes
+PENDING_PHOTO_PREFIX = "pending-upload:"
+
+# Serverless hosts freeze background threads after the response, so upload inline there
+UPLOAD_WORKERS = int(os.getenv('PHOTO_UPLOAD_WORKERS', '0' if os.getenv('VERCEL') else '2'))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv('PHOTO_UPLOAD_MAX_ATTEMPTS', '4'))
+UPLOAD_BACKOFF_SECONDS = float(os.getenv('PHOTO_UPLOAD_BACKOFF', '2'))
+
+# With a spool, photos whose upload keeps failing (Drive or the uplink is down)
+# stay on disk and are retried this often, until they are this old.
+UPLOAD_RETRY_INTERVAL = float(os.getenv('PHOTO_RETRY_INTERVAL', '60'))
+UPLOAD_SPOOL_MAX_AGE = float(os.getenv('PHOTO_SPOOL_MAX_AGE_HOURS', '72')) * 3600
+
+# Finished jobs kept around for /api/upload_status
+MAX_FINISHED_JOBS = 500
+
+
+def is_pending_photo(value):
+    return str(value or '').startswith(PENDING_PHOTO_PREFIX)
+
+
+class UploadQueue:
+    """
+    Background pool that pushes visitor photos to Drive.
+
+    upload_fn(image_bytes, filename, folder_id) must return the file link, or
+    None / raise on failure. Failed attempts are retried with jittered
+    exponential backoff. With workers=0 jobs run inline in the caller's thread
+    (useful on serverless hosts that freeze the process after the response).
+
+    With a spool_dir every photo is written to disk before submit() returns
+    and deleted only once its callback has run, so photos taken while offline
+    survive restarts and are uploaded when Drive is reachable again.
+    """
+
+    def __init__(self, upload_fn, workers=UPLOAD_WORKERS, max_attempts=UPLOAD_MAX_ATTEMPTS, backoff=UPLOAD_BACKOFF_SECONDS,
+                 spool_dir=None):
+        self.upload_fn = upload_fn
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.spool_dir = spool_dir
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='photo-upload') if workers > 0 else None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        if spool_dir:
+            try:
+                os.makedirs(spool_dir, exist_ok=True)
+            except OSError as e:
+                print(f"⚠️ Photo spool disabled ({e})")
+                self.spool_dir = None
+
+    def new_job_id(self):
+        return uuid.uuid4().hex
+
+    def placeholder(self, job_id):
+        return f"{PENDING_PHOTO_PREFIX}{job_id}"
+
+    def submit(self, job_id, image_bytes, filename, folder_id, on_done=None, on_failed=None, meta=None, key=None):
+        """
+        Queue an upload. on_done(link) / on_failed(error) run on the worker
+        thread. meta is stored on the job and returned by status(); key
+        identifies the record the photo belongs to if the job is restored
+        from the spool after a restart.
+        """
+        job = self._new_job(job_id, filename, len(image_bytes), meta)
+        if self.spool_dir:
+            self._spool(job_id, {'id': job_id, 'filename': filename, 'folder_id': folder_id, 'key': key,
+                                 'queued_at': job['queued_at'], 'meta': meta, 'link': None}, image_bytes)
+            job['spooled'] = True
+        self._start(job, image_bytes, folder_id, on_done, on_failed)
+        return job_id
+
+    def _new_job(self, job_id, filename, size, meta):
+        job = {
+            'id': job_id,
+            'filename': filename,
+            'status': 'queued',
+            'attempts': 0,
+            'link': None,
+            'error': None,
+            'queued_at': time.time(),
+            'finished_at': None,
+            'bytes': size,
+            'spooled': False,
+        }
+        if meta: job.update(meta)
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    def _start(self, job, image_bytes, folder_id, on_done, on_failed):
+        args = (job, image_bytes, folder_id, on_done, on_failed)
+        if self._executor: self._executor.submit(self._run, *args)
+        else: self._run(*args)
+
+    def _run(self, job, image_bytes, folder_id, on_done, on_failed):
+        # Inline, a spooled photo gets one try; the request shouldn't wait out an outage
+        max_attempts = self.max_attempts if self._executor or not job['spooled'] else 1
+        attempts = 0
+        while not job['link']:
+            job['status'] = 'uploading'
+            job['attempts'] += 1
+            attempts += 1
+            try:
+                link = self.upload_fn(image_bytes, job['filename'], folder_id)
+                if not link: raise Exception("Drive returned no link")
+                job['link'] = link
+                if job['spooled']: self._spool_update(job['id'], link=link)
+            except Exception as e:
+                job['error'] = str(e)
+                if attempts >= max_attempts: break
+                job['status'] = 'retrying'
+                self.retries += 1
+                delay = self.backoff * (2 ** (attempts - 1))
+                time.sleep(delay + random.uniform(0, delay / 2))
+
+        if not job['link'] and job['spooled'] and time.time() - job['queued_at'] < UPLOAD_SPOOL_MAX_AGE:
+            # Keep the photo on disk and try again later
+            job['status'] = 'waiting'
+            self._retry_later(job, image_bytes, folder_id, on_done, on_failed)
+            return
+
+        job['status'] = 'done' if job['link'] else 'failed'
+        job['finished_at'] = time.time()
+        try:
+            if job['link']:
+                self.completed += 1
+                if on_done: on_done(job['link'])
+            else:
+                self.failed += 1
+                print(f"⚠️ Photo upload gave up after {job['attempts']} attempts: {job['error']}")
+                if on_failed: on_failed(job['error'])
+        except Exception as e:
+            print(f"⚠️ Upload callback error: {e}")
+            if job['spooled']:
+                # The link is saved in the spool; only the callback is retried
+                job['status'] = 'waiting'
+                job['finished_at'] = None
+                self._retry_later(job, image_bytes, folder_id, on_done, on_failed)
+                return
+        if job['spooled']: self._unspool(job['id'])
+        self._trim()
+
+    def _retry_later(self, job, image_bytes, folder_id, on_done, on_failed):
+        timer = threading.Timer(UPLOAD_RETRY_INTERVAL, self._start, (job, image_bytes, folder_id, on_done, on_failed))
+        timer.daemon = True
+        timer.start()
+
+    # --- SPOOL ---
+
+    def _spool_path(self, job_id, ext):
+        return os.path.join(self.spool_dir, f"{job_id}.{ext}")
+
+    def _spool(self, job_id, record, image_bytes):
+        # Photo first, then its record: a record on disk always has its photo
+        for ext, data in (('jpg', image_bytes), ('json', json.dumps(record).encode('utf-8'))):
+            with open(self._spool_path(job_id, ext), 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _spool_update(self, job_id, **changes):
+        path = self._spool_path(job_id, 'json')
+        try:
+            with open(path, encoding='utf-8') as f:
+                record = json.load(f)
+            record.update(changes)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not update spooled photo {job_id}: {e}")
+
+    def _unspool(self, job_id):
+        for ext in ('json', 'jpg'):
+            try: os.remove(self._spool_path(job_id, ext))
+            except OSError: pass
+
+    def spooled(self):
+        """Number of photos on disk that have not been handed over yet."""
+        if not self.spool_dir: return 0
+        try: return sum(1 for n in os.listdir(self.spool_dir) if n.endswith('.json'))
+        except OSError: return 0
+
+    def restore(self, on_done=None, on_failed=None):
+        """
+        Re-queue photos left in the spool by a previous process, on a
+        background thread. on_done(key, link) / on_failed(key, error) take
+        the key given to submit().
+        """
+        if not self.spool_dir: return
+
+        def run():
+            with self._lock:
+                known = set(self._jobs)
+            for name in sorted(os.listdir(self.spool_dir)):
+                if not name.endswith('.json'): continue
+                job_id = name[:-len('.json')]
+                if job_id in known: continue
+                try:
+                    with open(self._spool_path(job_id, 'json'), encoding='utf-8') as f:
+                        record = json.load(f)
+                    with open(self._spool_path(job_id, 'jpg'), 'rb') as f:
+                        image_bytes = f.read()
+                except (OSError, ValueError) as e:
+                    print(f"⚠️ Skipping spooled photo {job_id}: {e}")
+                    continue
+                job = self._new_job(job_id, record['filename'], len(image_bytes), record.get('meta'))
+                job.update(spooled=True, queued_at=record['queued_at'], link=record.get('link'))
+                key = record.get('key')
+                done = (lambda link, k=key: on_done(k, link)) if on_done else None
+                failed = (lambda err, k=key: on_failed(k, err)) if on_failed else None
+                self._start(job, image_bytes, record['folder_id'], done, failed)
+                print(f"🔁 Resuming spooled photo upload {job_id}")
+
+        threading.Thread(target=run, name='photo-spool-restore', daemon=True).start()
+
+    def _trim(self):
+        with self._lock:
+            finished = [k for k, j in self._jobs.items() if j['finished_at']]
+            for k in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[k]
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        with self._lock:
+            in_flight = sum(1 for j in self._jobs.values() if not j['finished_at'])
+        return {
+            'workers': self.workers,
+            'in_flight': in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'retries': self.retries,
+            'spooled': self.spooled(),
+        }
@@ -0,0 +1,339 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from sheet_index import normalize_mobile
+
+# Closed visits older than this many days are moved out of the live Visitors
+# sheet into the local archive (0 = never). The job runs once a day at
+# ARCHIVE_HOUR (IST), when nobody is at the gate.
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '0'))
+ARCHIVE_HOUR = int(os.getenv('ARCHIVE_HOUR', '3'))
+
+# Decoded partition columns kept in memory for repeated reports
+PARTITION_CACHE_SIZE = 32
+
+DATE_FORMAT = "%d-%m-%Y"
+
+
+def _parse_date(value):
+    try: return datetime.strptime(str(value).strip(), DATE_FORMAT).date()
+    except (ValueError, TypeError): return None
+
+
+def _trimmed(row):
+    # Archived rows come back padded to the archive's width; compare without the padding
+    row = [str(v) for v in row]
+    while row and row[-1] == "": row.pop()
+    return row
+
+
+class VisitArchive:
+    """
+    Compressed, columnar, month-partitioned store for archived Visitors rows.
+
+    Each partition (one month of visit dates) is a directory holding one
+    gzip JSON file per column, so a search reads just the mobile column and
+    a date range only opens the months it covers. A partition is never
+    modified in place: adding rows writes a new version of it, and
+    manifest.json (replaced atomically) says which version is current. The
+    replaced version is deleted on the next add, not while a report may
+    still be reading it.
+    """
+
+    def __init__(self, directory, date_col=0, mobile_col=2, key_col=13):
+        self.directory = directory
+        self.date_col = date_col
+        self.mobile_col = mobile_col
+        self.key_col = key_col
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()  # (partition dir, column) -> values
+        self.reads = 0
+        self.manifest = {'columns': [], 'partitions': {}, 'max_key': 0}
+        path = os.path.join(directory, 'manifest.json')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        self._remove_unreferenced()
+
+    # --- WRITING ---
+
+    def add(self, header, rows, replace=False):
+        """
+        Archive rows (lists of cells). Rows whose key is already archived are
+        skipped, or with replace overwrite the archived copy. Returns rows
+        added or replaced.
+        """
+        by_month = {}
+        for row in rows:
+            day = _parse_date(row[self.date_col] if len(row) > self.date_col else None)
+            if day is None: raise ValueError(f"Row without a visit date can't be archived: {row}")
+            by_month.setdefault(day.strftime('%Y-%m'), []).append(row)
+
+        with self._lock:
+            self._remove_unreferenced()  # versions replaced last time; today's readers are long done
+            manifest = json.loads(json.dumps(self.manifest))
+            columns = list(header) if len(header) >= len(manifest['columns']) else manifest['columns']
+            width = max([len(columns)] + [len(r) for r in rows])
+            columns = columns + [""] * (width - len(columns))  # cells past the header (e.g. pass IDs) are kept too
+            manifest['columns'] = columns
+            added = 0
+            for month, new_rows in sorted(by_month.items()):
+                part = manifest['partitions'].get(month)
+                old_rows = self._read_rows(part) if part else []
+                archived_keys = {str(r[self.key_col]): i for i, r in enumerate(old_rows) if len(r) > self.key_col}
+                fresh, merged, replaced = [], list(old_rows), 0
+                for r in new_rows:
+                    i = archived_keys.get(str(r[self.key_col] if len(r) > self.key_col else ''))
+                    if i is None:
+                        fresh.append(r)
+                    elif replace and _trimmed(merged[i]) != _trimmed(r):
+                        merged[i] = r
+                        replaced += 1
+                if not fresh and not replaced: continue
+                merged += fresh
+                version = (part['version'] + 1) if part else 1
+                name = f"{month}.v{version}"
+                self._write_partition(name, len(columns), merged)
+                manifest['partitions'][month] = {'dir': name, 'version': version, 'rows': len(merged)}
+                for r in fresh:
+                    try: manifest['max_key'] = max(manifest['max_key'], int(r[self.key_col]))
+                    except (ValueError, TypeError, IndexError): pass
+                added += len(fresh) + replaced
+            if not added: return 0
+            manifest['version'] = manifest.get('version', 0) + 1
+            self._write_manifest(manifest)
+            self.manifest = manifest
+            return added
+
+    def _write_partition(self, name, width, rows):
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, exist_ok=True)
+        for col in range(width):
+            values = [r[col] if len(r) > col else "" for r in rows]
+            with gzip.open(os.path.join(path, f"c{col:02d}.json.gz"), 'wt', encoding='utf-8') as f:
+                json.dump(values, f, separators=(',', ':'))
+
+    def _write_manifest(self, manifest):
+        path = os.path.join(self.directory, 'manifest.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _remove_unreferenced(self):
+        # Replaced partition versions, and any a crash left before the manifest was replaced
+        current = {p['dir'] for p in self.manifest['partitions'].values()}
+        try: names = os.listdir(self.directory)
+        except OSError: return
+        for name in names:
+            if '.v' in name and name not in current and os.path.isdir(os.path.join(self.directory, name)):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    # --- READING ---
+
+    def _column(self, part, col):
+        key = (part['dir'], col)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        path = os.path.join(self.directory, part['dir'], f"c{col:02d}.json.gz")
+        if not os.path.isdir(os.path.dirname(path)):
+            raise FileNotFoundError(f"Archive partition {part['dir']} is missing")
+        if os.path.exists(path):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                values = json.load(f)
+        else:
+            values = [""] * part['rows']  # column added to the sheet after this partition was written
+        with self._lock:
+            self.reads += 1
+            self._cache[key] = values
+            while len(self._cache) > PARTITION_CACHE_SIZE * max(1, len(self.manifest['columns'])):
+                self._cache.popitem(last=False)
+        return values
+
+    def _read_rows(self, part, indices=None):
+        columns = [self._column(part, c) for c in range(len(self.manifest['columns']))]
+        picked = range(part['rows']) if indices is None else indices
+        return [[column[i] for column in columns] for i in picked]
+
+    def rows_between(self, start_date, end_date):
+        """Archived rows dated within [start_date, end_date], oldest month first. Only those months are read."""
+        first, last = start_date.strftime('%Y-%m'), end_date.strftime('%Y-%m')
+        partitions = self.manifest['partitions']
+        for month in sorted(m for m in partitions if first <= m <= last):
+            part = partitions[month]
+            dates = self._column(part, self.date_col)
+            wanted = [i for i, value in enumerate(dates) if (d := _parse_date(value)) and start_date <= d <= end_date]
+            if wanted:
+                yield from self._read_rows(part, wanted)
+
+    def rows_for_mobile(self, mobile):
+        """Every archived visit by this mobile number, oldest first. Reads the mobile column, then only matching rows."""
+        target = normalize_mobile(mobile)
+        if not target: return []
+        found = []
+        partitions = self.manifest['partitions']
+        for month in sorted(partitions):
+            part = partitions[month]
+            wanted = [i for i, value in enumerate(self._column(part, self.mobile_col)) if normalize_mobile(value) == target]
+            if wanted: found.extend(self._read_rows(part, wanted))
+        return found
+
+    def scan(self, cols):
+        """Every archived row with only the given columns filled in (the rest ""), oldest month first."""
+        width = len(self.manifest['columns'])
+        partitions = self.manifest['partitions']
+        for month in sorted(partitions):
+            part = partitions[month]
+            columns = [(c, self._column(part, c)) for c in cols if c < width]
+            for i in range(part['rows']):
+                row = [""] * width
+                for c, values in columns: row[c] = values[i]
+                yield row
+
+    @property
+    def version(self):
+        """Changes every time rows are added."""
+        return self.manifest.get('version', 0)
+
+    def row_for_key(self, key):
+        """The archived row with this pass ID, or None. Reads the pass ID column, newest month first."""
+        partitions = self.manifest['partitions']
+        for month in sorted(partitions, reverse=True):
+            part = partitions[month]
+            keys = self._column(part, self.key_col)
+            for i, value in enumerate(keys):
+                if value == str(key): return self._read_rows(part, [i])[0]
+        return None
+
+    def count(self):
+        return sum(p['rows'] for p in self.manifest['partitions'].values())
+
+    def max_key(self):
+        return self.manifest.get('max_key', 0)
+
+    def stats(self):
+        size = 0
+        for part in self.manifest['partitions'].values():
+            path = os.path.join(self.directory, part['dir'])
+            try: size += sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            except OSError: pass
+        partitions = sorted(self.manifest['partitions'])
+        return {
+            'rows': self.count(),
+            'partitions': len(partitions),
+            'oldest': partitions[0] if partitions else None,
+            'newest': partitions[-1] if partitions else None,
+            'bytes': size,
+            'max_pass_id': self.max_key(),
+            'column_reads': self.reads,
+        }
+
+
+class ArchiveJob:
+    """
+    Moves closed visits older than after_days from the Visitors cache (and
+    Sheet) into a VisitArchive: first into the archive, then out of the
+    Sheet, so a failure in between leaves a copy in both (the archive skips
+    pass IDs it already has on the next run) rather than in neither.
+
+    Rows still using their row number as pass ID get it written into the
+    pass ID column first, since removing rows above them would change it.
+    """
+
+    def __init__(self, cache, archive, writer=None, after_days=ARCHIVE_AFTER_DAYS, hour=ARCHIVE_HOUR, tz=None,
+                 out_col=10):
+        self.cache = cache
+        self.archive = archive
+        self.writer = writer
+        self.after_days = after_days
+        self.hour = hour
+        self.tz = tz
+        self.out_col = out_col
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_run = None
+
+    def start(self):
+        """Run once a day at self.hour (no-op when archiving is off)."""
+        if self.after_days <= 0 or self._thread: return
+        self._thread = threading.Thread(target=self._loop, name='visit-archive', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            now = datetime.now(self.tz)
+            next_run = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+            if next_run <= now: next_run += timedelta(days=1)
+            time.sleep((next_run - now).total_seconds())
+            try: self.run()
+            except Exception as e: print(f"⚠️ Archiving failed: {e}")
+
+    def candidates(self, rows, today):
+        cutoff = today - timedelta(days=self.after_days)
+        date_col = self.archive.date_col
+        picked = []
+        for row_number, row in enumerate(rows[1:], start=2):
+            day = _parse_date(row[date_col] if len(row) > date_col else None)
+            closed = len(row) > self.out_col and str(row[self.out_col]).strip() != ""
+            if day and day < cutoff and closed:
+                picked.append(row_number)
+        return picked
+
+    def run(self, dry_run=False):
+        """
+        Archive now. Returns a summary dict.
+
+        The rows are copied under the cache lock and archived without it, so
+        check-ins carry on meanwhile; the lock is taken again only to remove
+        the archived rows, after re-archiving any that were edited since.
+        """
+        if self.after_days <= 0: raise RuntimeError("Archiving is off (set ARCHIVE_AFTER_DAYS)")
+        with self._lock:
+            started = time.monotonic()
+            rows = self.cache.get_rows()
+            picked = self.candidates(rows, datetime.now(self.tz).date())
+            summary = {'candidates': len(picked), 'archived': 0, 'removed': 0, 'dry_run': dry_run}
+            if dry_run or not picked:
+                return summary
+
+            key_col = self.archive.key_col
+            # Freeze row-number pass IDs before rows above them go away (appends don't move them)
+            missing = [n for n, row in enumerate(rows[1:], start=2) if len(row) <= key_col or not str(row[key_col]).strip()]
+            if missing:
+                with self.writer.deferred() if self.writer else nullcontext():  # sent in one batch below
+                    for n in missing: self.cache.update_cell(n, key_col + 1, str(n))
+                for n in missing:
+                    rows[n - 1] = rows[n - 1] + [""] * (key_col + 1 - len(rows[n - 1]))
+                    rows[n - 1][key_col] = str(n)
+                summary['pass_ids_written'] = len(missing)
+
+            archived_rows = [rows[n - 1] for n in picked]
+            summary['archived'] = self.archive.add(rows[0], archived_rows)
+            keys = {str(r[key_col]) for r in archived_rows}
+
+            with self.cache.lock:
+                # Rows are only ever removed here, so the picked ones are still where they were
+                edited = []
+                for n in picked:
+                    row = self.cache.get_row(n) or []
+                    if _trimmed(row) != _trimmed(rows[n - 1]) and len(row) > key_col and row[key_col] in keys:
+                        edited.append(row)
+                if edited:
+                    self.archive.add(rows[0], edited, replace=True)
+                    summary['re_archived'] = len(edited)
+                summary['removed'] = self.cache.delete_keyed_rows(key_col + 1, keys)
+            summary['seconds'] = round(time.monotonic() - started, 2)
+            self.last_run = dict(summary, at=datetime.now(self.tz).isoformat())
+            print(f"🗄️ Archived {summary['removed']} visits older than {self.after_days} days")
+            return summary
@@ -0,0 +1,241 @@
+import re
+import heapq
+import bisect
+from operator import itemgetter
+
+from sheet_index import SheetIndex, normalize_mobile
+
+# What a guard types is matched against these fields of every past visit.
+# A hit on a field is worth its weight times how well it matched.
+FIELD_WEIGHTS = {'mobile': 4, 'vehicle': 3, 'name': 3, 'company': 1}
+EXACT, PREFIX, FUZZY = 3, 2, 1
+
+# Words at least this long also match with one typo (name and company words
+# only; numbers, mobiles and plates are read off a screen or a plate)
+FUZZY_MIN_LENGTH = 4
+FUZZY_FIELDS = ('name:', 'company:')
+
+# A short prefix can cover thousands of terms; stop expanding after this many
+PREFIX_TERM_LIMIT = 2000
+
+_WORD = re.compile(r'[a-z0-9]+')
+_DIGITS = re.compile(r'\d+')
+
+
+def _words(value):
+    return _WORD.findall(str(value or '').lower())
+
+
+def _deletions(word):
+    """word with each one of its letters left out (a typo one edit away shares one of these)."""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class VisitorSearch(SheetIndex):
+    """
+    Prefix and typo-tolerant search over past visitors, for autocomplete.
+
+    A visitor is everyone sharing a normalized mobile number. Terms are kept
+    per field in one sorted list ('name:rajesh', 'mobile:98765...') so a
+    prefix is a binary search plus a short scan; mobiles are also indexed
+    reversed so the last few digits find a number too. Typos are caught by
+    indexing name and company words under every one-letter deletion.
+
+    The indexed cells of every row are remembered, so the periodic reload
+    only re-indexes rows whose mobile, name, company or vehicle changed.
+    """
+
+    def __init__(self, mobile_col, name_col, company_col, vehicle_col):
+        self.cols = (mobile_col, name_col, company_col, vehicle_col)
+        self._cells = itemgetter(*self.cols)
+        self._width = max(self.cols) + 1
+        self.clear()
+
+    def clear(self):
+        self._keys = []       # indexed cells of row N at [N - 2]
+        self._postings = {}   # term -> {mobile: number of rows giving the mobile that term}
+        self._terms = []      # sorted keys of _postings
+        self._fuzzy = {}      # field:deletion -> terms it came from
+        self._visits = {}     # mobile -> ascending row numbers
+        self._last = {}       # mobile -> latest row number
+        self._bulk = False
+
+    def _key(self, row):
+        if len(row) >= self._width: return self._cells(row)
+        return tuple(row[c] if len(row) > c else "" for c in self.cols)
+
+    def rebuild(self, rows):
+        keys = [self._key(row) for row in rows[1:]]
+        old = self._keys
+        changed = [i for i, key in enumerate(keys[:len(old)]) if key != old[i]]
+        if not old or len(keys) < len(old) or len(changed) > len(keys) // 4:
+            # First load, or rows were deleted: index from scratch, sorting the terms once
+            self.clear()
+            self._bulk = True
+            for i, key in enumerate(keys):
+                self._add(i + 2, key)
+            self._bulk = False
+            self._terms = sorted(self._postings)
+            self._keys = keys
+            return
+        for i in changed:
+            self._remove(i + 2, old[i])
+            self._add(i + 2, keys[i])
+        for i in range(len(old), len(keys)):
+            self._add(i + 2, keys[i])
+        self._keys = keys
+
+    def on_append(self, row_number, row):
+        key = self._key(row)
+        while len(self._keys) < row_number - 2: self._keys.append(("",) * len(self.cols))
+        if len(self._keys) == row_number - 2: self._keys.append(key)
+        else: self._keys[row_number - 2] = key
+        self._add(row_number, key)
+
+    def on_update(self, row_number, col, old_value, row):
+        if col - 1 not in self.cols or row_number - 2 >= len(self._keys): return
+        key = self._key(row)
+        self._remove(row_number, self._keys[row_number - 2])
+        self._keys[row_number - 2] = key
+        self._add(row_number, key)
+
+    # --- maintenance ---
+
+    @staticmethod
+    def _terms_of(key):
+        mobile_cell, name, company, vehicle = key
+        mobile = normalize_mobile(mobile_cell)
+        terms = {'mobile:' + mobile, 'tail:' + mobile[::-1]}
+        terms.update(['name:' + w for w in _words(name)])
+        terms.update(['company:' + w for w in _words(company)])
+        plate = ''.join(_words(vehicle))
+        if plate:
+            terms.add('vehicle:' + plate)
+            digits = _DIGITS.findall(plate)
+            if digits: terms.add('vehicle:' + digits[-1])  # guards read the number off the back
+        return mobile, terms
+
+    def _add(self, row_number, key):
+        mobile, terms = self._terms_of(key)
+        if not mobile: return
+        visits = self._visits.get(mobile)
+        if visits is None: self._visits[mobile] = [row_number]
+        elif row_number > visits[-1]: visits.append(row_number)
+        else: bisect.insort(visits, row_number)
+        if row_number > self._last.get(mobile, 0): self._last[mobile] = row_number
+        postings = self._postings
+        for term in terms:
+            people = postings.get(term)
+            if people is None:
+                postings[term] = {mobile: 1}
+                self._add_term(term)
+            else:
+                people[mobile] = people.get(mobile, 0) + 1
+
+    def _remove(self, row_number, key):
+        mobile, terms = self._terms_of(key)
+        if not mobile: return
+        visits = self._visits.get(mobile, [])
+        if row_number in visits: visits.remove(row_number)
+        if visits: self._last[mobile] = visits[-1]
+        else:
+            self._visits.pop(mobile, None)
+            self._last.pop(mobile, None)
+        for term in terms:
+            people = self._postings.get(term, {})
+            if mobile not in people: continue
+            people[mobile] -= 1
+            if people[mobile] <= 0: del people[mobile]
+            if not people:
+                del self._postings[term]
+                self._drop_term(term)
+
+    def _add_term(self, term):
+        if not self._bulk: bisect.insort(self._terms, term)
+        if term.startswith(FUZZY_FIELDS):
+            field, word = term.split(':', 1)
+            if len(word) >= FUZZY_MIN_LENGTH and word.isalpha():
+                for variant in _deletions(word):
+                    self._fuzzy.setdefault(f"{field}:{variant}", []).append(term)
+
+    def _drop_term(self, term):
+        i = bisect.bisect_left(self._terms, term)
+        if i < len(self._terms) and self._terms[i] == term: del self._terms[i]
+        if term.startswith(FUZZY_FIELDS):
+            field, word = term.split(':', 1)
+            if len(word) >= FUZZY_MIN_LENGTH and word.isalpha():
+                for variant in _deletions(word):
+                    key = f"{field}:{variant}"
+                    terms = self._fuzzy.get(key, [])
+                    if term in terms: terms.remove(term)
+                    if not terms: self._fuzzy.pop(key, None)
+
+    # --- lookup ---
+
+    def _prefixed(self, prefix):
+        i = bisect.bisect_left(self._terms, prefix)
+        end = min(len(self._terms), i + PREFIX_TERM_LIMIT)
+        while i < end and self._terms[i].startswith(prefix):
+            yield self._terms[i]
+            i += 1
+
+    def _candidates(self, word, fields):
+        """(term, score) for every term word matches in fields, best first."""
+        found = []
+        for field in fields:
+            weight = FIELD_WEIGHTS[field]
+            key = f"{field}:{word}"
+            found.append((key, weight * EXACT))
+            found.extend((term, weight * PREFIX) for term in self._prefixed(key) if term != key)
+            if field == 'mobile' and word.isdigit():
+                found.extend((term, weight * PREFIX) for term in self._prefixed('tail:' + word[::-1]))
+            if field in ('name', 'company') and len(word) >= FUZZY_MIN_LENGTH and word.isalpha():
+                typos = set()
+                for variant in _deletions(word) | {word}:
+                    typos.update(self._fuzzy.get(f"{field}:{variant}", ()))
+                    if f"{field}:{variant}" in self._postings: typos.add(f"{field}:{variant}")  # one letter too many
+                found.extend((term, weight * FUZZY) for term in typos - {key})
+        found.sort(key=lambda pair: -pair[1])
+        return found
+
+    def _match(self, word, fields, among=None):
+        """mobile -> best score of word in fields, optionally only for the mobiles in among."""
+        scores = {}
+        for term, score in self._candidates(word, fields):
+            people = self._postings.get(term)
+            if not people: continue
+            if among is not None: people = people.keys() & among
+            if not scores:
+                scores = dict.fromkeys(people, score)
+                continue
+            for mobile in people:
+                if mobile not in scores: scores[mobile] = score
+        return scores
+
+    def _top(self, scores, limit):
+        # Best score first; within a score, most recent visit first
+        ranked = []
+        for score in sorted(set(scores.values()), reverse=True):
+            tier = [m for m, s in scores.items() if s == score]
+            ranked.extend(heapq.nlargest(limit - len(ranked), tier, key=self._last.__getitem__))
+            if len(ranked) >= limit: break
+        return ranked
+
+    def search(self, query, limit=10):
+        """
+        Visitors matching every word of query, best first. Returns
+        [(mobile, score, last_row, visits)].
+        """
+        digits = normalize_mobile(query)
+        words = [digits] if digits and not re.search(r'[a-zA-Z]', str(query)) else _words(query)
+        if not words: return []
+        with self._sync():
+            scores = None
+            for word in sorted(words, key=len, reverse=True):  # longer words narrow the field sooner
+                hits = self._match(word, FIELD_WEIGHTS, among=None if scores is None else scores.keys())
+                scores = hits if scores is None else {m: scores[m] + score for m, score in hits.items()}
+            if len(words) > 1:
+                # "TN 38 AB 1234" is one plate
+                for mobile, score in self._match(''.join(words), ['vehicle']).items():
+                    scores[mobile] = max(scores.get(mobile, 0), score * len(words))
+            return [(m, scores[m], self._last[m], len(self._visits[m])) for m in self._top(scores, limit)]
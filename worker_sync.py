@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process only, nothing to coordinate
+    fcntl = None
+
+# Coordination between worker processes (gunicorn.conf.py) that share one
+# SQLite database. Every worker serves requests from its own caches, which
+# follow the database's change log; one elected worker also runs the jobs
+# there must only be one of: mirroring writes to the Google Sheet, pruning
+# the logs and picking up photos left by workers that died.
+RELAY_INTERVAL = float(os.getenv('WORKER_SYNC_INTERVAL', '0.2'))  # seconds between event log polls
+MIRROR_INTERVAL = float(os.getenv('SHEET_MIRROR_INTERVAL', '1'))  # seconds between change log reads
+CHANGE_LOG_KEEP = int(os.getenv('CHANGE_LOG_KEEP', '50000'))       # changes kept after they are mirrored
+EVENT_LOG_KEEP = 5000
+HOUSEKEEPING_SECONDS = 60
+MIRROR_BATCH = 500
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock held across processes for the duration of the block."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        if fcntl: fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try: yield
+        finally:
+            if fcntl: fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def pid_alive(pid):
+    if not fcntl: return True  # no portable check; never treat a worker as dead
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except PermissionError: return True
+    return True
+
+
+def adopt_orphan_spools(root, own_dir):
+    """
+    Move photo spools left by dead workers (photo_spool/<pid>/) or by a
+    single-process run (files directly in photo_spool/) into own_dir.
+    Returns the number of photos moved.
+    """
+    moved = 0
+    try: entries = os.listdir(root)
+    except OSError: return 0
+    for name in entries:
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            if not name.isdigit() or os.path.abspath(path) == os.path.abspath(own_dir) or pid_alive(int(name)):
+                continue
+            files = [os.path.join(path, f) for f in os.listdir(path)]
+        else:
+            files = [path]
+        for src in files:
+            if src.endswith('.tmp'): continue
+            try:
+                os.replace(src, os.path.join(own_dir, os.path.basename(src)))
+                if src.endswith('.json'): moved += 1
+            except OSError as e:
+                print(f"⚠️ Could not adopt spooled photo {src}: {e}")
+        if os.path.isdir(path):
+            try: os.rmdir(path)
+            except OSError: pass
+    return moved
+
+
+class Leadership:
+    """
+    Whichever worker holds an flock on the leader file runs the singleton
+    jobs. The kernel drops the lock when that process exits, and a worker
+    waiting on it takes over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.is_leader = False
+        self.elected_at = None
+
+    def campaign(self, on_elected):
+        def run():
+            if fcntl:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self._file = open(self.path, 'a')  # kept open for the life of the process
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)  # blocks while another worker leads
+            self.is_leader = True
+            self.elected_at = time.time()
+            print(f"👑 Worker {os.getpid()} is coordinating the other workers")
+            on_elected()
+        threading.Thread(target=run, name='leader-election', daemon=True).start()
+
+
+class SharedEvents:
+    """
+    Gate events kept in a table every worker tails, so an SSE client sees
+    events published by any worker. Ids come from the table and keep
+    increasing across restarts.
+    """
+
+    def __init__(self, storage, broker, interval=RELAY_INTERVAL):
+        self.storage = storage
+        self.broker = broker
+        self.interval = interval
+        self.relayed = 0
+        with storage.write() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS _events (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, data TEXT, at REAL)")
+            # Start from the broker's millisecond scheme so ids clients already hold stay comparable
+            if db.execute("SELECT 1 FROM sqlite_sequence WHERE name = '_events'").fetchone() is None:
+                db.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('_events', ?)", (int(time.time() * 1000),))
+            self._last = db.execute("SELECT seq FROM sqlite_sequence WHERE name = '_events'").fetchone()[0]
+
+    def start(self):
+        self.broker.attach(self.publish, self._last)
+        threading.Thread(target=self._loop, name='event-relay', daemon=True).start()
+
+    def publish(self, event_type, data):
+        with self.storage.write() as db:
+            return db.execute("INSERT INTO _events (type, data, at) VALUES (?, ?, ?)",
+                              (event_type, json.dumps(data), time.time())).lastrowid
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                rows = self.storage.read().execute(
+                    "SELECT id, type, data FROM _events WHERE id > ? ORDER BY id LIMIT 500", (self._last,)).fetchall()
+            except sqlite3.Error as e:
+                print(f"⚠️ Event relay error: {e}")
+                continue
+            for event_id, event_type, data in rows:
+                self.broker.deliver(event_id, event_type, json.loads(data))
+                self._last = event_id
+                self.relayed += 1
+
+    def prune(self, keep=EVENT_LOG_KEEP):
+        with self.storage.write() as db:
+            db.execute("DELETE FROM _events WHERE id <= (SELECT MAX(id) FROM _events) - ?", (keep,))
+
+
+class SheetMirror:
+    """
+    Sends the shared change log to the Google Sheet in order, through the
+    WriteCoordinator (which journals and batches it). How far it got is kept
+    in the database, so a newly elected worker carries on from there.
+    """
+
+    def __init__(self, storage, writer, interval=MIRROR_INTERVAL):
+        self.storage = storage
+        self.writer = writer
+        self.interval = interval
+        self.position = 0
+
+    def start(self):
+        self.writer.open_journal()  # writes the previous leader had not sent yet
+        # A crash between journalling and saving the position must not send a change twice
+        self.position = max(self.storage.get_meta('mirrored', 0), self.writer.max_ref())
+        self.storage.set_meta('mirrored', self.position)
+        self.writer.start()
+        threading.Thread(target=self._loop, name='sheet-mirror', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                sent = self.pump()
+            except Exception as e:
+                print(f"⚠️ Sheet mirror error: {e}")
+                sent = 0
+            if sent < MIRROR_BATCH: time.sleep(self.interval)
+
+    def pump(self):
+        changes = self.storage.changes_since(self.position, limit=MIRROR_BATCH) or []
+        for change_id, table, op, row_number, col, value in changes:
+            if op == 'append': self.writer.append_row(table, json.loads(value), ref=change_id)
+            else: self.writer.update_cell(table, row_number, col, value, ref=change_id)
+        if changes:
+            self.position = changes[-1][0]
+            self.storage.set_meta('mirrored', self.position)
+        return len(changes)
+
+
+class WorkerCoordinator:
+    """
+    Per-worker glue: relays events, and campaigns to be the leader that
+    mirrors to the Sheet (when writer is given) and does the housekeeping.
+    restore_uploads() re-queues this worker's photo spool after orphans from
+    dead workers have been moved into it.
+    """
+
+    def __init__(self, storage, data_dir, broker, writer=None, spool_root=None, spool_dir=None, restore_uploads=None):
+        self.storage = storage
+        self.events = SharedEvents(storage, broker)
+        self.mirror = SheetMirror(storage, writer) if writer else None
+        self.leadership = Leadership(os.path.join(data_dir, "leader.lock"))
+        self.spool_root = spool_root
+        self.spool_dir = spool_dir
+        self.restore_uploads = restore_uploads
+
+    def start(self):
+        self.events.start()
+        self.leadership.campaign(self._lead)
+
+    def _lead(self):
+        if self.mirror: self.mirror.start()
+        while True:
+            try: self.housekeeping()
+            except Exception as e: print(f"⚠️ Worker housekeeping error: {e}")
+            time.sleep(HOUSEKEEPING_SECONDS)
+
+    def housekeeping(self):
+        # Changes are kept until mirrored, and a while after for workers catching up
+        keep_until = self.storage.change_position() - CHANGE_LOG_KEEP
+        if self.mirror: keep_until = min(keep_until, self.mirror.position)
+        if keep_until > self.storage.get_meta('pruned', 0):
+            self.storage.prune_changes(keep_until)
+        self.events.prune()
+        if self.spool_root and self.spool_dir and adopt_orphan_spools(self.spool_root, self.spool_dir):
+            if self.restore_uploads: self.restore_uploads()
+
+    def stats(self):
+        return {
+            'worker': os.getpid(),
+            'leader': self.leadership.is_leader,
+            'change_position': self.storage.change_position(),
+            'mirrored_position': self.storage.get_meta('mirrored', 0),
+            'events_relayed': self.events.relayed,
+        }
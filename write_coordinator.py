@@ -0,0 +1,388 @@
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from fanout import fan_out
+
+# Seconds between background flushes. 0 writes through on every call, which is
+# what serverless hosts need (the process may be frozen right after a response).
+DEFAULT_FLUSH_INTERVAL = float(os.getenv('SHEET_FLUSH_INTERVAL', '0' if os.getenv('VERCEL') else '1'))
+
+
+class WriteCoordinator:
+    """
+    Write-behind queue for Sheets.
+
+    append_row / update_cell calls from every request are journalled to disk,
+    then sent upstream in batches: per sheet, one append_rows() for all new rows
+    followed by one batch_update() for all cell edits. Appends go first so edits
+    aimed at a just-appended row (e.g. its Drive link) land after the row exists;
+    edits keep their original order. Anything in the journal that was not
+    confirmed is replayed on the next start.
+
+    A sheet registered with key_col has idempotent appends: once a batch of
+    rows may already have reached the Sheet (a send that timed out, or a
+    replay after a crash), the key column is read back first. A row counts
+    as landed only if a Sheet row with its key also holds every cell that
+    write set (its 'wid', a fingerprint kept in the journal). A different
+    row that happens to share the key, e.g. a pass ID two serverless
+    instances both handed out, is still sent.
+
+    Cell edits address rows by number, which another instance appending
+    first can shift. An edit queued with expect (cells that identify the
+    record, e.g. its pass ID) is checked against the Sheet when it is sent
+    and moved to the row that now holds that record; the sheet's on_moved
+    callback is told so its cache can reload. An edit whose record is gone
+    is dropped rather than written to whatever row took its place.
+
+    Sheets are independent, so one flush sends every sheet's batch at the
+    same time (fanout.py). Writing through, a request can wrap its writes in
+    deferred() to have them go out together in one such flush.
+    """
+
+    def __init__(self, journal_path=None, flush_interval=DEFAULT_FLUSH_INTERVAL, defer_journal=False):
+        self.flush_interval = flush_interval
+        self.journal_path = journal_path
+        self._sheets = {}
+        self._key_cols = {}
+        self._on_moved = {}
+        self._pending = []
+        self._seq = 0
+        self._replayed_ref = 0
+        self._lock = threading.Lock()        # guards _pending / journal file
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._wakeup = threading.Event()
+        self._held = threading.local()       # deferred() depth per thread
+        self._journal = None
+        self._thread = None
+        self.flushes = 0
+        self.api_calls = 0
+        self.ops_written = 0
+        self.errors = 0
+        self.deduplicated = 0
+        self.moved = 0
+        self.dropped = 0
+        self.last_error = None
+        # With several worker processes only the elected one may own the journal
+        if not defer_journal: self.open_journal()
+
+    # --- SETUP ---
+
+    def register(self, name, ws, key_col=None, on_moved=None):
+        self._sheets[name] = ws
+        if key_col: self._key_cols[name] = key_col
+        if on_moved: self._on_moved[name] = on_moved
+
+    def open_journal(self):
+        """Replay what an earlier process left unsent, then start journalling."""
+        if not self.journal_path or self._journal: return
+        try:
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            self._replay()
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        except OSError as e:
+            print(f"⚠️ Write journal disabled ({e})")
+            self._journal = None
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path): return
+        ops, done = [], set()
+        with open(self.journal_path, encoding='utf-8') as f:
+            for line in f:
+                try: entry = json.loads(line)
+                except ValueError: continue  # torn last line after a crash
+                if 'done' in entry: done.update(entry['done'])
+                else: ops.append(entry)
+        self._pending = [op for op in ops if op['seq'] not in done]
+        self._replayed_ref = max((op.get('ref', 0) for op in ops), default=0)
+        for op in self._pending:
+            op['sent'] = True  # may have landed before the crash
+        self._seq = max((op['seq'] for op in ops), default=0)
+        # Rewrite the journal with only what is still outstanding
+        with open(self.journal_path, 'w', encoding='utf-8') as f:
+            for op in self._pending:
+                f.write(json.dumps(op) + "\n")
+        if self._pending:
+            print(f"🔁 Replaying {len(self._pending)} unflushed sheet writes from journal")
+
+    def start(self):
+        """Start the background flusher (no-op when writing through)."""
+        if self.flush_interval <= 0 or self._thread: return
+        self._thread = threading.Thread(target=self._loop, name='sheet-writer', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try: self.flush()
+            except Exception as e: print(f"⚠️ Sheet flush error: {e}")
+
+    # --- ENQUEUE ---
+
+    def append_row(self, sheet, row, ref=None):
+        """ref: optional caller id for the write (e.g. its change log id), kept in the journal."""
+        self._enqueue(self._with_ref(self._append_op(sheet, row), ref))
+
+    def append_rows(self, sheet, rows):
+        """Queue several rows at once: one journal sync, and they go up in the same append_rows() call."""
+        self._enqueue(*[self._append_op(sheet, row) for row in rows])
+
+    @staticmethod
+    def _written_cells(row):
+        # Positions an append sets; cells it leaves empty may be filled in later (out time, photo link)
+        return [i for i, v in enumerate(row) if str(v) != ""]
+
+    @staticmethod
+    def _fingerprint(row, positions):
+        cells = [(i, str(row[i]) if i < len(row) else "") for i in positions]
+        return hashlib.sha1(json.dumps(cells).encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def _append_op(cls, sheet, row):
+        row = [("" if v is None else v) for v in row]
+        return {'sheet': sheet, 'op': 'append', 'row': row, 'wid': cls._fingerprint(row, cls._written_cells(row))}
+
+    def update_cell(self, sheet, row_number, col, value, ref=None, expect=None):
+        """expect: optional {col: value} of cells (1-based) that identify the record at row_number."""
+        op = {'sheet': sheet, 'op': 'update', 'r': row_number, 'c': col, 'v': value}
+        if expect: op['x'] = [[c, "" if v is None else str(v)] for c, v in sorted(expect.items())]
+        self._enqueue(self._with_ref(op, ref))
+
+    @staticmethod
+    def _with_ref(op, ref):
+        if ref is not None: op['ref'] = ref
+        return op
+
+    def max_ref(self):
+        """Highest ref journalled so far (0 if none), including writes replayed from an earlier process."""
+        with self._lock:
+            return max([self._replayed_ref] + [op.get('ref', 0) for op in self._pending])
+
+    def _enqueue(self, *ops):
+        with self._lock:
+            for op in ops:
+                self._seq += 1
+                op['seq'] = self._seq
+            self._write_journal(*ops)
+            for op in ops:
+                op['sent'] = False
+                self._pending.append(op)
+        if not getattr(self._held, 'depth', 0):
+            self.write_through()
+
+    @contextmanager
+    def deferred(self):
+        """Hold this thread's write-through flushes until the block ends; call write_through() after it."""
+        self._held.depth = getattr(self._held, 'depth', 0) + 1
+        try: yield
+        finally: self._held.depth -= 1
+
+    @property
+    def writes_through(self):
+        return self.flush_interval <= 0
+
+    def write_through(self):
+        """With no background flusher, send what is queued now (no-op otherwise)."""
+        if not self.writes_through: return
+        # Once journalled the write is accepted; a failed send is retried on the next flush
+        try: self.flush()
+        except Exception as e: print(f"⚠️ Sheet write deferred: {e}")
+
+    def _write_journal(self, *entries):
+        # Caller must hold self._lock
+        if not self._journal: return
+        self._journal.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    # --- FLUSH ---
+
+    def pending_count(self, sheet=None):
+        with self._lock:
+            return sum(1 for op in self._pending if sheet is None or op['sheet'] == sheet)
+
+    def flush(self, sheet=None):
+        """Send queued writes upstream (all sheets, or just one). Raises if a write fails."""
+        with self._flush_lock:
+            with self._lock:
+                batch = [op for op in self._pending if sheet is None or op['sheet'] == sheet]
+            if not batch: return
+
+            by_sheet = {}
+            for op in batch:
+                by_sheet.setdefault(op['sheet'], []).append(op)
+
+            self.flushes += 1
+            failure = None
+            results = fan_out(*[(lambda name=name, ops=ops: self._try_flush_sheet(name, ops)) for name, ops in by_sheet.items()])
+            for name, error in zip(by_sheet, results):
+                if error:
+                    self.errors += 1
+                    self.last_error = f"{name}: {error}"
+                    failure = failure or error
+
+            with self._lock:
+                if not self._pending and self._journal:
+                    # Everything is upstream; start the journal afresh
+                    self._journal.truncate(0)
+            if failure: raise failure
+
+    def _try_flush_sheet(self, name, ops):
+        try: self._flush_sheet(name, ops)
+        except Exception as e: return e
+
+    def _flush_sheet(self, name, ops):
+        ws = self._sheets.get(name)
+        if ws is None: raise RuntimeError(f"Worksheet '{name}' is not connected")
+
+        appends = [op for op in ops if op['op'] == 'append']
+        updates = [op for op in ops if op['op'] == 'update']
+
+        if appends and any(op['sent'] for op in appends) and name in self._key_cols:
+            appends = self._drop_landed(name, ws, appends)
+
+        if appends:
+            for op in appends: op['sent'] = True
+            ws.append_rows([op['row'] for op in appends])
+            self._count_call()
+            self._mark_done(appends)
+
+        if updates and any(op.get('x') for op in updates):
+            updates = self._place_updates(name, ws, updates)
+
+        if updates:
+            from gspread.utils import rowcol_to_a1
+            ws.batch_update(
+                [{'range': rowcol_to_a1(op['r'], op['c']), 'values': [[op['v']]]} for op in updates],
+                value_input_option='USER_ENTERED'
+            )
+            self._count_call()
+            self._mark_done(updates)
+
+    def _drop_landed(self, name, ws, appends):
+        """Mark appends that already reached the Sheet as done; return the rest."""
+        col = self._key_cols[name]
+        rows_by_key = {}
+        for row_number, value in enumerate(ws.col_values(col), start=1):
+            if value: rows_by_key.setdefault(str(value), []).append(row_number)
+        self._count_call()
+
+        landed, fetched = [], {}
+        for op in appends:
+            if not op['sent'] or len(op['row']) < col or not op['row'][col - 1]: continue
+            for row_number in rows_by_key.get(str(op['row'][col - 1]), []):
+                # Same key: only the same write if it holds the same cells
+                if row_number not in fetched:
+                    fetched[row_number] = ws.row_values(row_number)
+                    self._count_call()
+                if self._holds(fetched[row_number], op):
+                    landed.append(op)
+                    break
+        if landed:
+            print(f"♻️ Skipping {len(landed)} '{name}' rows already in the Sheet")
+            self._mark_done(landed)
+            self.deduplicated += len(landed)
+        landed_seqs = {op['seq'] for op in landed}
+        return [op for op in appends if op['seq'] not in landed_seqs]
+
+    def _place_updates(self, name, ws, updates):
+        """Point each update queued with expect at the row holding its record; drop those whose record is gone."""
+        key_col = self._key_cols.get(name)
+        fetched, everything = {}, None
+
+        def row(row_number):
+            if row_number not in fetched:
+                fetched[row_number] = ws.row_values(row_number)
+                self._count_call()
+            return fetched[row_number]
+
+        rows_by_key = None
+        if key_col and any(dict(op.get('x', [])).get(key_col) for op in updates):
+            # One read of the key column places every keyed edit in the batch
+            rows_by_key = {}
+            for row_number, value in enumerate(ws.col_values(key_col), start=1):
+                if value: rows_by_key.setdefault(str(value), []).append(row_number)
+            self._count_call()
+
+        placed, gone, moved = [], [], 0
+        for op in updates:
+            if not op.get('x'):
+                placed.append(op)
+                continue
+            expect = {c: v for c, v in op['x']}
+            key = expect.get(key_col) if key_col else None
+            if rows_by_key is not None and key:
+                candidates = rows_by_key.get(key, [])
+                if len(candidates) > 1:  # a shared pass ID; the other cells tell the visits apart
+                    candidates = [n for n in candidates if self._matches(row(n), expect)]
+            elif self._matches(row(op['r']), expect):
+                candidates = [op['r']]
+            else:
+                if everything is None:
+                    everything = ws.get_all_values()
+                    self._count_call()
+                candidates = [n for n, r in enumerate(everything, start=1) if self._matches(r, expect)]
+            if not candidates:
+                gone.append(op)
+                continue
+            if op['r'] not in candidates:
+                op['r'] = candidates[0]
+                moved += 1
+            placed.append(op)
+
+        if gone:
+            print(f"⚠️ Dropping {len(gone)} '{name}' cell edits: their rows are no longer in the Sheet")
+            self.last_error = f"{name}: {len(gone)} cell edits lost their row"
+            self._mark_done(gone, written=False)
+        if moved:
+            print(f"🔀 {moved} '{name}' cell edits followed their rows to new positions")
+        with self._lock:
+            self.moved += moved
+            self.dropped += len(gone)
+        if (moved or gone) and name in self._on_moved:
+            self._on_moved[name]()  # the caller's row numbers are off; it should reload
+        return placed
+
+    @staticmethod
+    def _matches(sheet_row, expect):
+        return all((sheet_row[c - 1] if len(sheet_row) >= c else "") == v for c, v in expect.items())
+
+    @classmethod
+    def _holds(cls, sheet_row, op):
+        """True if sheet_row carries the cells op wrote, i.e. it is that write (its wid matches)."""
+        positions = cls._written_cells(op['row'])
+        wid = op.get('wid') or cls._fingerprint(op['row'], positions)  # journals from before wids existed
+        return cls._fingerprint(sheet_row, positions) == wid
+
+    def _count_call(self):
+        # Sheets flush concurrently
+        with self._lock:
+            self.api_calls += 1
+
+    def _mark_done(self, ops, written=True):
+        seqs = {op['seq'] for op in ops}
+        with self._lock:
+            self._write_journal({'done': sorted(seqs)})
+            self._pending = [op for op in self._pending if op['seq'] not in seqs]
+            if written: self.ops_written += len(seqs)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'flush_interval': self.flush_interval,
+            'journal': bool(self._journal),
+            'flushes': self.flushes,
+            'api_calls': self.api_calls,
+            'ops_written': self.ops_written,
+            'ops_per_call': round(self.ops_written / self.api_calls, 2) if self.api_calls else None,
+            'errors': self.errors,
+            'deduplicated': self.deduplicated,
+            'moved': self.moved,
+            'dropped': self.dropped,
+            'last_error': self.last_error,
+        }